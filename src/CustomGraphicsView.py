@@ -1,6 +1,12 @@
 from PyQt5.QtCore import Qt
 from PyQt5.QtWidgets import QGraphicsView
 
+# Largest zoom factor (screen pixels per map pixel)
+MAX_ZOOM = 32
+
+# Smallest zoom, as a fraction of the zoom that fits the whole map in the view
+MIN_ZOOM_OF_FIT = 0.5
+
 
 class CustomGraphicsView(QGraphicsView):
     def __init__(self, scene, parent_viewer):
@@ -8,34 +14,66 @@ class CustomGraphicsView(QGraphicsView):
         self.parent_viewer = parent_viewer
         self.setTransformationAnchor(QGraphicsView.AnchorUnderMouse)
         self.setResizeAnchor(QGraphicsView.AnchorUnderMouse)
-        self.setViewportUpdateMode(QGraphicsView.FullViewportUpdate)
+        # Only repaint the regions that changed, e.g. the rectangle of a repainted location
+        self.setViewportUpdateMode(QGraphicsView.MinimalViewportUpdate)
         self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOn)
         self.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOn)
         self.setDragMode(QGraphicsView.ScrollHandDrag)
         self.setMouseTracking(True)
 
+        # In brush mode, dragging with the left button paints instead of panning
+        self.brush_mode = False
+        self.is_brushing = False
+
         # Set default arrow cursor
         self.setCursor(Qt.ArrowCursor)
 
+    def set_brush_mode(self, enabled: bool):
+        """Switch between panning and painting with the left mouse button"""
+        self.brush_mode = enabled
+        self.setDragMode(QGraphicsView.NoDrag if enabled else QGraphicsView.ScrollHandDrag)
+        self.setCursor(Qt.CrossCursor if enabled else Qt.ArrowCursor)
+
+    def scene_coordinates(self, event):
+        mouse_pos = self.mapToScene(event.pos())
+        return int(mouse_pos.x()), int(mouse_pos.y())
+
     def mousePressEvent(self, event):
-        # Change to hand cursor when dragging
         if event.button() == Qt.LeftButton:
+            if self.brush_mode:
+                self.is_brushing = True
+                self.parent_viewer.begin_brush_stroke()
+                self.parent_viewer.brush_paint(*self.scene_coordinates(event))
+                return
+            # Change to hand cursor when dragging
             self.setCursor(Qt.ClosedHandCursor)
         super().mousePressEvent(event)
 
     def mouseReleaseEvent(self, event):
-        # Change back to arrow cursor when done dragging
         if event.button() == Qt.LeftButton:
+            if self.is_brushing:
+                self.is_brushing = False
+                self.parent_viewer.end_brush_stroke()
+                return
+            # Change back to arrow cursor when done dragging
             self.setCursor(Qt.ArrowCursor)
         super().mouseReleaseEvent(event)
 
     def mouseMoveEvent(self, event):
         super().mouseMoveEvent(event)
-        mouse_pos = self.mapToScene(event.pos())
-        x = int(mouse_pos.x())
-        y = int(mouse_pos.y())
-        self.parent_viewer.update_bottom_layers(x, y)
+        x, y = self.scene_coordinates(event)
+        if self.is_brushing:
+            self.parent_viewer.brush_paint(x, y)
+        self.parent_viewer.hover(x, y)
 
     def wheelEvent(self, event):
         factor = 1.1 if event.angleDelta().y() > 0 else 0.9
-        self.scale(factor, factor)
\ No newline at end of file
+
+        # Keep the zoom between showing the whole world and MAX_ZOOM
+        scene_rect = self.sceneRect()
+        viewport = self.viewport().rect()
+        fit_zoom = min(viewport.width() / max(scene_rect.width(), 1), viewport.height() / max(scene_rect.height(), 1))
+        zoom = self.transform().m11()
+        new_zoom = min(max(zoom * factor, fit_zoom * MIN_ZOOM_OF_FIT), MAX_ZOOM)
+        if new_zoom != zoom:
+            self.scale(new_zoom / zoom, new_zoom / zoom)
@@ -0,0 +1,146 @@
+"""
+Incremental export of the edited feature columns and the project state.
+
+An ExportSession owns one export folder per editor session. Every save writes
+only the feature columns changed since the previous save (and the ones not
+written to the folder yet), so the other CSVs of the folder stay valid. The
+columns are copied on the GUI thread and formatted and written by an
+ExportWriter thread, so saving doesn't block the editor.
+"""
+import os
+from datetime import datetime
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from constants import PATH_EXPORTS
+from location_table import LocationTable
+from project_format import ProjectChanges, PROJECT_FILE, write_project
+
+
+def write_file(file_path: str, content: bytes):
+    """Write a file through a temporary file, so a failed write keeps the old file."""
+    temp_path = f'{file_path}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(content)
+    os.replace(temp_path, file_path)
+
+
+class ExportWriter(QThread):
+    """Worker thread writing a snapshot of changed columns and the project state."""
+
+    # export folder, names of the written columns
+    export_finished = pyqtSignal(str, list)
+    # error message
+    export_failed = pyqtSignal(str)
+
+    def __init__(self, locations: LocationTable, export_dir: str, columns: dict, removed_columns: list,
+                 project: dict, parent=None):
+        """
+        Args:
+            locations: LocationTable the columns belong to; only its HEX colors are read
+            export_dir: Folder to write to
+            columns: Dictionary of column name -> (codes, categories) snapshot to write
+            removed_columns: Names of columns whose CSV must be removed from the folder
+            project: Keyword arguments of write_project: changes, current_map_type and loaded_maps
+            parent: Parent QObject
+        """
+        super().__init__(parent)
+        self.locations = locations
+        self.export_dir = export_dir
+        self.columns = columns
+        self.removed_columns = removed_columns
+        self.project = project
+        self.error = None
+
+    def run(self):
+        try:
+            os.makedirs(self.export_dir, exist_ok=True)
+            for column_name, (codes, categories) in self.columns.items():
+                write_file(os.path.join(self.export_dir, f'{column_name}.csv'),
+                           self.locations.format_column_csv(codes, categories))
+            for column_name in self.removed_columns:
+                file_path = os.path.join(self.export_dir, f'{column_name}.csv')
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+            write_project(os.path.join(self.export_dir, PROJECT_FILE), **self.project)
+        except Exception as e:
+            self.error = str(e)
+            self.export_failed.emit(self.error)
+            return
+        self.export_finished.emit(self.export_dir, list(self.columns))
+
+
+class ExportSession:
+    """Tracks which columns an editor session's export folder is missing or has out of date."""
+
+    def __init__(self, locations: LocationTable):
+        """
+        Args:
+            locations: LocationTable of the editor
+        """
+        self.locations = locations
+        self.export_dir = None
+        # Columns whose CSV in export_dir matches the table, unless marked dirty since
+        self.written_columns = set()
+        self.dirty_columns = set()
+        self.writer = None
+
+    def mark_dirty(self, column_names):
+        """Mark columns as changed since the last export."""
+        self.dirty_columns.update(column_names)
+
+    @property
+    def is_writing(self) -> bool:
+        return self.writer is not None and self.writer.isRunning()
+
+    @property
+    def failed(self) -> bool:
+        """Whether the last export failed, once it is done."""
+        return self.writer is not None and self.writer.isFinished() and self.writer.error is not None
+
+    def start_export(self, changes: ProjectChanges, current_map_type: str, loaded_maps: list,
+                     on_finished=None, on_failed=None, parent=None) -> ExportWriter:
+        """
+        Snapshot the columns to write and start an ExportWriter for them.
+
+        The first export of a session creates a timestamped folder in exports/,
+        later ones update it. A running export is finished first.
+
+        Args:
+            changes: Undo history written to the project file
+            current_map_type: Map on display, written to the project file
+            loaded_maps: Loaded maps, written to the project file
+            on_finished: Connected to export_finished of the writer
+            on_failed: Connected to export_failed of the writer
+            parent: Parent QObject of the writer
+
+        Returns:
+            The started ExportWriter
+        """
+        self.wait()
+        if self.writer is not None and self.writer.error is not None:
+            # Write the columns of the failed export again
+            self.mark_dirty(self.writer.columns)
+        if self.export_dir is None:
+            self.export_dir = os.path.join(PATH_EXPORTS, datetime.now().strftime('%Y%m%d_%H%M%S'))
+
+        exported = set(self.locations.exported_columns())
+        changed = (self.dirty_columns | (exported - self.written_columns)) & exported
+        columns = {column_name: self.locations.snapshot_column(column_name) for column_name in sorted(changed)}
+        removed = sorted(self.written_columns - exported)
+        self.written_columns = (self.written_columns & exported) | changed
+        self.dirty_columns = set()
+
+        project = {'changes': changes, 'current_map_type': current_map_type, 'loaded_maps': loaded_maps}
+        self.writer = ExportWriter(self.locations, self.export_dir, columns, removed, project, parent)
+        if on_finished:
+            self.writer.export_finished.connect(on_finished)
+        if on_failed:
+            self.writer.export_failed.connect(on_failed)
+        self.writer.start()
+        return self.writer
+
+    def wait(self):
+        """Block until the running export, if any, is written."""
+        if self.writer is not None:
+            self.writer.wait()
@@ -0,0 +1,69 @@
+"""
+Loading of feature layers, at startup or on demand while the editor runs.
+
+load_layer reads a layer's location mappings and feature details and builds
+its FeatureLayer and location table column without touching the editor's
+state, so LayerLoader can run it on a worker thread and hand the result back
+to the GUI thread.
+"""
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from constants import LABELS_SUITABILITY
+from feature_layers import build_feature_layer
+from file_parsers import load_province_features, location_mapping_path, feature_details_path
+from location_index import LocationIndex
+from location_mappings import load_location_mapping
+from location_table import LocationTable
+from map_utils import generate_numerical_feature_labels
+
+
+def load_layer(feature_type: str, config: dict, locations: LocationTable, location_index: LocationIndex) -> tuple:
+    """
+    Load the mappings and labels of a feature type and build its layer.
+
+    Args:
+        feature_type: The type of feature to load (climate, topography, etc.)
+        config: Entry of the feature type in feature_data.json
+        locations: LocationTable of the state regions, only read; mappings of other colors are ignored
+        location_index: LocationIndex of the map
+
+    Returns:
+        Tuple of (FeatureLayer, labels, column of feature values for the location table)
+    """
+    # The column is filled apart from the table, the caller adds it with set_column
+    column = locations.column_from_mapping(feature_type, load_location_mapping(location_mapping_path(feature_type, config)))
+
+    if not config['isNumerical']:
+        labels = load_province_features(feature_details_path(feature_type, config))
+    else:
+        labels = generate_numerical_feature_labels(LABELS_SUITABILITY)
+
+    layer = build_feature_layer(feature_type, locations, location_index, labels,
+                                config['needs_rgb_conversion'], column)
+    return layer, labels, column
+
+
+class LayerLoader(QThread):
+    """Worker thread running load_layer for one feature type."""
+
+    # feature type, FeatureLayer, labels, column of feature values
+    layer_loaded = pyqtSignal(str, object, object, object)
+    # feature type, error message
+    layer_failed = pyqtSignal(str, str)
+
+    def __init__(self, feature_type: str, config: dict, locations: LocationTable, location_index: LocationIndex,
+                 parent=None):
+        super().__init__(parent)
+        self.feature_type = feature_type
+        self.config = config
+        # Only the HEX -> row lookup of the table is read, which doesn't change after parsing
+        self.locations = locations
+        self.location_index = location_index
+
+    def run(self):
+        try:
+            layer, labels, column = load_layer(self.feature_type, self.config, self.locations, self.location_index)
+        except Exception as e:
+            self.layer_failed.emit(self.feature_type, str(e))
+            return
+        self.layer_loaded.emit(self.feature_type, layer, labels, column)
@@ -1,14 +1,12 @@
 # (arr_locations, modified_pixmap, dict_locations, location_to_v3TerrainType, location_to_koppen, koppen_details)
 import numpy as np
-from PyQt5.QtCore import QTimer, Qt
+from PyQt5.QtCore import QTimer, Qt, QRect, QRectF, QStringListModel
 from PyQt5.QtGui import QColor, QPixmap, QImage, QIntValidator, QIcon
 from PyQt5.QtWidgets import QVBoxLayout, QLabel, QHBoxLayout, QGraphicsScene, QLineEdit, QWidget, QPushButton, QApplication
 from PyQt5.QtWidgets import QFileDialog, QDialog, QComboBox, QToolBar, QMainWindow, QAction, QStatusBar, QProgressDialog
-from PyQt5.QtWidgets import QScrollArea, QFrame
-from numpy import ndarray
+from PyQt5.QtWidgets import QScrollArea, QFrame, QCompleter, QMenu
 from datetime import datetime
 import os
-import time
 import json
 import pickle
 import sys
@@ -16,15 +14,31 @@ import subprocess
 from PyQt5.QtWidgets import QSizePolicy
 
 from CustomGraphicsView import CustomGraphicsView
+from autosave import AutosaveJournal, AUTOSAVE_SYNC_INTERVAL_MS
+from edit_journal import EditJournal
+from ExportWriter import ExportSession
+from MapPixmapItem import MapPixmapItem
+from LayerLoader import LayerLoader
 from auxiliary import rgb_to_hex, hex_to_rgb, create_legend_item, convert_key_string_to_qt
-from config import UNKNOWN_REGION, active_style, inactive_style
+from config import UNKNOWN_REGION, active_style, inactive_style, unloaded_style
+from location_index import LocationIndex
+from location_search import LocationSearch
+from location_table import LocationTable
+from project_format import ProjectChanges
+from ui_utils import show_error_dialog, show_warning_dialog
 
 # Default map type is now managed by settings in editor_settings.json
 
 MAP_TYPE_BUTTON_WIDTH = 100
 
+# Locations painted by the brush are uploaded at most once per frame
+BRUSH_FLUSH_INTERVAL_MS = 16
+
+# The hovered location's info is refreshed at most once per frame
+HOVER_UPDATE_INTERVAL_MS = 16
+
 class MapEditor(QMainWindow):
-    def __init__(self, p_arr_locations: ndarray, p_feature_pixmaps: dict, p_locations: dict,
+    def __init__(self, p_location_index: LocationIndex, p_feature_layers: dict, p_locations: LocationTable,
                  p_location_to_v3TerrainType: dict, p_feature_data: dict):
         super().__init__()
         
@@ -38,11 +52,15 @@ class MapEditor(QMainWindow):
         
         self.picker_pixmap_RGB = None
         self.picker_map_type = None
-        self.original_array = p_arr_locations
-        self.feature_pixmaps = p_feature_pixmaps
+        self.location_index = p_location_index
+        self.feature_layers = p_feature_layers
         self.locations = p_locations
         self.location_to_v3TerrainType = p_location_to_v3TerrainType
         self.feature_data = p_feature_data
+        self.location_search = LocationSearch(self.location_index, self.locations)
+        # Layers being loaded in the background, and the one to show when its load finishes
+        self.layer_loaders = {}
+        self.requested_map_type = None
 
         # Try to load icon directory from settings
         self.icon_directory = os.path.join("res", "icons", "feather")
@@ -104,7 +122,8 @@ class MapEditor(QMainWindow):
         central_widget.setLayout(main_layout)
 
         # Initialize button states and legend
-        self.set_map_type('climate')  # Default to climate, but this will be overridden by main.py
+        if 'climate' in self.feature_layers:
+            self.set_map_type('climate')  # Default to climate, but this will be overridden by main.py
 
         # Add picker-related attributes
         self.is_picker_active = False
@@ -112,9 +131,33 @@ class MapEditor(QMainWindow):
             feature['isEdited'] = False
             feature['copied_value'] = None
 
-        # Add undo/redo stacks
-        self.undo_stack = []
-        self.redo_stack = []
+        # Undo/redo journal; changes of one transaction (e.g. one brush stroke) are undone together
+        # Every map type has a layer ID, so maps loaded later can be journaled too
+        self.journal = EditJournal(self.feature_data.keys())
+        self.export_session = ExportSession(self.locations)
+        # Every journal change is appended to this session's autosave file, fsynced in batches
+        self.autosave = AutosaveJournal(self.journal, self.feature_layers, self.location_index)
+        self.autosave_timer = QTimer(self)
+        self.autosave_timer.setInterval(AUTOSAVE_SYNC_INTERVAL_MS)
+        self.autosave_timer.timeout.connect(self.autosave.sync)
+        self.autosave_timer.start()
+
+        # Brush state: locations painted in the current stroke and the per-frame flush timer
+        self._brush_stroke_ids = set()
+        self._brush_last_pos = None
+        self.brush_timer = QTimer(self)
+        self.brush_timer.setSingleShot(True)
+        self.brush_timer.setInterval(BRUSH_FLUSH_INTERVAL_MS)
+        self.brush_timer.timeout.connect(self.flush_brush)
+
+        # Hover state: prebuilt info per location ID, the location on display and the pending one
+        self._hover_cache = {}
+        self._hover_location_id = None
+        self._hover_pending_id = None
+        self.hover_timer = QTimer(self)
+        self.hover_timer.setSingleShot(True)
+        self.hover_timer.setInterval(HOVER_UPDATE_INTERVAL_MS)
+        self.hover_timer.timeout.connect(self._flush_hover)
         # self.max_undo_steps = 1000000
         
         # Track last export state
@@ -150,6 +193,12 @@ class MapEditor(QMainWindow):
         
         toolbar.addSeparator()
         
+        # Add brush action
+        self.brush_action = self.create_action("Brush", "brush", "Paint locations by dragging (Ctrl+P)",
+                                               self.toggle_brush)
+        self.brush_action.setCheckable(True)
+        toolbar.addAction(self.brush_action)
+        
         # Add feature selector action
         selector_action = self.create_action("Feature Selector", "feature-selector", 
                                            "Select a feature (Ctrl+B)", self.show_feature_selector)
@@ -197,16 +246,13 @@ class MapEditor(QMainWindow):
             button.setCheckable(True)  # Make buttons checkable
             button.setProperty("feature", feature)  # Store feature name as property
             button.clicked.connect(lambda checked, f=feature: self.set_map_type(f))
-            button.setStyleSheet(inactive_style)  # Set initial style
             button.setMinimumWidth(80)  # Ensure buttons have reasonable width
-                        
-            # Disable buttons for maps that aren't loaded
-            if feature not in self.feature_pixmaps:
-                button.setEnabled(False)
-                button.setToolTip("This map was not loaded. Select it in the startup window to enable.")
-                button.setStyleSheet("background-color: #f0f0f0; color: #a0a0a0; border: 1px solid #d0d0d0;")
+            # Right click to load or unload the map
+            button.setContextMenuPolicy(Qt.CustomContextMenu)
+            button.customContextMenuRequested.connect(lambda pos, f=feature: self.show_layer_menu(f, pos))
             
             self.feature_data[feature]['button'] = button
+            self.update_layer_button(feature)
             map_type_layout.addWidget(button)
         
         # Add stretch to push buttons to the left
@@ -315,32 +361,15 @@ class MapEditor(QMainWindow):
 
     def paste_feature(self):
         """Paste the copied feature to the province under the cursor"""
-        start_time_block = time.perf_counter()
-        
-        prev_time = time.perf_counter()
         cursor_pos = self.view.mapFromGlobal(self.cursor().pos())
-        current_time = time.perf_counter()
-        print(f"Time for cursor_pos: {current_time - prev_time:.1f} s")
-        prev_time = current_time
-
         scene_pos = self.view.mapToScene(cursor_pos)
-        current_time = time.perf_counter()
-        print(f"Time for scene_pos: {current_time - prev_time:.1f} s")
-        prev_time = current_time
+        self.fill_region(int(scene_pos.x()), int(scene_pos.y()))
 
-        color_HEX = self.fill_region(int(scene_pos.x()), int(scene_pos.y()))
-        current_time = time.perf_counter()
-        print(f"Time for fill_region: {current_time - prev_time:.1f} s")
-        prev_time = current_time
+    def toggle_brush(self, checked: bool):
+        """Turn brush mode on or off; in brush mode, dragging paints the picked feature"""
+        self.brush_action.setChecked(checked)
+        self.view.set_brush_mode(checked)
 
-        if color_HEX:
-            self.locations[color_HEX][self.picker_map_type] = self.picker_key
-            current_time = time.perf_counter()
-            print(f"Time for updating locations: {current_time - prev_time:.1f} s")
-        
-        end_time_block = time.perf_counter()
-        print(f"Total time for paste operation: {end_time_block - start_time_block:.1f} s\n")
-        
     def create_legend_layout(self):
         # Create legend box with fixed height
         self.legend_layout = QHBoxLayout()
@@ -357,10 +386,13 @@ class MapEditor(QMainWindow):
         self.legend_container.setLayout(self.legend_layout)
 
     def create_bottom_GUI(self):
-        # Initialize pixmap_item with default map
-        self.pixmap_item = self.scene.addPixmap(self.feature_pixmaps['climate'])
+        # Display buffer of the active layer, rendered from the location index on map type changes
+        width, height = self.location_index.width, self.location_index.height
+        self.display_array = np.zeros((height, width), dtype=np.uint32)
+        self.display_image = QImage(self.display_array.data, width, height, width * 4, QImage.Format_RGB32)
+        self.pixmap_item = MapPixmapItem(width, height)
+        self.scene.addItem(self.pixmap_item)
         # Create feature display components
-        # self.pixmap_item = self.scene.addPixmap(self.feature_pixmaps['climate'])
         self.feature_displays = {}
         self.createFeatureDisplayComponent('location')
         for feature_type in self.feature_data:
@@ -368,10 +400,18 @@ class MapEditor(QMainWindow):
         self.current_map_type = ''
         # Add search box (hidden by default)
         self.search_box = QLineEdit()
-        self.search_box.setPlaceholderText("Search for location...")
+        self.search_box.setPlaceholderText("State, HEX or x, y...")
         self.search_box.hide()
         self.search_box.returnPressed.connect(self.on_search)
         self.search_box.setMaximumWidth(200)
+        # Dropdown of ranked results, refreshed on every keystroke
+        self.search_results = {}
+        self.search_model = QStringListModel()
+        self.search_completer = QCompleter(self.search_model, self)
+        self.search_completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        self.search_completer.activated[str].connect(self.on_search_result_selected)
+        self.search_box.setCompleter(self.search_completer)
+        self.search_box.textEdited.connect(self.update_search_results)
         bottom_layout = QHBoxLayout()
         # Create horizontal layout for location information
         hbl_location_base = QHBoxLayout()
@@ -416,69 +456,130 @@ class MapEditor(QMainWindow):
         self.feature_displays[feature_type]['lbl_pixmap'].setFixedSize(20, 20)
         self.feature_displays[feature_type]['desc_long'].setWordWrap(True)  # Enable word wrapping for long definitions
 
+    def hover(self, x, y):
+        """
+        Show the info of the location under the cursor, coalescing mouse moves.
+
+        Nothing happens while the cursor stays over the same location, and the
+        info is refreshed at most once per frame.
+        """
+        location_id = self.location_index.id_at(x, y)
+        if location_id is None or location_id == self._hover_location_id:
+            self._hover_pending_id = None
+            return
+        self._hover_pending_id = location_id
+        if not self.hover_timer.isActive():
+            self.hover_timer.start()
+
+    def _flush_hover(self):
+        if self._hover_pending_id is not None:
+            self._show_location_info(self._hover_pending_id)
+            self._hover_pending_id = None
+
     def update_bottom_layers(self, x, y):
-        if not (0 <= y < self.original_array.shape[0] and 0 <= x < self.original_array.shape[1]):
+        location_id = self.location_index.id_at(x, y)
+        if location_id is None:
             return
+        self._show_location_info(location_id)
+
+    def _invalidate_hover_info(self, location_ids):
+        """Drop the prebuilt info of edited locations, refreshing the display if one is hovered"""
+        for location_id in location_ids:
+            self._hover_cache.pop(location_id, None)
+            if location_id == self._hover_location_id:
+                self._hover_location_id = None
+                self._hover_pending_id = location_id
+                if not self.hover_timer.isActive():
+                    self.hover_timer.start()
+
+    def _reset_hover_info(self):
+        """Drop all prebuilt info, e.g. when a map is loaded or unloaded, and refresh the display"""
+        self._hover_cache.clear()
+        if self._hover_location_id is not None:
+            self._invalidate_hover_info([self._hover_location_id])
+
+    def _build_hover_info(self, location_id: int) -> dict:
+        """
+        Build the texts and swatch colors shown at the bottom for a location.
 
-        self.original_color_RGB = tuple(self.original_array[y, x])
-        self.original_color_HEX = rgb_to_hex(*self.original_color_RGB)
+        Returns:
+            Dictionary with the location's HEX, RGB, state name, V3 climate and, per
+            feature type, a (swatch QColor or None, short text, long text) tuple.
+            'features' is None for locations outside every state, whose feature
+            labels are left as they are.
+        """
+        color_HEX = self.location_index.id_to_hex[location_id]
+        info = {
+            'hex': color_HEX,
+            'rgb': self.location_index.rgb_for_id(location_id),
+            'region_name': UNKNOWN_REGION,
+            'climate_V3': '',
+            'features': None
+        }
+        location_data = self.locations.get(color_HEX)
+        if location_data is None:
+            return info
+
+        info['region_name'] = location_data['name']
+        info['climate_V3'] = self.location_to_v3TerrainType[color_HEX]
+        empty = (None, '', '')
+        if location_data.get('climate', '') in ['', 'W']:
+            info['features'] = {feature_type: empty for feature_type in self.feature_displays}
+            return info
+
+        features = {}
+        for feature_type, feature in self.feature_data.items():
+            # Skip if this feature type doesn't exist for this location or isn't loaded
+            if feature_type not in location_data or feature_type not in self.feature_layers:
+                features[feature_type] = empty
+                continue
+
+            feature_key = location_data[feature_type]
+
+            # Skip if the feature key doesn't exist in labels
+            if feature_key not in feature['labels']:
+                features[feature_type] = (None, f"{feature['display_name']} - Not available", '')
+                continue
+
+            feature_current = feature['labels'][feature_key]
+            text = f"{feature['display_name']} "
+            if feature_type == 'climate':
+                text += f"({feature_key}) "
+            text += f"- {feature_current['desc_short']} "
+            features[feature_type] = (QColor(*hex_to_rgb(feature_current['color'])), text, feature_current['desc_long'])
+        info['features'] = features
+        return info
+
+    def _show_location_info(self, location_id: int):
+        """Show the (cached) info of a location at the bottom of the window"""
+        info = self._hover_cache.get(location_id)
+        if info is None:
+            info = self._hover_cache[location_id] = self._build_hover_info(location_id)
+        self._hover_location_id = location_id
+
+        self.original_color_RGB = info['rgb']
+        self.original_color_HEX = info['hex']
 
         # Update region color square
         loc = self.feature_displays['location']
         loc['pixmap'].fill(QColor(*self.original_color_RGB))
         loc['lbl_pixmap'].setPixmap(loc['pixmap'])
-
-        # Update text labels
         loc['desc_short'].setText(f"{self.original_color_HEX}")
-        region_name = self.locations.get(self.original_color_HEX, UNKNOWN_REGION)
-        climate_V3 = ''
-        if region_name != UNKNOWN_REGION:
-            region_name = region_name['name']
-            climate_V3 = self.location_to_v3TerrainType[self.original_color_HEX]
-
-            climate_abbreviation = self.locations[self.original_color_HEX]['climate']
-            if climate_abbreviation in ['', 'W']:
-                for featureType, feature in self.feature_displays.items():
-                    feature['lbl_pixmap'].clear()
-                    feature['desc_short'].setText('')
-                    feature['desc_long'].setText('')
-            else:
-                for feature_type, feature in self.feature_data.items():
-                    feature_display_current = self.feature_displays[feature_type]
-                    
-                    # Skip if this feature type doesn't exist for this location or isn't loaded
-                    if feature_type not in self.locations[self.original_color_HEX] or feature_type not in self.feature_pixmaps:
-                        feature_display_current['lbl_pixmap'].clear()
-                        feature_display_current['desc_short'].setText('')
-                        feature_display_current['desc_long'].setText('')
-                        continue
-                        
-                    feature_key = self.locations[self.original_color_HEX][feature_type]
-                    
-                    # Skip if the feature key doesn't exist in labels
-                    if feature_key not in self.feature_data[feature_type]['labels']:
-                        feature_display_current['lbl_pixmap'].clear()
-                        feature_display_current['desc_short'].setText(f"{feature['display_name']} - Not available")
-                        feature_display_current['desc_long'].setText('')
-                        continue
-                        
-                    feature_current = self.feature_data[feature_type]['labels'][feature_key]
-                    pixmap_current = feature_display_current['pixmap']
-                    color_HEX = feature_current['color']
-                    pixmap_current.fill(QColor(*hex_to_rgb(color_HEX)))
-                    feature_display_current['lbl_pixmap'].setPixmap(pixmap_current)
-                    desc_short = feature_current['desc_short']
-
-                    text = f"{feature['display_name']} "
-                    if feature_type == 'climate':
-                        text += f"({feature_key}) "
-                    text += f"- {desc_short} "
-                    desc_long = feature_current['desc_long']
-                    feature_display_current['desc_long'].setText(desc_long)
-                    feature_display_current['desc_short'].setText(text)
-
-        self.lbl_province_name.setText(f"State: {region_name}")
-        self.lbl_province_climate.setText(f"Climate (Victoria 3): {climate_V3}")
+
+        # Update feature labels
+        if info['features'] is not None:
+            for feature_type, (color, desc_short, desc_long) in info['features'].items():
+                feature_display_current = self.feature_displays[feature_type]
+                if color is None:
+                    feature_display_current['lbl_pixmap'].clear()
+                else:
+                    feature_display_current['pixmap'].fill(color)
+                    feature_display_current['lbl_pixmap'].setPixmap(feature_display_current['pixmap'])
+                feature_display_current['desc_short'].setText(desc_short)
+                feature_display_current['desc_long'].setText(desc_long)
+
+        self.lbl_province_name.setText(f"State: {info['region_name']}")
+        self.lbl_province_climate.setText(f"Climate (Victoria 3): {info['climate_V3']}")
 
     def set_map_type(self, active_map: str):
         """Set the active map layer and update the UI accordingly"""
@@ -486,28 +587,120 @@ class MapEditor(QMainWindow):
         if self.current_map_type == active_map:
             return
             
-        # Check if the map is available
-        if active_map not in self.feature_pixmaps:
-            print(f"Warning: Map type '{active_map}' not loaded")
+        # Load the map in the background first, it is shown once ready
+        if active_map not in self.feature_layers:
+            if active_map in self.feature_data:
+                self.requested_map_type = active_map
+                self.load_feature_layer(active_map)
+            else:
+                print(f"Warning: Map type '{active_map}' not found")
             return
+        self.requested_map_type = None
+
+        # Render the layer's palette over the location index
+        self.feature_layers[active_map].render_into(self.location_index, self.display_array)
+        self._refresh_display()
 
-        # Update the map display
-        self.pixmap_item.setPixmap(self.feature_pixmaps[active_map])
+        self.current_map_type = active_map
 
         # Update button states
-        for feature_type, feature in self.feature_data.items():
-            if 'button' in feature:
-                # Skip updating styles for disabled buttons
-                if feature_type not in self.feature_pixmaps:
-                    continue
-                
-                is_active = feature_type == active_map
-                feature['button'].setChecked(is_active)
-                feature['button'].setStyleSheet(active_style if is_active else inactive_style)
+        for feature_type in self.feature_data:
+            self.update_layer_button(feature_type)
 
-        self.current_map_type = active_map
         self.update_legend(active_map)
 
+    def update_layer_button(self, feature_type: str):
+        """Show whether a map is active, loaded, loading or not loaded on its button"""
+        button = self.feature_data[feature_type].get('button')
+        if button is None:
+            return
+        is_active = feature_type == self.current_map_type
+        button.setChecked(is_active)
+        if feature_type in self.layer_loaders:
+            button.setEnabled(False)
+            button.setToolTip("Loading this map...")
+            button.setStyleSheet(unloaded_style)
+        elif feature_type not in self.feature_layers:
+            button.setEnabled(True)
+            button.setToolTip("This map is not loaded. Click to load it.")
+            button.setStyleSheet(unloaded_style)
+        else:
+            button.setEnabled(True)
+            button.setToolTip("Right click to unload this map.")
+            button.setStyleSheet(active_style if is_active else inactive_style)
+
+    def show_layer_menu(self, feature_type: str, pos):
+        """Show the load/unload menu of a map type button"""
+        button = self.feature_data[feature_type]['button']
+        menu = QMenu(self)
+        if feature_type in self.feature_layers:
+            menu.addAction("Unload map", lambda: self.unload_feature_layer(feature_type))
+        elif feature_type not in self.layer_loaders:
+            menu.addAction("Load map", lambda: self.load_feature_layer(feature_type))
+        menu.exec_(button.mapToGlobal(pos))
+
+    def load_feature_layer(self, feature_type: str):
+        """Start loading a map on a worker thread; it becomes selectable once loaded"""
+        if feature_type in self.feature_layers or feature_type in self.layer_loaders:
+            return
+        print(f"Loading {feature_type} map in the background...")
+        loader = LayerLoader(feature_type, self.feature_data[feature_type], self.locations,
+                             self.location_index, self)
+        loader.layer_loaded.connect(self._on_layer_loaded)
+        loader.layer_failed.connect(self._on_layer_failed)
+        self.layer_loaders[feature_type] = loader
+        self.update_layer_button(feature_type)
+        loader.start()
+
+    def _on_layer_loaded(self, feature_type: str, layer, labels: dict, column):
+        """Add a map loaded by a worker, showing it if it was requested meanwhile"""
+        self.layer_loaders.pop(feature_type).wait()
+        self.locations.set_column(feature_type, column)
+        self.feature_data[feature_type]['labels'] = labels
+        self.feature_layers[feature_type] = layer
+        print(f"{feature_type} map loaded")
+
+        self._reset_hover_info()
+        self.update_layer_button(feature_type)
+        if self.requested_map_type == feature_type:
+            self.set_map_type(feature_type)
+
+    def _on_layer_failed(self, feature_type: str, message: str):
+        self.layer_loaders.pop(feature_type).wait()
+        if self.requested_map_type == feature_type:
+            self.requested_map_type = None
+        self.update_layer_button(feature_type)
+        show_error_dialog(self, "Error Loading Map",
+                          f"Failed to load the {self.feature_data[feature_type]['display_name']} map: {message}")
+
+    def unload_feature_layer(self, feature_type: str):
+        """Free a loaded map; maps on display or with changes in the undo history are kept"""
+        if feature_type not in self.feature_layers:
+            return
+        display_name = self.feature_data[feature_type]['display_name']
+        if feature_type == self.current_map_type:
+            show_warning_dialog(self, "Map In Use", f"Switch to another map before unloading the {display_name} map.")
+            return
+        if self.journal.has_layer(feature_type):
+            show_warning_dialog(self, "Map Has Changes",
+                                f"The {display_name} map has changes in the undo history and can't be unloaded.")
+            return
+
+        del self.feature_layers[feature_type]
+        self.feature_data[feature_type]['labels'] = {}
+        self.locations.drop_column(feature_type)
+        if self.picker_map_type == feature_type:
+            self.picker_map_type = None
+        print(f"{feature_type} map unloaded")
+
+        self._reset_hover_info()
+        self.update_layer_button(feature_type)
+
+    def _wait_for_layer_loaders(self):
+        """Block until the maps being loaded are done, so no worker outlives the window"""
+        for loader in list(self.layer_loaders.values()):
+            loader.wait()
+
     def update_legend(self, map_type: str):
         """Update the legend based on the current map type"""
         # Clear existing legend items
@@ -579,6 +772,8 @@ class MapEditor(QMainWindow):
                 return
             elif event.key() == Qt.Key_V:
                 self.paste_feature()
+            elif event.key() == Qt.Key_P:
+                self.toggle_brush(not self.view.brush_mode)
             elif event.key() == Qt.Key_Z:
                 self.undo_last_fill()
             elif event.key() == Qt.Key_Y:
@@ -591,353 +786,271 @@ class MapEditor(QMainWindow):
         else:
             for feature_type, feature in self.feature_data.items():
                 if 'hotkey' in feature and event.key() in feature['hotkey']:
-                    # Skip maps that aren't loaded
-                    if feature_type in self.feature_pixmaps:
-                        self.set_map_type(feature_type)
+                    # Maps that aren't loaded yet are loaded first
+                    self.set_map_type(feature_type)
                     break
         super().keyPressEvent(event)
 
+    def update_search_results(self, text: str):
+        """Refresh the search dropdown with the results for the current text"""
+        results = self.location_search.search(text)
+        self.search_results = {result['label']: result for result in results}
+        self.search_model.setStringList(list(self.search_results))
+        if results:
+            self.search_completer.complete()
+
+    def on_search_result_selected(self, label: str):
+        result = self.search_results.get(label)
+        if result:
+            self.focus_locations(result['location_ids'])
+
     def on_search(self):
-        search_text = self.search_box.text().lower()
-
-        # Search through provinces
-        for hex_color, province_data in self.locations.items():
-            if province_data['name'].lower().startswith(search_text):
-                # Find a pixel with this color
-                color_rgb = tuple(int(hex_color[i:i + 2], 16) for i in (0, 2, 4))
-                mask = (self.original_array == color_rgb).all(axis=-1)
-                if mask.any():
-                    # Get center of the province
-                    y_coords, x_coords = np.where(mask)
-                    center_x = x_coords.mean()
-                    center_y = y_coords.mean()
-
-                    # Center view on the province
-                    self.view.centerOn(center_x, center_y)
-
-                    # Hide and clear search box
-                    self.search_box.hide()
-                    self.search_box.clear()
-                    self.view.setFocus()
-                    return
+        text = self.search_box.text()
+        result = self.search_results.get(text)
+        if result is None:
+            results = self.location_search.search(text, limit=1)
+            result = results[0] if results else None
+
+        if result and self.focus_locations(result['location_ids']):
+            return
 
         # If no match found, could add some feedback here
         self.search_box.setStyleSheet("background-color: #FFE4E1;")  # Light red
         QTimer.singleShot(1000, lambda: self.search_box.setStyleSheet(""))
 
-    def fill_region(self, x: int, y: int) -> str | None:
-        start_time_fill_region = time.perf_counter()
-        prev_time = start_time_fill_region
+    def focus_locations(self, location_ids) -> bool:
+        """
+        Zoom the view to fit one or more locations and close the search box.
 
-        # Instruction 1: Initial checks
-        if not self.picker_map_type or not (0 <= y < self.original_array.shape[0] and 0 <= x < self.original_array.shape[1]):
-            current_time = time.perf_counter()
-            print(f"fill_region - Time for initial boundary/picker_map_type check: {current_time - prev_time:.1f} s")
-            return
-        current_time = time.perf_counter()
-        print(f"fill_region - Time for initial boundary/picker_map_type check: {current_time - prev_time:.1f} s")
-        prev_time = current_time
-
-        # Instruction 2: Current map type check
-        if self.current_map_type != self.picker_map_type:
-            current_time = time.perf_counter()
-            print(f"fill_region - Time for current_map_type check: {current_time - prev_time:.1f} s")
-            return
-        current_time = time.perf_counter()
-        print(f"fill_region - Time for current_map_type check: {current_time - prev_time:.1f} s")
-        prev_time = current_time
-
-        # Color to be changed
-        # Instruction 3: Get target_color_RGB
-        target_color_RGB = tuple(self.original_array[y, x])
-        current_time = time.perf_counter()
-        print(f"fill_region - Time for target_color_RGB: {current_time - prev_time:.1f} s")
-        prev_time = current_time
-
-        # Instruction 4: Get target_color_HEX
-        target_color_HEX = rgb_to_hex(*target_color_RGB)
-        current_time = time.perf_counter()
-        print(f"fill_region - Time for target_color_HEX: {current_time - prev_time:.1f} s")
-        prev_time = current_time
-        
-        # Instruction 5: Check if target_color_HEX in locations
-        if target_color_HEX not in self.locations:
-            current_time = time.perf_counter()
-            print(f"fill_region - Time for locations check: {current_time - prev_time:.1f} s")
-            return
-        current_time = time.perf_counter()
-        print(f"fill_region - Time for locations check: {current_time - prev_time:.1f} s")
-        prev_time = current_time
-
-        # Get the target feature and color
-        # Instruction 6: Get feature_key
-        feature_key = self.locations[target_color_HEX][self.picker_map_type]
-        current_time = time.perf_counter()
-        print(f"fill_region - Time for feature_key retrieval: {current_time - prev_time:.1f} s")
-        prev_time = current_time
-
-        # Instruction 7: Check if feature_key in labels
+        Returns:
+            Whether the locations were found on the map
+        """
+        rect = self.location_search.focus_rect(location_ids)
+        if rect is None:
+            return False
+        self.view.fitInView(QRectF(*rect), Qt.KeepAspectRatio)
+
+        # Hide and clear search box
+        self.search_box.hide()
+        self.search_box.clear()
+        self.view.setFocus()
+        return True
+
+    def _get_paintable_location(self, location_id: int):
+        """
+        Check whether the picked feature can be pasted on a location.
+
+        Returns:
+            Tuple of (HEX, current feature key, current code), or None if the location can't be painted
+        """
+        if not self.picker_map_type or self.current_map_type != self.picker_map_type:
+            return None
+        color_HEX = self.location_index.id_to_hex[location_id]
+        if color_HEX not in self.locations:
+            return None
+        feature_key = self.locations[color_HEX].get(self.picker_map_type)
         if feature_key not in self.feature_data[self.picker_map_type]['labels']:
-            current_time = time.perf_counter()
-            print(f"fill_region - Time for feature_key in labels check: {current_time - prev_time:.1f} s")
+            return None
+        return color_HEX, feature_key, int(self.feature_layers[self.picker_map_type].codes[location_id])
+
+    def fill_region(self, x: int, y: int) -> str | None:
+        target_location_id = self.location_index.id_at(x, y)
+        if target_location_id is None:
             return
-        current_time = time.perf_counter()
-        print(f"fill_region - Time for feature_key in labels check: {current_time - prev_time:.1f} s")
-        prev_time = current_time
-
-        # Store the change in undo stack before applying the new feature
-        # Instruction 8: Append to undo_stack
-        self.undo_stack.append({
-            'map_type': self.picker_map_type,
-            'location_HEX': target_color_HEX,
-            'old_feature': feature_key,
-            'new_feature': self.picker_key
-        })
-        current_time = time.perf_counter()
-        print(f"fill_region - Time for undo_stack.append: {current_time - prev_time:.1f} s")
-        prev_time = current_time
-
-        # Instruction 9 & 10: Manage undo_stack size
-        # if len(self.undo_stack) > self.max_undo_steps:
-        #    self.undo_stack.pop(0)
-        current_time = time.perf_counter()
-        print(f"fill_region - Time for undo_stack size management: {current_time - prev_time:.1f} s")
-        prev_time = current_time
-        
-        # Instruction 11: Clear redo_stack
-        self.redo_stack.clear()
-        current_time = time.perf_counter()
-        print(f"fill_region - Time for redo_stack.clear: {current_time - prev_time:.1f} s")
-        prev_time = current_time
-
-        # Update the location's feature
-        # Instruction 12: Update self.locations
+        paintable = self._get_paintable_location(target_location_id)
+        if not paintable:
+            return
+        target_color_HEX, feature_key, old_code = paintable
+
+        # Update the location's feature and apply the visual change
         self.locations[target_color_HEX][self.picker_map_type] = self.picker_key
-        current_time = time.perf_counter()
-        print(f"fill_region - Time for updating self.locations: {current_time - prev_time:.1f} s")
-        prev_time = current_time
-        
-        # Apply the visual change
-        # Instruction 13: Call _apply_feature_change
-        self._apply_feature_change(self.picker_map_type, target_color_RGB, self.picker_pixmap_RGB)
-        current_time = time.perf_counter()
-        print(f"fill_region - Time for _apply_feature_change: {current_time - prev_time:.1f} s")
-        prev_time = current_time
-        
-        # Update the undo counter
-        self.update_undo_counter()
+        self._apply_feature_change(self.picker_map_type, target_location_id, self.picker_key)
 
-        end_time_fill_region = time.perf_counter()
-        print(f"fill_region - Total time: {end_time_fill_region - start_time_fill_region:.4f} s\n")
+        # Record the change in the journal
+        new_code = self.feature_layers[self.picker_map_type].codes[target_location_id]
+        self.journal.record(self.picker_map_type, target_location_id, old_code, new_code)
+
+        self.update_undo_counter()
         return target_color_HEX
 
-    def _apply_feature_change(self, map_type: str, target_color_RGB: tuple, new_color_RGB: tuple) -> None:
-        """Helper method to apply visual changes to the pixmap"""
-        start_time_block = time.perf_counter()
-        prev_time = start_time_block
-        print(f"\n--- _apply_feature_change ({map_type}) ---")
+    def begin_brush_stroke(self):
+        """Start a brush stroke; its changes form one undo transaction"""
+        self._brush_stroke_ids = set()
+        self._brush_last_pos = None
+        self.journal.begin_transaction()
 
-        # Instruction 1: Set map type
+    def brush_paint(self, x: int, y: int):
+        """
+        Paint the picked feature on every location between the last brush position and (x, y).
+
+        The layer and the display buffer are updated right away; the pixmap is
+        updated by flush_brush, at most once per frame.
+        """
+        if not self.picker_map_type or self.current_map_type != self.picker_map_type:
+            return
+
+        # Sample the segment from the previous mouse position so fast strokes don't skip locations
+        x0, y0 = self._brush_last_pos or (x, y)
+        self._brush_last_pos = (x, y)
+        steps = max(abs(x - x0), abs(y - y0)) + 1
+        xs = np.rint(np.linspace(x0, x, steps)).astype(np.int64)
+        ys = np.rint(np.linspace(y0, y, steps)).astype(np.int64)
+        inside = (xs >= 0) & (xs < self.location_index.width) & (ys >= 0) & (ys < self.location_index.height)
+        location_ids = np.unique(self.location_index.label_raster[ys[inside], xs[inside]])
+
+        painted_ids, old_codes = [], []
+        for location_id in location_ids.tolist():
+            if location_id in self._brush_stroke_ids:
+                continue
+            self._brush_stroke_ids.add(location_id)
+            paintable = self._get_paintable_location(location_id)
+            if not paintable or paintable[1] == self.picker_key:
+                continue
+            color_HEX, feature_key, old_code = paintable
+
+            self.locations[color_HEX][self.picker_map_type] = self.picker_key
+            self._batch_apply_feature_change(self.picker_map_type, location_id, self.picker_key)
+            painted_ids.append(location_id)
+            old_codes.append(old_code)
+
+        if painted_ids:
+            # The stroke's changes all go to the transaction opened in begin_brush_stroke
+            new_codes = self.feature_layers[self.picker_map_type].codes[painted_ids]
+            self.journal.append(self.picker_map_type, painted_ids, old_codes, new_codes)
+            if not self.brush_timer.isActive():
+                self.brush_timer.start()
+
+    def flush_brush(self):
+        """Upload the locations painted since the last flush as one pixmap update"""
+        self._finalize_feature_changes(self.current_map_type)
+        self.update_undo_counter()
+
+    def end_brush_stroke(self):
+        """Finish a brush stroke and upload what is still pending"""
+        self.brush_timer.stop()
+        self.flush_brush()
+        self.journal.end_transaction()
+        self._brush_stroke_ids = set()
+        self._brush_last_pos = None
+
+    def _apply_feature_change(self, map_type: str, location_id: int, feature_key: str) -> None:
+        """Helper method to apply a feature change to its layer and the display"""
         self.set_map_type(map_type)
-        current_time = time.perf_counter()
-        print(f"_apply_feature_change - Time for set_map_type: {current_time - prev_time:.1f} s")
-        prev_time = current_time
-
-        # Instruction 2: Get QImage from pixmap
-        image_feature_pixmap = self.feature_pixmaps[map_type].toImage()
-        current_time = time.perf_counter()
-        print(f"_apply_feature_change - Time for toImage(): {current_time - prev_time:.1f} s")
-        prev_time = current_time
-
-        # Instruction 3: Get image dimensions
-        width, height = image_feature_pixmap.width(), image_feature_pixmap.height()
-        current_time = time.perf_counter()
-        print(f"_apply_feature_change - Time for width(), height(): {current_time - prev_time:.1f} s")
-        prev_time = current_time
-
-        # Convert QImage to numpy array for faster processing
-        # Instruction 4: Get image bits
-        ptr = image_feature_pixmap.bits()
-        current_time = time.perf_counter()
-        print(f"_apply_feature_change - Time for bits(): {current_time - prev_time:.1f} s")
-        prev_time = current_time
-
-        # Instruction 5: Set size of pointer
-        ptr.setsize(height * width * 4)  # 4 bytes per pixel (RGBA)
-        current_time = time.perf_counter()
-        print(f"_apply_feature_change - Time for setsize(): {current_time - prev_time:.1f} s")
-        prev_time = current_time
-
-        # Instruction 6: Create numpy array from buffer
-        arr_new_image = np.frombuffer(ptr, np.uint8).reshape((height, width, 4))
-        current_time = time.perf_counter()
-        print(f"_apply_feature_change - Time for np.frombuffer().reshape(): {current_time - prev_time:.1f} s")
-        prev_time = current_time
-
-        # Find matching region in original array
-        # Optimized mask creation using component-wise comparison
-        mask = ((self.original_array[:,:,0] == target_color_RGB[0]) & 
-                (self.original_array[:,:,1] == target_color_RGB[1]) & 
-                (self.original_array[:,:,2] == target_color_RGB[2]))
-        current_time = time.perf_counter()
-        print(f"_apply_feature_change - Time for mask creation: {current_time - prev_time:.1f} s")
-        prev_time = current_time
-
-        # Create color array once for faster assignment
-        color_array = np.array([new_color_RGB[2], new_color_RGB[1], new_color_RGB[0], 255], dtype=np.uint8)
-        
-        # Use broadcasting for faster assignment
-        arr_new_image[mask] = color_array
-        current_time = time.perf_counter()
-        print(f"_apply_feature_change - Time for arr_new_image[mask] assignment: {current_time - prev_time:.1f} s")
-        prev_time = current_time
-
-        # Convert back to QPixmap
-        # Instruction 9: Create QImage from numpy array
-        new_pixmap_image = QImage(arr_new_image.data, width, height, QImage.Format_ARGB32)
-        current_time = time.perf_counter()
-        print(f"_apply_feature_change - Time for QImage creation from data: {current_time - prev_time:.1f} s")
-        prev_time = current_time
-
-        # Instruction 10: Create QPixmap from QImage
-        new_pixmap = QPixmap.fromImage(new_pixmap_image)
-        current_time = time.perf_counter()
-        print(f"_apply_feature_change - Time for QPixmap.fromImage(): {current_time - prev_time:.1f} s")
-        prev_time = current_time
-        
-        # Update the display
-        # Instruction 11: Update feature_pixmaps dictionary
-        self.feature_pixmaps[map_type] = new_pixmap
-        current_time = time.perf_counter()
-        print(f"_apply_feature_change - Time for self.feature_pixmaps assignment: {current_time - prev_time:.1f} s")
-        prev_time = current_time
-
-        # Instruction 12: Set pixmap on item
-        self.pixmap_item.setPixmap(new_pixmap)
-        current_time = time.perf_counter()
-        print(f"_apply_feature_change - Time for self.pixmap_item.setPixmap(): {current_time - prev_time:.1f} s")
-        
-        end_time_block = time.perf_counter()
-        print(f"_apply_feature_change - Total time: {end_time_block - start_time_block:.4f} s\n")
+
+        # Update the location's code in the layer
+        layer = self.feature_layers[map_type]
+        layer.set_value(location_id, feature_key)
+        self._invalidate_hover_info([location_id])
+
+        # Write only the location's own pixels of the display buffer and upload their rectangle
+        self.display_array.reshape(-1)[self.location_index.pixels(location_id)] = layer.color_of(location_id)
+        self._refresh_display_locations([location_id])
+
+    def _refresh_display(self):
+        """Upload the display buffer to the map pixmap"""
+        self.pixmap_item.set_image(self.display_image)
+
+    def _refresh_display_locations(self, location_ids):
+        """Upload only the bounding rectangle of the given locations to the map pixmap"""
+        rect = self.location_index.bounding_rect(location_ids)
+        if rect:
+            self.pixmap_item.update_rect(self.display_image, QRect(*rect))
 
     def update_undo_counter(self):
         """Update the undo counter in the status bar"""
-        self.undo_counter_label.setText(f"Changes: {len(self.undo_stack)}")
+        self.undo_counter_label.setText(f"Changes: {len(self.journal)}")
+
+    def _apply_codes(self, map_type: str, location_ids: np.ndarray, codes: np.ndarray):
+        """
+        Set the layer codes of many locations at once and upload their rectangle once.
+
+        Args:
+            map_type: Map type of the layer
+            location_ids: Location IDs to change
+            codes: New layer code of every location (the last one wins for repeated locations)
+        """
+        self.set_map_type(map_type)
+        layer = self.feature_layers[map_type]
+        layer.codes[location_ids] = codes
+        self._invalidate_hover_info(np.unique(location_ids).tolist())
+
+        # Keep the location data in sync with the layer
+        unique_ids = np.unique(location_ids)
+        rows = self.locations.rows_for_location_ids(self.location_index, unique_ids)
+        keys = [layer.key_for_code(code) or '' for code in layer.codes[unique_ids].tolist()]
+        self.locations.set_values(map_type, rows, keys)
+
+        # Write the pixels of all locations in one gather
+        pixels, counts = self.location_index.pixels_of(location_ids)
+        self.display_array.reshape(-1)[pixels] = np.repeat(layer.palette[layer.codes[location_ids]], counts)
+        self._refresh_display_locations(location_ids)
 
     def undo_last_fill(self) -> None:
-        if not self.undo_stack:
+        changes = self.journal.undo()
+        if not changes:
             QApplication.beep()  # Play error sound
             return
-        change = self.undo_stack.pop()
-        self.redo_stack.append(change)
-        
-        # Get the old feature's color
-        map_type = change['map_type']
-        old_feature = change['old_feature']
-        old_color = hex_to_rgb(self.feature_data[map_type]['labels'][old_feature]['color'])
-        
-        # Update the location's feature back to the old one
-        self.locations[change['location_HEX']][map_type] = old_feature
-        
-        # Apply the visual change
-        target_color_RGB = hex_to_rgb(change['location_HEX'])
-        self._apply_feature_change(map_type, target_color_RGB, old_color)
+        for map_type, location_ids, old_codes in changes:
+            self._apply_codes(map_type, location_ids, old_codes)
         
         # Update undo counter
         self.update_undo_counter()
         
         # If we've undone all changes, reset the last export stack size
-        if not self.undo_stack and self.last_export_stack_size > 0:
+        if not len(self.journal) and self.last_export_stack_size > 0:
             self.last_export_stack_size = 0
 
     def redo_last_fill(self) -> None:
-        if not self.redo_stack:
+        changes = self.journal.redo()
+        if not changes:
             QApplication.beep()  # Play error sound
             return
-        change = self.redo_stack.pop()
-        self.undo_stack.append(change)
-        
-        # Get the new feature's color
-        map_type = change['map_type']
-        new_feature = change['new_feature']
-        new_color = hex_to_rgb(self.feature_data[map_type]['labels'][new_feature]['color'])
-        
-        # Update the location's feature to the new one
-        self.locations[change['location_HEX']][map_type] = new_feature
-        
-        # Apply the visual change
-        target_color_RGB = hex_to_rgb(change['location_HEX'])
-        self._apply_feature_change(map_type, target_color_RGB, new_color)
+        for map_type, location_ids, new_codes in changes:
+            self._apply_codes(map_type, location_ids, new_codes)
         
         # Update undo counter
         self.update_undo_counter()
 
     def export_changes(self):
-        """Export modified locations to a timestamped folder"""
+        """Export the changed feature columns and the project state to this session's export folder"""
+        self.export_session.mark_dirty(self.journal.take_touched_layers())
 
-        # Create exports directory if it doesn't exist
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        export_dir = os.path.join('exports', timestamp)
-        os.makedirs(export_dir, exist_ok=True)
+        # The undo history and current map type, to import the project later; the columns are
+        # copied here and everything is written on a worker thread
+        changes = ProjectChanges.from_journal(self.journal, self.feature_layers, self.location_index)
+        self.export_session.start_export(changes, self.current_map_type, list(self.feature_layers.keys()),
+                                         self._on_export_finished, self._on_export_failed, self)
 
-        # Get all columns except name, x, y
-        excluded_columns = {'name', 'x', 'y'}
-        columns_to_export = set()
-        
-        # Find all unique columns across all locations
-        for location_data in self.locations.values():
-            columns_to_export.update(key for key in location_data.keys() if key not in excluded_columns)
-
-        # Export each column to a separate file
-        for column in columns_to_export:
-            export_path = os.path.join(export_dir, f'{column}.csv')
-            with open(export_path, 'w', encoding='utf-8') as f:
-                for hex_code, location_data in self.locations.items():
-                    if column in location_data:
-                        f.write(f"{hex_code},{location_data[column]}\n")
-            print(f"Exported {column} data to {export_path}")
-        
-        # Save the undo stack and current map type to a file
-        project_data = {
-            'undo_stack': self.undo_stack,
-            'current_map_type': self.current_map_type,
-            'loaded_maps': list(self.feature_pixmaps.keys())
-        }
-        
-        project_file = os.path.join(export_dir, 'project_state.json')
-        with open(project_file, 'w', encoding='utf-8') as f:
-            json.dump(project_data, f, indent=2)
-        
-        print(f"Saved project state with {len(self.undo_stack)} changes to {project_file}")
+        # A save is a compaction point of the autosave file
+        self.autosave.compact()
 
         # Update last export state
-        self.last_export_stack_size = len(self.undo_stack)
+        self.last_export_stack_size = len(self.journal)
 
-        # Show success message
-        dialog = QDialog(self)
-        dialog.setWindowTitle("Export Successful")
-        layout = QVBoxLayout()
-        label = QLabel(f"Successfully exported data to {export_dir}")
-        layout.addWidget(label)
-        ok_button = QPushButton("OK")
-        ok_button.clicked.connect(dialog.accept)
-        layout.addWidget(ok_button)
-        dialog.setLayout(layout)
-        dialog.exec_()
+    def _on_export_finished(self, export_dir: str, column_names: list):
+        for column in column_names:
+            print(f"Exported {column} data to {os.path.join(export_dir, column)}.csv")
+        print(f"Saved project state to {export_dir}")
+        self.statusBar().showMessage(f"Saved changes to {export_dir}", 5000)
+
+    def _on_export_failed(self, message: str):
+        # The changes count as unsaved until an export succeeds
+        self.last_export_stack_size = 0
+        show_error_dialog(self, "Export Failed", f"Failed to export the changes: {message}")
 
     def show_feature_selector(self):
         """Shows a dialog with a dropdown of all features for the current map type"""
         if not self.current_map_type or self.current_map_type not in self.feature_data:
             return
             
-        if self.current_map_type not in self.feature_pixmaps:
+        if self.current_map_type not in self.feature_layers:
             # Show error message if the current map type isn't loaded
             QApplication.beep()
             dialog = QDialog(self)
             dialog.setWindowTitle("Map Not Loaded")
             layout = QVBoxLayout()
             message = QLabel(f"The {self.feature_data[self.current_map_type]['display_name']} map is not loaded.\n"
-                            "Please restart the application and select this map in the startup window.")
+                            "Click its map type button to load it.")
             layout.addWidget(message)
             button = QPushButton("OK")
             button.clicked.connect(dialog.accept)
@@ -1095,25 +1208,27 @@ class MapEditor(QMainWindow):
         - Ctrl+B: Open feature selector
         - Ctrl+C: Copy feature from current location
         - Ctrl+V: Paste feature at cursor location
+        - Ctrl+P: Toggle brush (drag to paint the copied feature)
         - Ctrl+Z: Undo last change
         - Ctrl+Y: Redo last change
-        - F: Open search box
+        - F: Open search box (state name, HEX color or x, y coordinates)
         - ESC: Close search/help box
         
         Map Type Selection:
-        - Key in parenthesis: Switch to map (if loaded)
+        - Key in parenthesis: Switch to map (loading it first if needed)
+        - Right click a map button: Load or unload the map
         
         Mouse:
         - Hover over location: View location info
-        - Left click + drag: Pan view
+        - Left click + drag: Pan view (paint in brush mode)
         - Mouse wheel: Zoom in/out
         
         Project Files:
         - Save (Ctrl+S): Exports all changes and saves the project state with undo history
         - Restart: Restarts the application (prompts to save if unsaved changes exist)
         
-        Note: Some maps may be disabled if they weren't selected in the startup window.
-        To enable these maps, restart the application and select them in the startup window.
+        Note: Maps that weren't selected in the startup window are grayed out.
+        They are loaded in the background when you switch to them.
         """
         
         text_label = QLabel(help_text)
@@ -1130,7 +1245,7 @@ class MapEditor(QMainWindow):
 
     def closeEvent(self, event):
         """Handle window close event and prompt for unsaved changes"""
-        if len(self.undo_stack) > self.last_export_stack_size:
+        if len(self.journal) > self.last_export_stack_size:
             # There are unsaved changes
             from PyQt5.QtWidgets import QMessageBox
             reply = QMessageBox.question(
@@ -1153,10 +1268,13 @@ class MapEditor(QMainWindow):
         else:
             # No unsaved changes, close normally
             event.accept()
+
+        if event.isAccepted():
+            self._end_session()
             
     def restart_application(self):
         """Restart the application"""
-        if len(self.undo_stack) > self.last_export_stack_size:
+        if len(self.journal) > self.last_export_stack_size:
             # There are unsaved changes
             from PyQt5.QtWidgets import QMessageBox
             reply = QMessageBox.question(
@@ -1178,51 +1296,38 @@ class MapEditor(QMainWindow):
             # No unsaved changes, restart normally
             self._perform_restart()
             
+    def _end_session(self):
+        """Wait for the worker threads and remove the autosave file, unless the last export failed"""
+        self._wait_for_layer_loaders()
+        self.export_session.wait()
+        self.autosave_timer.stop()
+        self.autosave.close(delete=not self.export_session.failed)
+
     def _perform_restart(self):
         """Perform the actual restart operation"""
+        self._end_session()
         python = sys.executable
         script_path = os.path.abspath(sys.argv[0])
         subprocess.Popen([python, script_path])
         # Exit the current process
         sys.exit(0)
 
-    def _batch_apply_feature_change(self, map_type, target_color_RGB, new_color_RGB):
+    def _batch_apply_feature_change(self, map_type, location_id, feature_key):
         """Optimized version of _apply_feature_change for batch processing"""
-        # Get the image from pixmap (only once per batch)
-        if not hasattr(self, '_batch_image') or self._batch_map_type != map_type:
-            self._batch_map_type = map_type
-            self._batch_image = self.feature_pixmaps[map_type].toImage()
-            width, height = self._batch_image.width(), self._batch_image.height()
-            ptr = self._batch_image.bits()
-            ptr.setsize(height * width * 4)  # 4 bytes per pixel (RGBA)
-            self._batch_array = np.frombuffer(ptr, np.uint8).reshape((height, width, 4))
-        
-        # Find matching region in original array
-        mask = ((self.original_array[:,:,0] == target_color_RGB[0]) & 
-                (self.original_array[:,:,1] == target_color_RGB[1]) & 
-                (self.original_array[:,:,2] == target_color_RGB[2]))
-        
-        # Create color array for assignment
-        color_array = np.array([new_color_RGB[2], new_color_RGB[1], new_color_RGB[0], 255], dtype=np.uint8)
+        layer = self.feature_layers[map_type]
+        layer.set_value(location_id, feature_key)
+        self._invalidate_hover_info([location_id])
         
-        # Update the array
-        self._batch_array[mask] = color_array
+        # Write the location's pixels if the layer is on display; the upload happens once when finalizing
+        if self.current_map_type == map_type:
+            self.display_array.reshape(-1)[self.location_index.pixels(location_id)] = layer.color_of(location_id)
+            if not hasattr(self, '_batch_location_ids'):
+                self._batch_location_ids = []
+            self._batch_location_ids.append(location_id)
 
     def _finalize_feature_changes(self, map_type):
-        """Convert the batch-processed array back to a pixmap and update the display"""
-        if hasattr(self, '_batch_array') and self._batch_map_type == map_type:
-            width, height = self._batch_image.width(), self._batch_image.height()
-            new_pixmap_image = QImage(self._batch_array.data, width, height, QImage.Format_ARGB32)
-            new_pixmap = QPixmap.fromImage(new_pixmap_image)
-            
-            # Update the pixmap
-            self.feature_pixmaps[map_type] = new_pixmap
-            
-            # Update display if this is the current map type
+        """Upload the rectangle touched by the batch if the layer is on display"""
+        if hasattr(self, '_batch_location_ids'):
             if self.current_map_type == map_type:
-                self.pixmap_item.setPixmap(new_pixmap)
-            
-            # Clear the batch processing variables
-            del self._batch_array
-            del self._batch_image
-            del self._batch_map_type
+                self._refresh_display_locations(self._batch_location_ids)
+            del self._batch_location_ids
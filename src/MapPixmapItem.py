@@ -0,0 +1,118 @@
+import math
+from collections import OrderedDict
+
+import numpy as np
+from PyQt5.QtCore import QRect, QRectF
+from PyQt5.QtGui import QPainter, QPixmap, QImage
+from PyQt5.QtWidgets import QGraphicsItem, QStyleOptionGraphicsItem
+
+# Size in pixels of one tile pixmap, at every level
+TILE_SIZE = 256
+
+# Number of downsample levels; level n shows every 2^n-th pixel
+MAX_LEVEL = 7
+
+# Number of tile pixmaps kept before the least recently used ones are dropped
+TILE_CACHE_SIZE = 512
+
+
+class MapPixmapItem(QGraphicsItem):
+    """
+    Graphics item showing the map as tiles of a mip pyramid.
+
+    The map is cut into TILE_SIZE tiles at several downsample levels. Tiles are
+    only built when they are painted, at the level that matches the zoom, and
+    are kept in an LRU cache. Repainting a rectangle drops only the tiles that
+    overlap it.
+    """
+
+    def __init__(self, width: int, height: int):
+        super().__init__()
+        self._width = width
+        self._height = height
+        self._bounding_rect = QRectF(0, 0, width, height)
+        self._image = None
+        self._pixels = None
+        self._tiles = OrderedDict()
+        # Needed to get the exposed rectangle and the zoom level in paint()
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption, True)
+
+    def boundingRect(self) -> QRectF:
+        return self._bounding_rect
+
+    def set_image(self, image: QImage):
+        """Show a new image, dropping every tile, and repaint the item."""
+        if image.format() not in (QImage.Format_RGB32, QImage.Format_ARGB32):
+            image = image.convertToFormat(QImage.Format_RGB32)
+        self._image = image
+        # Tiles are sampled straight from the image's pixels
+        ptr = image.constBits()
+        ptr.setsize(image.byteCount())
+        self._pixels = np.frombuffer(ptr, dtype=np.uint32).reshape(
+            image.height(), image.bytesPerLine() // 4)[:, :image.width()]
+        self._tiles.clear()
+        self.update()
+
+    def update_rect(self, image: QImage, rect: QRect):
+        """
+        Drop the tiles that overlap a changed rectangle of the image and repaint it.
+
+        Args:
+            image: The image passed to set_image, with the rectangle changed
+            rect: Rectangle that changed, in pixel coordinates
+        """
+        if image is not self._image:
+            self.set_image(image)
+            return
+        rect = rect.intersected(QRect(0, 0, self._width, self._height))
+        if rect.isEmpty():
+            return
+        for level in range(MAX_LEVEL + 1):
+            span = TILE_SIZE << level
+            for tile_y in range(rect.top() // span, rect.bottom() // span + 1):
+                for tile_x in range(rect.left() // span, rect.right() // span + 1):
+                    self._tiles.pop((level, tile_x, tile_y), None)
+        self.update(QRectF(rect))
+
+    def sample_pixel(self, x: int, y: int) -> int:
+        """Color of a pixel of the shown image as 0xAARRGGBB."""
+        return int(self._pixels[y, x])
+
+    def _tile(self, level: int, tile_x: int, tile_y: int) -> QPixmap:
+        """Get a tile pixmap from the cache, building it if needed."""
+        key = (level, tile_x, tile_y)
+        tile = self._tiles.get(key)
+        if tile is not None:
+            self._tiles.move_to_end(key)
+            return tile
+
+        # Nearest-neighbour downsampling is a strided view, so every tile costs the same
+        span = TILE_SIZE << level
+        step = 1 << level
+        samples = np.ascontiguousarray(
+            self._pixels[tile_y * span:(tile_y + 1) * span:step, tile_x * span:(tile_x + 1) * span:step])
+        height, width = samples.shape
+        tile = QPixmap.fromImage(QImage(samples.data, width, height, width * 4, QImage.Format_RGB32).copy())
+
+        self._tiles[key] = tile
+        if len(self._tiles) > TILE_CACHE_SIZE:
+            self._tiles.popitem(last=False)
+        return tile
+
+    def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem, widget=None):
+        if self._pixels is None:
+            return
+        # Pick the level with at most one tile pixel per screen pixel
+        level_of_detail = option.levelOfDetailFromTransform(painter.worldTransform())
+        level = 0 if level_of_detail >= 1 else min(MAX_LEVEL, int(math.floor(math.log2(1 / level_of_detail))))
+        span = TILE_SIZE << level
+
+        exposed = option.exposedRect.toAlignedRect().intersected(QRect(0, 0, self._width, self._height))
+        if exposed.isEmpty():
+            return
+        for tile_y in range(exposed.top() // span, exposed.bottom() // span + 1):
+            for tile_x in range(exposed.left() // span, exposed.right() // span + 1):
+                tile = self._tile(level, tile_x, tile_y)
+                x, y = tile_x * span, tile_y * span
+                target = QRectF(x, y, min(span, self._width - x), min(span, self._height - y))
+                painter.drawPixmap(target, tile, QRectF(tile.rect()))
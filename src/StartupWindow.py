@@ -6,6 +6,8 @@ import json
 import os
 import pickle
 
+from project_format import load_project, PROJECT_FILE, PROJECT_JSON_FILE
+
 class StartupWindow(QDialog):
     def __init__(self):
         super().__init__()
@@ -176,7 +178,7 @@ class StartupWindow(QDialog):
         # If a project was imported, we can skip validation
         if self.imported_project:
             # Check if any required map is unchecked
-            for map_type in self.imported_project["project_data"].get("loaded_maps", []):
+            for map_type in self.imported_project["project"].loaded_maps:
                 if map_type in self.checkboxes and not self.checkboxes[map_type].isChecked():
                     # Filter the undo stack to remove changes for deselected maps
                     self.filter_undo_stack_for_deselected_maps()
@@ -215,12 +217,11 @@ class StartupWindow(QDialog):
     
     def filter_undo_stack_for_deselected_maps(self):
         """Filter the undo stack to remove changes for deselected maps"""
-        if not self.imported_project or "project_data" not in self.imported_project:
+        if not self.imported_project or "project" not in self.imported_project:
             return
             
-        project_data = self.imported_project["project_data"]
-        undo_stack = project_data.get("undo_stack", [])
-        if not undo_stack:
+        project = self.imported_project["project"]
+        if not project.change_count:
             return
             
         # Get currently enabled maps
@@ -229,14 +230,9 @@ class StartupWindow(QDialog):
             if checkbox.isChecked():
                 enabled_maps.append(map_type)
         
-        # Filter the undo stack
-        new_undo_stack = [change for change in undo_stack if change["map_type"] in enabled_maps]
-        
-        # Update the project data
-        if len(new_undo_stack) != len(undo_stack):
-            project_data["undo_stack"] = new_undo_stack
-            # Also update loaded_maps to match enabled maps
-            project_data["loaded_maps"] = enabled_maps
+        # Filter the changes; the loaded maps are updated to match the enabled maps
+        if any(map_type not in enabled_maps for map_type in project.change_counts):
+            project.filter_layers(enabled_maps)
         
     def on_checkbox_toggled(self, map_type, checked):
         enabled_maps = self.settings.get("enabled_maps", [])
@@ -252,7 +248,7 @@ class StartupWindow(QDialog):
         
         # Handle deselecting a map that is in the imported project
         if not checked and self.imported_project and map_type in self.checkboxes:
-            imported_maps = self.imported_project["project_data"].get("loaded_maps", [])
+            imported_maps = self.imported_project["project"].loaded_maps
             if map_type in imported_maps:
                 # Count changes that would be lost
                 changes_to_remove = self.count_changes_for_map_type(map_type)
@@ -297,11 +293,10 @@ class StartupWindow(QDialog):
     
     def count_changes_for_map_type(self, map_type):
         """Count how many changes in the undo stack belong to a specific map type"""
-        if not self.imported_project or "project_data" not in self.imported_project:
+        if not self.imported_project or "project" not in self.imported_project:
             return 0
             
-        undo_stack = self.imported_project["project_data"].get("undo_stack", [])
-        return sum(1 for change in undo_stack if change["map_type"] == map_type)
+        return self.imported_project["project"].change_counts.get(map_type, 0)
     
     def on_default_toggled(self, map_type, checked):
         if checked:
@@ -327,7 +322,7 @@ class StartupWindow(QDialog):
         """Import a previously saved project and set it for the MapEditor"""
         # Open file dialog to select the project file
         file_path, _ = QFileDialog.getOpenFileName(
-            self, "Select Project File", "exports", "Project Files (project_state.json)"
+            self, "Select Project File", "exports", f"Project Files ({PROJECT_FILE} {PROJECT_JSON_FILE})"
         )
         
         if not file_path:
@@ -338,33 +333,26 @@ class StartupWindow(QDialog):
             self.imported_project = None
             self.project_map_changes = {}
             
-            # Load the project data
-            with open(file_path, 'r', encoding='utf-8') as f:
-                project_data = json.load(f)
+            # Read the project header; the changes of a binary project are only read when applied
+            project = load_project(file_path)
             
             # Extract the project directory (parent of the file)
             project_dir = os.path.dirname(file_path)
             
-            # Count changes per map type
-            changes_by_map = {}
-            undo_stack = project_data.get("undo_stack", [])
-            for change in undo_stack:
-                map_type = change["map_type"]
-                if map_type not in changes_by_map:
-                    changes_by_map[map_type] = 0
-                changes_by_map[map_type] += 1
+            # Changes per map type, stored in the header
+            changes_by_map = dict(project.change_counts)
             
             # Store the changes by map type
             self.project_map_changes = changes_by_map
             
             # Store the loaded project
             self.imported_project = {
-                'project_data': project_data,
+                'project': project,
                 'project_dir': project_dir
             }
             
             # Ensure required maps are enabled in settings
-            required_maps = set(project_data.get('loaded_maps', ['climate']))
+            required_maps = set(project.loaded_maps)
             
             # Update the settings to include ONLY the maps required by the project (and climate)
             self.settings["enabled_maps"] = list(required_maps)
@@ -424,7 +412,7 @@ class StartupWindow(QDialog):
             # Show success message
             project_name = os.path.basename(project_dir)
             map_count = len(required_maps)
-            change_count = len(undo_stack)
+            change_count = project.change_count
             map_text = "map" if map_count == 1 else "maps"
             change_text = "change" if change_count == 1 else "changes"
             self.dir_validation_label.setText(
@@ -0,0 +1,338 @@
+"""
+Crash-safe autosave of the edit journal.
+
+Every change of the EditJournal (appended edits, undo, redo) is appended as
+one JSON line to a per-session file in autosave/. Lines are flushed right
+away and fsynced in batches, at most every AUTOSAVE_SYNC_INTERVAL_MS. Edits
+are stored with HEX colors and label keys, so they don't depend on the
+location IDs or layer codes of one run.
+
+The file only holds a full snapshot of the journal at compaction points:
+after a recovery, after an export and when too many lines were appended
+since the last snapshot. A clean exit deletes the file; a file left behind
+by a crash is offered for recovery at the next startup and replayed.
+
+A running session holds an OS lock on a .lock file next to its autosave file.
+The OS drops the lock when the process dies, so a file whose lock can be
+taken belongs to a crashed session, and the files of running editors are
+left alone.
+"""
+import glob
+import json
+import os
+import sys
+from datetime import datetime
+
+import numpy as np
+
+from constants import PATH_AUTOSAVE
+from feature_layers import NO_CODE
+
+AUTOSAVE_VERSION = 1
+
+# Milliseconds between batched fsyncs of the appended lines
+AUTOSAVE_SYNC_INTERVAL_MS = 1000
+
+# Lines appended after the last snapshot before the file is compacted
+COMPACT_RECORD_COUNT = 2000
+
+
+def _lock_path(file_path: str) -> str:
+    return f'{os.path.splitext(file_path)[0]}.lock'
+
+
+def _try_lock(lock_file, wait: bool = False) -> bool:
+    """
+    Take an exclusive lock on an open file.
+
+    Args:
+        lock_file: File opened for writing
+        wait: Wait for another process to release the lock, instead of failing at once
+
+    Returns:
+        False if another process holds the lock
+    """
+    try:
+        if sys.platform == 'win32':
+            import msvcrt
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK if wait else msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+
+def is_session_running(file_path: str) -> bool:
+    """Whether the session that writes an autosave file still holds its lock."""
+    try:
+        with open(_lock_path(file_path), 'r+b') as lock_file:
+            # Closing the file releases the lock if it was taken
+            return not _try_lock(lock_file)
+    except FileNotFoundError:
+        return False
+
+
+def find_autosave_files(autosave_dir: str = PATH_AUTOSAVE) -> list:
+    """Get the autosave files left by crashed sessions, newest first; files of running sessions are skipped."""
+    return [file_path for file_path in sorted(glob.glob(os.path.join(autosave_dir, 'session_*.jsonl')), reverse=True)
+            if not is_session_running(file_path)]
+
+
+def remove_autosave_file(file_path: str):
+    """Remove the autosave file of a crashed session and its stale lock file."""
+    for path in (file_path, _lock_path(file_path)):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def read_autosave_file(file_path: str) -> list:
+    """
+    Read the records of an autosave file.
+
+    A line cut short by a crash ends the records; everything before it is kept.
+
+    Returns:
+        List of record dicts, in the order they were written
+    """
+    records = []
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+    return records
+
+
+def get_autosave_layers(records: list) -> list:
+    """Get the names of the layers the records edit, which must be loaded to replay them."""
+    layers = {}
+    for record in records:
+        if record['op'] == 'snapshot':
+            layers.update(dict.fromkeys(record['layers']))
+        elif record['op'] == 'append':
+            layers[record['layer']] = None
+    return list(layers)
+
+
+class AutosaveJournal:
+    """Appends the changes of an EditJournal to this session's autosave file."""
+
+    def __init__(self, journal, feature_layers: dict, location_index, autosave_dir: str = PATH_AUTOSAVE):
+        """
+        Start autosaving a journal; the file is created with the first record.
+
+        Args:
+            journal: EditJournal of the editor
+            feature_layers: Dictionary of loaded feature layers, to turn codes into keys
+            location_index: LocationIndex of the map, to turn location IDs into HEX colors
+            autosave_dir: Folder of the autosave files
+        """
+        self.journal = journal
+        self.feature_layers = feature_layers
+        self.location_index = location_index
+        self.file_path = os.path.join(autosave_dir, f"session_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{os.getpid()}.jsonl")
+        self.file = None
+        self.unsynced = False
+        self.records_since_snapshot = 0
+        self.paused = False
+        # Taken with the file and held until close, so other editors don't take the file for a crashed one
+        self.lock_file = None
+        journal.on_change = self.on_journal_change
+
+    def on_journal_change(self, op: str, payload):
+        """Write one record for a change of the journal."""
+        if self.paused:
+            return
+        if op == 'append':
+            layer_name, location_ids, old_codes, new_codes, transactions = payload
+            layer = self.feature_layers[layer_name]
+            record = {
+                'op': 'append',
+                'layer': layer_name,
+                'hex': [self.location_index.id_to_hex[location_id] for location_id in location_ids.tolist()],
+                'old': [layer.key_for_code(code) for code in old_codes.tolist()],
+                'new': [layer.key_for_code(code) for code in new_codes.tolist()],
+                # One ID for the common case of a single transaction
+                'tx': int(transactions[0]) if np.all(transactions == transactions[0]) else transactions.tolist()
+            }
+        else:
+            record = {'op': op}
+        self._write(record)
+        if self.records_since_snapshot >= COMPACT_RECORD_COUNT and self.journal.open_transaction_id is None:
+            self.compact()
+
+    def _lock(self):
+        if self.lock_file is None:
+            os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+            self.lock_file = open(_lock_path(self.file_path), 'a+b')
+            # Another editor may hold it for a moment while checking whether this session is running
+            _try_lock(self.lock_file, wait=True)
+
+    def _write(self, record: dict):
+        if self.file is None:
+            self._lock()
+            self.file = open(self.file_path, 'a', encoding='utf-8')
+        self.file.write(json.dumps(record, separators=(',', ':')) + '\n')
+        # Reach the OS right away, so a crash of the editor alone loses nothing; fsync waits for sync()
+        self.file.flush()
+        self.unsynced = True
+        self.records_since_snapshot += 1
+
+    def sync(self):
+        """Fsync the lines written since the last sync."""
+        if self.file is not None and self.unsynced:
+            os.fsync(self.file.fileno())
+            self.unsynced = False
+
+    def snapshot_record(self) -> dict:
+        """Build a record holding every row of the journal."""
+        journal = self.journal
+        rows = slice(0, journal.end)
+        layer_ids = journal.columns['layer'][rows]
+        used_ids = np.unique(layer_ids)
+        old_keys, new_keys = [], []
+        for layer_id, old_code, new_code in zip(layer_ids.tolist(), journal.columns['old_code'][rows].tolist(),
+                                                journal.columns['new_code'][rows].tolist()):
+            layer = self.feature_layers[journal.layer_names[layer_id]]
+            old_keys.append(layer.key_for_code(old_code))
+            new_keys.append(layer.key_for_code(new_code))
+        return {
+            'op': 'snapshot',
+            'version': AUTOSAVE_VERSION,
+            'layers': [journal.layer_names[layer_id] for layer_id in used_ids.tolist()],
+            'layer': np.searchsorted(used_ids, layer_ids).tolist(),
+            'hex': [self.location_index.id_to_hex[location_id]
+                    for location_id in journal.columns['location'][rows].tolist()],
+            'old': old_keys,
+            'new': new_keys,
+            'tx': journal.columns['transaction'][rows].tolist(),
+            'cursor': journal.cursor
+        }
+
+    def compact(self):
+        """Replace the file with one snapshot of the journal, written and fsynced before the swap."""
+        self._close_file()
+        self._lock()
+        temp_path = f'{self.file_path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(self.snapshot_record(), separators=(',', ':')) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.file_path)
+        self.records_since_snapshot = 0
+
+    def _close_file(self):
+        if self.file is not None:
+            self.sync()
+            self.file.close()
+            self.file = None
+
+    def close(self, delete: bool = True):
+        """
+        Stop writing to the file and release the session's lock.
+
+        Args:
+            delete: Remove the file, for a session that ends without a crash; a kept
+                file is offered for recovery at the next startup
+        """
+        self._close_file()
+        if self.lock_file is not None:
+            self.lock_file.close()
+            self.lock_file = None
+            os.remove(_lock_path(self.file_path))
+        if delete and os.path.exists(self.file_path):
+            os.remove(self.file_path)
+
+    def replay(self, map_editor, records: list) -> int:
+        """
+        Apply the records of an earlier session to the editor, then compact them into this session's file.
+
+        Args:
+            map_editor: MapEditor whose journal this AutosaveJournal writes; the edited layers must be loaded
+            records: Records read with read_autosave_file
+
+        Returns:
+            Number of changes that can be undone afterwards
+        """
+        self.paused = True
+        try:
+            previous_transaction = None
+            for record in records:
+                op = record['op']
+                if op == 'snapshot':
+                    self._replay_snapshot(map_editor, record)
+                    previous_transaction = None
+                elif op == 'append':
+                    layer = self.feature_layers[record['layer']]
+                    location_ids, old_codes, new_codes = self._to_codes(layer, record['hex'], record['old'],
+                                                                        record['new'])
+                    if isinstance(record['tx'], list):
+                        transaction_ids = np.asarray(record['tx'])[[self.location_index.id_for_hex(hex_code)
+                                                                    is not None for hex_code in record['hex']]]
+                        self.journal.append(record['layer'], location_ids, old_codes, new_codes, transaction_ids)
+                        previous_transaction = None
+                    else:
+                        # Appends of one transaction, like the parts of a brush stroke, are undone together
+                        if record['tx'] != previous_transaction:
+                            self.journal.begin_transaction()
+                        self.journal.append(record['layer'], location_ids, old_codes, new_codes)
+                        previous_transaction = record['tx']
+                    if len(location_ids):
+                        map_editor._apply_codes(record['layer'], location_ids, new_codes)
+                elif op == 'undo':
+                    map_editor.undo_last_fill()
+                    previous_transaction = None
+                elif op == 'redo':
+                    map_editor.redo_last_fill()
+                    previous_transaction = None
+            self.journal.end_transaction()
+        finally:
+            self.paused = False
+        map_editor.update_undo_counter()
+        self.compact()
+        return len(self.journal)
+
+    def _to_codes(self, layer, hexes: list, old_keys: list, new_keys: list) -> tuple:
+        """Turn HEX colors and keys into location IDs and codes, dropping colors that aren't on the map."""
+        location_ids, old_codes, new_codes = [], [], []
+        for hex_code, old_key, new_key in zip(hexes, old_keys, new_keys):
+            location_id = self.location_index.id_for_hex(hex_code)
+            if location_id is None:
+                continue
+            location_ids.append(location_id)
+            old_codes.append(NO_CODE if old_key is None else layer.code_for_key(old_key))
+            new_codes.append(NO_CODE if new_key is None else layer.code_for_key(new_key))
+        return (np.array(location_ids, dtype=np.int64), np.array(old_codes, dtype=np.int16),
+                np.array(new_codes, dtype=np.int16))
+
+    def _replay_snapshot(self, map_editor, record: dict):
+        """Restore the journal rows of a snapshot and apply the changes before its cursor."""
+        row_layers = [record['layers'][layer] for layer in record['layer']]
+        layer_names, location_ids, old_codes, new_codes, transaction_ids = [], [], [], [], []
+        cursor = 0
+        for row, (layer_name, hex_code, old_key, new_key, transaction_id) in enumerate(
+                zip(row_layers, record['hex'], record['old'], record['new'], record['tx'])):
+            location_id = self.location_index.id_for_hex(hex_code)
+            if location_id is None:
+                continue
+            layer = self.feature_layers[layer_name]
+            layer_names.append(layer_name)
+            location_ids.append(location_id)
+            old_codes.append(NO_CODE if old_key is None else layer.code_for_key(old_key))
+            new_codes.append(NO_CODE if new_key is None else layer.code_for_key(new_key))
+            transaction_ids.append(transaction_id)
+            if row < record['cursor']:
+                cursor += 1
+        self.journal.restore(layer_names, location_ids, old_codes, new_codes, transaction_ids, cursor)
+
+        # The changes that can be undone are applied in order, per layer
+        location_ids = np.array(location_ids[:cursor], dtype=np.int64)
+        new_codes = np.array(new_codes[:cursor], dtype=np.int16)
+        applied_layers = np.array(layer_names[:cursor], dtype=object)
+        for layer_name in dict.fromkeys(layer_names[:cursor]):
+            in_layer = applied_layers == layer_name
+            map_editor._apply_codes(layer_name, location_ids[in_layer], new_codes[in_layer])
@@ -5,17 +5,7 @@ from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QImage, QPixmap, QColor
 from PyQt5.QtWidgets import QHBoxLayout, QLabel, QWidget
 
-
-def hex_to_rgb(hex_color) -> tuple:
-    hex_color = hex_color.lstrip('#')
-    return tuple(int(hex_color[i:i + 2], 16) for i in (0, 2, 4))
-
-
-def rgb_to_hex(r, g, b) -> str:
-    if not all(0 <= x <= 255 for x in [r, g, b]):
-        return None  # Invalid input
-
-    return "{:02X}{:02X}{:02X}".format(r, g, b)
+from colors import hex_to_rgb, rgb_to_hex  # re-exported
 
 
 def get_array_from_image(image_path: str) -> np.ndarray:
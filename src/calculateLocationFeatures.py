@@ -1,13 +1,21 @@
 """Used when having prepared maps so that this script can find the dominant feature in each location(covers most pixels)"""
+import os
+import signal
+import struct
+import tempfile
 import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import numpy as np
 from PIL import Image
 from numpy import ndarray
 from tqdm import tqdm  # Add this import at the top of the file
 
-from main import resetTimer, get_array_from_image, FILE_IMAGE_LOCATIONS_INPUT
-from src.auxiliary import rgb_to_hex
+from auxiliary import resetTimer, get_array_from_image, rgb_to_hex
+from location_index import pack_rgb
+
+FILE_IMAGE_LOCATIONS_INPUT = 'locations.png'
 
 FEATURE_FILES = {
     'koppen': {
@@ -21,117 +29,599 @@ FEATURE_FILES = {
     },
     'low_wheat': {
         'input': 'location_low_wheat_input.png',
+        'is_gradient': True,
     },
     'low_tubers': {
         'input': 'location_low_tubers_input.png',
+        'is_gradient': True,
     }
 }
 
+# Number of image rows accumulated per step, keeps the temporaries small
+CHUNK_ROWS = 256
+
+# Number of image rows handled by one worker task in parallel mode
+BAND_ROWS = 2048
+
+# Seconds between checkpoints of the running histogram
+CHECKPOINT_INTERVAL = 60
+
+
+def accumulate_region_histogram(arr_locations: ndarray, arr_features: ndarray, is_gradient: bool = False) -> tuple:
+    """
+    Count the feature values of every region in a block of rows.
+
+    Args:
+        arr_locations: Rows of the locations image (RGB)
+        arr_features: The same rows of the feature image (RGB)
+        is_gradient: Whether the feature is averaged instead of counted
+
+    Returns:
+        For categorical features a tuple (keys, counts), where each uint64 key packs the
+        24-bit region color above the 24-bit feature color.
+        For gradient features a tuple (regions, channel_sums, counts) per packed region color.
+    """
+    regions = pack_rgb(arr_locations).ravel()
+
+    if is_gradient:
+        unique_regions, inverse = np.unique(regions, return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(unique_regions))
+        features = arr_features.reshape(-1, 3)
+        channel_sums = np.stack([np.bincount(inverse, weights=features[:, channel], minlength=len(unique_regions))
+                                 for channel in range(3)], axis=1).astype(np.int64)
+        return unique_regions, channel_sums, counts
+
+    keys = (regions.astype(np.uint64) << np.uint64(24)) | pack_rgb(arr_features).ravel().astype(np.uint64)
+    return np.unique(keys, return_counts=True)
+
+
+def merge_region_histograms(histograms: list, is_gradient: bool = False) -> tuple:
+    """
+    Merge partial histograms of several row blocks into one.
+
+    Args:
+        histograms: Results of accumulate_region_histogram
+        is_gradient: Whether the histograms are gradient sums
+
+    Returns:
+        Merged histogram in the same layout
+    """
+    if len(histograms) == 1:
+        return histograms[0]
+
+    if is_gradient:
+        regions = np.concatenate([h[0] for h in histograms])
+        unique_regions, inverse = np.unique(regions, return_inverse=True)
+        channel_sums = np.zeros((len(unique_regions), 3), dtype=np.int64)
+        np.add.at(channel_sums, inverse, np.concatenate([h[1] for h in histograms]))
+        counts = np.bincount(inverse, weights=np.concatenate([h[2] for h in histograms]),
+                             minlength=len(unique_regions)).astype(np.int64)
+        return unique_regions, channel_sums, counts
+
+    keys = np.concatenate([h[0] for h in histograms])
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    counts = np.bincount(inverse, weights=np.concatenate([h[1] for h in histograms]),
+                         minlength=len(unique_keys)).astype(np.int64)
+    return unique_keys, counts
+
+
+def find_dominant_features(histogram: tuple, is_gradient: bool = False, color_to_skip: tuple = None) -> tuple:
+    """
+    Pick the dominant feature of every region from a region histogram.
+
+    Args:
+        histogram: Result of accumulate_region_histogram / merge_region_histograms
+        is_gradient: Whether the feature is averaged instead of counted
+        color_to_skip: Feature color that only wins if a region has no other color
+
+    Returns:
+        Tuple of (regions, result_colors, values): the sorted packed region colors,
+        the RGB color of every region in the output image and its mapping value
+    """
+    if is_gradient:
+        regions, channel_sums, counts = histogram
+        # Average values for each RGB channel, truncated like astype(np.int32) on the mean
+        result_colors = (channel_sums // counts[:, None]).astype(np.int32)
+        # Single gradient value (assuming grayscale where R=G=B)
+        values = [str(v) for v in (result_colors.sum(axis=1) // 3)]
+        return regions, result_colors, values
+
+    keys, counts = histogram
+    regions = (keys >> np.uint64(24)).astype(np.uint32)
+    features = (keys & np.uint64(0xFFFFFF)).astype(np.int64)
+    # Keys are sorted, so every region's entries are contiguous
+    region_starts = np.flatnonzero(np.r_[True, regions[1:] != regions[:-1]])
+    unique_regions = regions[region_starts]
+
+    skip_int = color_to_skip[0] * 256 * 256 + color_to_skip[1] * 256 + color_to_skip[2] if color_to_skip else 0
+    if skip_int:  # As before, a packed value of 0 (black) doesn't enable skipping
+        # The skipped color only counts when it is the region's only color
+        colors_per_region = np.diff(np.r_[region_starts, len(keys)])
+        candidates = np.flatnonzero((features != skip_int) | (np.repeat(colors_per_region, colors_per_region) == 1))
+        # Ties go to the highest color, as when walking the reversed argsort of the counts
+        tie_keys = -features[candidates]
+    else:
+        candidates = np.arange(len(keys))
+        # Ties go to the lowest color, as with argmax over the sorted unique colors
+        tie_keys = features
+
+    # Highest count first, then the tie-break above
+    order = candidates[np.lexsort((tie_keys, -counts[candidates], regions[candidates]))]
+    first_of_region = np.r_[True, regions[order][1:] != regions[order][:-1]]
+    dominant = features[order[first_of_region]]
+
+    result_colors = np.stack([dominant // (256 * 256), (dominant // 256) % 256, dominant % 256], axis=1)
+    values = [rgb_to_hex(*color) for color in result_colors.tolist()]
+    return unique_regions, result_colors, values
+
+
+def write_location_features(regions: ndarray, result_colors: ndarray, values: list, p_arr_locations: ndarray,
+                            path_output: str, output_file_txt: str):
+    """
+    Write the region mappings and the recolored locations image.
+
+    Args:
+        regions: Sorted packed region colors
+        result_colors: RGB color of every region in the output image
+        values: Mapping value of every region
+        p_arr_locations: Locations image (RGB)
+        path_output: Path of the output image
+        output_file_txt: Path of the output mapping file
+    """
+    # Sorted packed colors are also sorted by HEX
+    with open(output_file_txt, 'w+') as f:
+        f.writelines(f"{rgb_to_hex(int(r) >> 16, (int(r) >> 8) & 0xFF, int(r) & 0xFF)}={value}\n"
+                     for r, value in zip(regions, values))
+
+    result_colors = np.asarray(result_colors).astype(np.uint8)
+    height, width = p_arr_locations.shape[:2]
+    # Recolor and encode one strip at a time, so the output image is never held in memory
+    strips = (result_colors[np.searchsorted(regions, pack_rgb(p_arr_locations[row:row + CHUNK_ROWS]))]
+              for row in range(0, height, CHUNK_ROWS))
+    write_png_strips(path_output, width, height, strips)
+
+
+def _write_png_chunk(f, chunk_type: bytes, data: bytes):
+    f.write(struct.pack('>I', len(data)) + chunk_type + data)
+    f.write(struct.pack('>I', zlib.crc32(chunk_type + data)))
+
+
+def write_png_strips(path: str, width: int, height: int, strips):
+    """
+    Write an 8-bit RGB PNG from horizontal strips, compressing each strip as it arrives.
+
+    Args:
+        path: Path of the output image
+        width: Width of the image
+        height: Height of the image
+        strips: Iterable of uint8 arrays (rows, width, 3) covering the image from the top
+    """
+    compressor = zlib.compressobj(6)
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        _write_png_chunk(f, b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+        for strip in strips:
+            # Every scanline starts with its filter type (0 = none)
+            scanlines = np.zeros((strip.shape[0], 1 + width * 3), dtype=np.uint8)
+            scanlines[:, 1:] = strip.reshape(strip.shape[0], -1)
+            data = compressor.compress(scanlines.tobytes())
+            if data:
+                _write_png_chunk(f, b'IDAT', data)
+        _write_png_chunk(f, b'IDAT', compressor.flush())
+        _write_png_chunk(f, b'IEND', b'')
+
+
+# Pillow mode of the 8-bit PNG color types, which is also the raw layout of their scanlines
+PNG_COLOR_MODES = {0: 'L', 2: 'RGB', 3: 'P', 4: 'LA', 6: 'RGBA'}
+
+
+def _read_png_chunks(f):
+    """Yield (type, data) of the chunks of a PNG file after its signature, one chunk in memory at a time."""
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            raise ValueError("PNG file ends without an IEND chunk")
+        length, chunk_type = struct.unpack('>I4s', header)
+        data = f.read(length)
+        f.read(4)  # CRC
+        yield chunk_type, data
+        if chunk_type == b'IEND':
+            return
+
+
+def _read_png_header(f, image_path: str) -> tuple:
+    """
+    Check the signature and IHDR chunk of a PNG file and return (width, height, Pillow mode).
+
+    The mode is None for PNGs that can't be decoded in strips: other bit depths and interlaced images.
+    """
+    if f.read(8) != b'\x89PNG\r\n\x1a\n':
+        raise ValueError(f"{image_path} isn't a PNG file; convert it to PNG or .npy")
+    chunk_type, data = next(_read_png_chunks(f))
+    if chunk_type != b'IHDR':
+        raise ValueError(f"{image_path}: PNG file doesn't start with an IHDR chunk")
+    width, height, bit_depth, color_type, _, _, interlace = struct.unpack('>IIBBBBB', data)
+    mode = PNG_COLOR_MODES.get(color_type)
+    if bit_depth != 8 or interlace:
+        mode = None
+    return width, height, mode
+
+
+def read_png_strips(image_path: str, strip_rows: int = CHUNK_ROWS):
+    """
+    Decode a PNG into RGB strips, holding one strip in memory at a time.
+
+    The image data is inflated incrementally with zlib. The scanlines of each
+    strip are unfiltered by Pillow's PNG decoder, with the strip's previous row
+    prepended unfiltered, so that the filters of its first row can refer to it.
+
+    Args:
+        image_path: Path of an 8-bit, non-interlaced PNG
+        strip_rows: Rows per strip
+
+    Yields:
+        uint8 arrays (rows, width, 3) covering the image from the top
+    """
+    with open(image_path, 'rb') as f:
+        width, _, mode = _read_png_header(f, image_path)
+        if mode is None:
+            raise ValueError(f"{image_path} must be an 8-bit, non-interlaced PNG to be decoded in strips")
+        stride = 1 + width * len(mode)
+        strip_bytes = strip_rows * stride
+
+        palette = None
+        previous_row = None
+        pending = bytearray()
+        decompressor = zlib.decompressobj()
+
+        def decode(scanlines: bytes, row_count: int) -> ndarray:
+            nonlocal previous_row
+            first_row = 0
+            if previous_row is not None:
+                # Filter type 0 (none) keeps the previous row as it is
+                scanlines = b'\0' + previous_row + scanlines
+                row_count += 1
+                first_row = 1
+            strip = Image.frombytes(mode, (width, row_count), zlib.compress(scanlines, 0), 'zip', mode)
+            if palette is not None:
+                strip.putpalette(palette)
+            previous_row = strip.crop((0, row_count - 1, width, row_count)).tobytes()
+            return np.asarray(strip.convert('RGB'))[first_row:]
+
+        for chunk_type, data in _read_png_chunks(f):
+            if chunk_type == b'PLTE':
+                palette = data
+            elif chunk_type == b'IDAT':
+                while data:
+                    # Limit the inflated size, a small chunk of a flat image can expand a lot
+                    pending += decompressor.decompress(data, strip_bytes)
+                    data = decompressor.unconsumed_tail
+                    while len(pending) >= strip_bytes:
+                        yield decode(bytes(pending[:strip_bytes]), strip_rows)
+                        del pending[:strip_bytes]
+        pending += decompressor.flush()
+        if len(pending) % stride:
+            raise ValueError(f"{image_path}: image data ends inside a scanline")
+        if pending:
+            yield decode(bytes(pending), len(pending) // stride)
+
+
+def convert_image_to_npy(image_path: str, npy_path: str) -> tuple:
+    """
+    Decode a PNG into a memory-mappable RGB .npy file, one strip at a time.
+
+    Neither the image nor the RGB array is held in memory whole: the strips
+    from read_png_strips are written straight to the file. PNGs that can't be
+    decoded in strips, like 4-bit palette images, are decoded whole instead.
+
+    Returns:
+        Shape of the saved array
+    """
+    with open(image_path, 'rb') as f:
+        width, height, mode = _read_png_header(f, image_path)
+    arr = np.lib.format.open_memmap(npy_path, mode='w+', dtype=np.uint8, shape=(height, width, 3))
+    strips = read_png_strips(image_path) if mode is not None else [get_array_from_image(image_path)]
+    row = 0
+    for strip in strips:
+        arr[row:row + len(strip)] = strip
+        row += len(strip)
+    if row != height:
+        raise ValueError(f"{image_path}: image data ends after {row} of {height} rows")
+    arr.flush()
+    del arr
+    return height, width, 3
+
+
+def open_raster(image_path: str) -> ndarray:
+    """
+    Open an image as a read-only memory-mapped RGB array.
+
+    .npy files are mapped directly. Other images are converted once to a .npy
+    file next to them, which is reused as long as it is newer than the image.
+
+    Args:
+        image_path: Path of a .npy file or an image
+
+    Returns:
+        Memory-mapped array (height, width, 3)
+    """
+    if image_path.endswith('.npy'):
+        return np.load(image_path, mmap_mode='r')
+    npy_path = f'{image_path}.npy'
+    if not os.path.exists(npy_path) or os.path.getmtime(npy_path) < os.path.getmtime(image_path):
+        print(f'Converting {image_path} to {npy_path}...')
+        convert_image_to_npy(image_path, f'{npy_path}.tmp.npy')
+        os.replace(f'{npy_path}.tmp.npy', npy_path)
+    return np.load(npy_path, mmap_mode='r')
+
+
+def get_checkpoint_inputs(input_files: tuple) -> tuple:
+    """
+    Get the values of the input images that must match for a checkpoint to be resumed.
+
+    Returns:
+        Tuple of (absolute paths, (st_mtime_ns, st_size) of every file)
+    """
+    paths = [os.path.abspath(file_path) for file_path in input_files]
+    stats = [(stat.st_mtime_ns, stat.st_size) for stat in map(os.stat, paths)]
+    return np.array(paths, dtype=str), np.array(stats, dtype=np.int64).reshape(-1, 2)
+
+
+def save_checkpoint(checkpoint_file: str, histogram: tuple, next_row: int, shape: tuple, strip_rows: int,
+                    is_gradient: bool, inputs: tuple):
+    """
+    Save the running histogram and the first row that still has to be read.
+
+    The file is written next to the checkpoint and swapped in, so an
+    interruption while saving keeps the previous checkpoint intact.
+    """
+    temp_file = f'{checkpoint_file}.tmp'
+    input_paths, input_stats = inputs
+    with open(temp_file, 'wb') as f:
+        np.savez(f, *histogram, next_row=next_row, shape=np.array(shape), strip_rows=strip_rows,
+                 is_gradient=is_gradient, input_paths=input_paths, input_stats=input_stats)
+    os.replace(temp_file, checkpoint_file)
+
+
+def load_checkpoint(checkpoint_file: str, shape: tuple, strip_rows: int, is_gradient: bool, inputs: tuple) -> tuple:
+    """
+    Load a checkpoint written by save_checkpoint for the same run settings and unchanged input images.
+
+    Returns:
+        Tuple of (histogram, next_row), or (None, 0) if there is no matching checkpoint
+    """
+    if not checkpoint_file or not os.path.exists(checkpoint_file):
+        return None, 0
+    input_paths, input_stats = inputs
+    with np.load(checkpoint_file) as checkpoint:
+        if (tuple(checkpoint['shape']) != tuple(shape) or int(checkpoint['strip_rows']) != strip_rows
+                or bool(checkpoint['is_gradient']) != is_gradient):
+            print(f'Ignoring checkpoint {checkpoint_file}, it was written for different settings')
+            return None, 0
+        if ('input_paths' not in checkpoint.files or not np.array_equal(checkpoint['input_paths'], input_paths)
+                or not np.array_equal(checkpoint['input_stats'], input_stats)):
+            print(f'Ignoring checkpoint {checkpoint_file}, it was written for different or changed images')
+            return None, 0
+        histogram_parts = 3 if is_gradient else 2
+        histogram = tuple(checkpoint[f'arr_{i}'] for i in range(histogram_parts))
+        return histogram, int(checkpoint['next_row'])
+
+
+def accumulate_strips(arr_locations: ndarray, arr_features: ndarray, is_gradient: bool = False,
+                      strip_rows: int = CHUNK_ROWS, checkpoint_file: str = None,
+                      checkpoint_interval: float = CHECKPOINT_INTERVAL, input_files: tuple = ()) -> tuple:
+    """
+    Count the features of every region strip by strip, with checkpoints.
+
+    The histogram of every strip is merged into a running histogram. When a
+    checkpoint file is given, the running histogram is saved every
+    checkpoint_interval seconds and on Ctrl+C, and a run is resumed from the
+    strip after the last saved one. A checkpoint is discarded when the path,
+    modification time or size of one of the input_files changed since.
+
+    Args:
+        arr_locations: Locations image (RGB)
+        arr_features: Feature image (RGB)
+        is_gradient: Whether the feature is averaged instead of counted
+        strip_rows: Number of image rows read per strip
+        checkpoint_file: Path of the checkpoint file, or None to disable checkpoints
+        checkpoint_interval: Seconds between checkpoints
+        input_files: Paths of the images the arrays were read from
+
+    Returns:
+        Region histogram of the whole image
+    """
+    height = arr_locations.shape[0]
+    # Taken before reading, so an image edited during the run invalidates its checkpoints
+    inputs = get_checkpoint_inputs(input_files)
+    histogram, start_row = load_checkpoint(checkpoint_file, arr_locations.shape, strip_rows, is_gradient, inputs)
+    if start_row:
+        print(f'Resuming from row {start_row} of {height}')
+
+    # Finish the current strip on Ctrl+C, then save a checkpoint and stop
+    interrupted = []
+    previous_handler = None
+    if checkpoint_file:
+        try:
+            previous_handler = signal.signal(signal.SIGINT, lambda signum, frame: interrupted.append(signum))
+        except ValueError:
+            # Signal handlers can only be set from the main thread
+            pass
+
+    try:
+        last_checkpoint = time.time()
+        with tqdm(total=height, initial=start_row, desc="Processing rows", unit="row") as pbar:
+            for row in range(start_row, height, strip_rows):
+                strip_histogram = accumulate_region_histogram(arr_locations[row:row + strip_rows],
+                                                              arr_features[row:row + strip_rows], is_gradient)
+                histogram = strip_histogram if histogram is None else \
+                    merge_region_histograms([histogram, strip_histogram], is_gradient)
+                pbar.update(min(strip_rows, height - row))
+
+                if checkpoint_file and (interrupted or time.time() - last_checkpoint >= checkpoint_interval):
+                    save_checkpoint(checkpoint_file, histogram, row + strip_rows, arr_locations.shape,
+                                    strip_rows, is_gradient, inputs)
+                    last_checkpoint = time.time()
+                if interrupted:
+                    print(f'Interrupted, checkpoint saved to {checkpoint_file}')
+                    raise KeyboardInterrupt
+    finally:
+        if previous_handler is not None:
+            signal.signal(signal.SIGINT, previous_handler)
+
+    if checkpoint_file and os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+    return histogram
+
 
 def calculate_location_features(p_arr_locations: ndarray, arr_features: ndarray, path_output: str,
                                 output_file_txt: str, is_gradient: bool = False,
-                                color_to_skip: tuple[int, int, int] = None):
+                                color_to_skip: tuple[int, int, int] = None, checkpoint_file: str = None,
+                                checkpoint_interval: float = CHECKPOINT_INTERVAL, input_files: tuple = ()):
     # Verify image dimensions match
     if p_arr_locations.shape != arr_features.shape:
         raise ValueError("Region and feature images must have the same dimensions.")
 
-    # Create output mapping file
-    mapping_file_path = "province_koppen_colors.txt"
-
-    # Reshape arrays to 2D for faster processing
-    original_2d = p_arr_locations.reshape(-1, 3)
-    koppen_2d = arr_features.reshape(-1, 3)
-
-    # Get unique regions and their indices more efficiently
-    unique_regions, inverse_indices = np.unique(original_2d, axis=0, return_inverse=True)
-
-    # Create a mapping array for the final result
-    result_colors = np.zeros_like(unique_regions)
-
-    # Dictionary to store region to climate mappings
-    climate_mappings = {}
-
-    # Convert the color to skip into the same integer format
-    if color_to_skip:
-        color_to_skip = (color_to_skip[0] * 256 * 256 + color_to_skip[1] * 256 + color_to_skip[2])
-
-    # Process each unique region
-    lenUniqueColors = len(unique_regions)
-    step = max(lenUniqueColors // 100, 1)
-
-    with tqdm(total=lenUniqueColors, desc="Processing regions", unit="region") as pbar:
-        for i, color in enumerate(unique_regions):
-            # Find all pixels belonging to this region
-            region_mask = (inverse_indices == i)
-
-            # Get feature values for this region
-            region_features = koppen_2d[region_mask]
-
-            if len(region_features) > 0:
-                if is_gradient:
-                    # Calculate average values for each RGB channel
-                    dominant_feature = np.mean(region_features, axis=0).astype(np.int32)
-
-                    # Store mapping using hex for region and numerical value for gradient
-                    region_hex = f"{rgb_to_hex(*color)}"
-                    # Calculate single gradient value (assuming grayscale where R=G=B)
-                    gradient_value = int(np.mean(dominant_feature))
-                    climate_mappings[region_hex] = gradient_value
-                else:
-                    # Original logic for categorical features
-                    feature_ints = (region_features[:, 0].astype(np.int32) * 256 * 256 +
-                                    region_features[:, 1].astype(np.int32) * 256 +
-                                    region_features[:, 2])
-                    unique_features, counts = np.unique(feature_ints, return_counts=True)
-
-                    if color_to_skip:
-                        # Find the index of the most common color that isn't the one to skip
-                        if len(counts) > 1:  # Make sure we have at least 2 colors
-                            sorted_indices = np.argsort(counts)[::-1]  # Sort indices by count (descending)
-                            for idx in sorted_indices:
-                                if unique_features[idx] != color_to_skip:
-                                    dominant_feature_int = unique_features[idx]
-                                    break
-                        else:
-                            dominant_feature_int = unique_features[0]  # If only one color exists, use it
-                    else:
-                        dominant_feature_int = unique_features[np.argmax(counts)]
-
-                    # Convert back to RGB
-                    dominant_feature = [
-                        dominant_feature_int // (256 * 256),
-                        (dominant_feature_int // 256) % 256,
-                        dominant_feature_int % 256
-                    ]
-
-                    # Store mapping using hex colors for both
-                    region_hex = f"{rgb_to_hex(*color)}"
-                    feature_hex = f"{rgb_to_hex(*dominant_feature)}"
-                    climate_mappings[region_hex] = feature_hex
-
-                result_colors[i] = dominant_feature
-
-            if i % step == step - 1:
-                pbar.update(step)
-
-                # Write mappings to file
-                with open(output_file_txt, 'w+') as f:
-                    for region, value in sorted(climate_mappings.items()):
-                        f.write(f"{region}={value}\n")
-                output_arr = result_colors[inverse_indices].reshape(arr_features.shape)
-                Image.fromarray(output_arr.astype(np.uint8)).save(path_output)
-                pass
+    # Count the features of every region in one pass over the image
+    histogram = accumulate_strips(p_arr_locations, arr_features, is_gradient, CHUNK_ROWS, checkpoint_file,
+                                  checkpoint_interval, input_files)
+
+    regions, result_colors, values = find_dominant_features(histogram, is_gradient, color_to_skip)
+    write_location_features(regions, result_colors, values, p_arr_locations, path_output, output_file_txt)
+
+
+def calculate_location_features_streaming(locations_image: str, features_image: str, path_output: str,
+                                          output_file_txt: str, is_gradient: bool = False,
+                                          color_to_skip: tuple[int, int, int] = None, strip_rows: int = CHUNK_ROWS,
+                                          checkpoint_file: str = None, checkpoint_interval: float = CHECKPOINT_INTERVAL):
+    """
+    Calculate a feature map without loading the images into memory.
+
+    Both images are memory-mapped (see open_raster) and read in horizontal
+    strips. The histogram of every strip is merged into the running histogram
+    right away, so only a strip of each image and the per-region accumulators
+    are held in memory. The output image is written strip by strip as well.
+
+    The running histogram is checkpointed (see accumulate_strips), so an
+    interrupted run picks up where it stopped when started again.
+
+    Args:
+        locations_image: Path of the locations image (or .npy)
+        features_image: Path of the feature image (or .npy)
+        path_output: Path of the output image
+        output_file_txt: Path of the output mapping file
+        is_gradient: Whether the feature is averaged instead of counted
+        color_to_skip: Feature color to ignore unless it is the only one in a region
+        strip_rows: Number of image rows read per strip
+        checkpoint_file: Path of the checkpoint file (default: next to output_file_txt)
+        checkpoint_interval: Seconds between checkpoints
+    """
+    arr_locations = open_raster(locations_image)
+    arr_features = open_raster(features_image)
+    if arr_locations.shape != arr_features.shape:
+        raise ValueError("Region and feature images must have the same dimensions.")
+
+    if checkpoint_file is None:
+        checkpoint_file = f'{output_file_txt}.checkpoint.npz'
+    histogram = accumulate_strips(arr_locations, arr_features, is_gradient, strip_rows, checkpoint_file,
+                                  checkpoint_interval, (locations_image, features_image))
 
-    with open(output_file_txt, 'w+') as f:
-        for region, value in sorted(climate_mappings.items()):
-            f.write(f"{region}={value}\n")
-    # Apply the results using broadcasting
-    output_arr = result_colors[inverse_indices].reshape(arr_features.shape)
+    regions, result_colors, values = find_dominant_features(histogram, is_gradient, color_to_skip)
+    write_location_features(regions, result_colors, values, arr_locations, path_output, output_file_txt)
 
-    # Save the result image
-    Image.fromarray(output_arr.astype(np.uint8)).save(path_output)
 
-    # return output_arr
+def accumulate_band(locations_file: str, features_file: str, row_start: int, row_end: int,
+                    is_gradient: bool = False) -> tuple:
+    """
+    Worker task: count the features of every region in one band of rows.
+
+    Both images are memory-mapped .npy files, so the band is read straight from
+    the shared file instead of being pickled to the worker.
+
+    Args:
+        locations_file: Path of the locations image saved as .npy
+        features_file: Path of the feature image saved as .npy
+        row_start: First row of the band
+        row_end: Row after the last row of the band
+        is_gradient: Whether the feature is averaged instead of counted
+
+    Returns:
+        Region histogram of the band
+    """
+    arr_locations = np.load(locations_file, mmap_mode='r')
+    arr_features = np.load(features_file, mmap_mode='r')
+    if arr_locations.shape != arr_features.shape:
+        raise ValueError("Region and feature images must have the same dimensions.")
+
+    histograms = [accumulate_region_histogram(arr_locations[row:min(row + CHUNK_ROWS, row_end)],
+                                              arr_features[row:min(row + CHUNK_ROWS, row_end)], is_gradient)
+                  for row in range(row_start, row_end, CHUNK_ROWS)]
+    return merge_region_histograms(histograms, is_gradient)
+
+
+def finish_features(histogram: tuple, locations_file: str, path_output: str, output_file_txt: str,
+                    is_gradient: bool = False, color_to_skip: tuple = None):
+    """Worker task: pick the dominant features from a merged histogram and write the outputs."""
+    regions, result_colors, values = find_dominant_features(histogram, is_gradient, color_to_skip)
+    write_location_features(regions, result_colors, values, np.load(locations_file, mmap_mode='r'),
+                            path_output, output_file_txt)
+
+
+def calculate_location_features_parallel(locations_image: str, features: dict, max_workers: int = None,
+                                         band_rows: int = BAND_ROWS):
+    """
+    Calculate several feature maps at once on a process pool.
+
+    The locations image is decoded once and shared with the workers as a
+    memory-mapped .npy file, like every feature image. Every feature image is split into row bands, all
+    bands of all features run concurrently, and the partial histograms of each
+    feature are merged when its bands are done.
+
+    Args:
+        locations_image: Path of the locations image
+        features: Feature name -> dict with 'input', 'output_image', 'output_txt' and
+            optionally 'is_gradient' and 'color_to_skip'
+        max_workers: Number of worker processes (default: all cores)
+        band_rows: Number of image rows per worker task
+    """
+    max_workers = max_workers or os.cpu_count()
+    with tempfile.TemporaryDirectory() as shared_dir, ProcessPoolExecutor(max_workers=max_workers) as pool:
+        # Decode the locations image and every feature image in parallel
+        locations_file = os.path.join(shared_dir, 'locations.npy')
+        decode_jobs = {pool.submit(convert_image_to_npy, locations_image, locations_file): None}
+        for feature, config in features.items():
+            config['shared_file'] = os.path.join(shared_dir, f'{feature}.npy')
+            decode_jobs[pool.submit(convert_image_to_npy, config['input'], config['shared_file'])] = feature
+        shapes = {feature: job.result() for job, feature in decode_jobs.items()}
+
+        height = shapes[None][0]
+        band_jobs = {}
+        for feature, config in features.items():
+            if shapes[feature] != shapes[None]:
+                raise ValueError(f"Region and feature images must have the same dimensions ({feature}).")
+            config['histograms'] = []
+            for row_start in range(0, height, band_rows):
+                job = pool.submit(accumulate_band, locations_file, config['shared_file'], row_start,
+                                  min(row_start + band_rows, height), config.get('is_gradient', False))
+                band_jobs[job] = feature
+
+        # Merge the bands of every feature as they complete, then write its outputs
+        bands_left = {feature: sum(1 for f in band_jobs.values() if f == feature) for feature in features}
+        finish_jobs = []
+        with tqdm(total=len(band_jobs), desc="Processing bands", unit="band") as pbar:
+            for job in as_completed(band_jobs):
+                feature = band_jobs[job]
+                config = features[feature]
+                config['histograms'].append(job.result())
+                bands_left[feature] -= 1
+                pbar.update(1)
+                if bands_left[feature] == 0:
+                    is_gradient = config.get('is_gradient', False)
+                    histogram = merge_region_histograms(config.pop('histograms'), is_gradient)
+                    finish_jobs.append(pool.submit(finish_features, histogram, locations_file, config['output_image'],
+                                                   config['output_txt'], is_gradient, config.get('color_to_skip')))
+        for job in finish_jobs:
+            job.result()
 
 
 def generateLocationMapAndTextFromInputMap(feature, is_gradient=False):
@@ -143,19 +633,37 @@ def generateLocationMapAndTextFromInputMap(feature, is_gradient=False):
         arr_feature,
         f'res/location_{feature}.png',
         f'res/location_{feature}.csv',
-        is_gradient
+        is_gradient,
+        checkpoint_file=f'res/location_{feature}.checkpoint.npz',
+        input_files=(FILE_IMAGE_LOCATIONS_INPUT, FEATURE_FILES[feature]['input'])
     )
     print(f'Map for {feature} created in {time.time() - time_task:.2f} seconds')
 
 
+def generateAllLocationMapsInParallel(max_workers=None):
+    """Regenerate the maps and texts of every entry of FEATURE_FILES on all cores."""
+    time_task = resetTimer('Creating maps for all features in parallel...')
+    features = {
+        feature: {
+            'input': config['input'],
+            'is_gradient': config.get('is_gradient', False),
+            'output_image': f'res/location_{feature}.png',
+            'output_txt': f'res/location_{feature}.csv',
+        }
+        for feature, config in FEATURE_FILES.items()
+    }
+    calculate_location_features_parallel(FILE_IMAGE_LOCATIONS_INPUT, features, max_workers)
+    print(f'Maps for {len(features)} features created in {time.time() - time_task:.2f} seconds')
+
+
 if __name__ == "__main__":
-    time_task = resetTimer('Getting array from images...')
-    arr_locations: ndarray = get_array_from_image(FILE_IMAGE_LOCATIONS_INPUT)
-    print(f"Arrays from images retrieved in {time.time() - time_task:.2f} seconds")
+    # Regenerate every feature at once, using every core
+    generateAllLocationMapsInParallel()
 
-    # time_task = resetTimer('Creating Victoria 3 climate map...')
-    # modified_pixmap: QPixmap = construct_map_from_mapping(location_to_v3TerrainType, terrain_colors)
-    # print(f"V3 climate map created in {time.time() - time_task:.2f} seconds")
+    # Or one feature at a time:
+    # time_task = resetTimer('Getting array from images...')
+    # arr_locations: ndarray = get_array_from_image(FILE_IMAGE_LOCATIONS_INPUT)
+    # print(f"Arrays from images retrieved in {time.time() - time_task:.2f} seconds")
 
     # generateLocationMapAndTextFromInputMap('koppen')
     # generateLocationMapAndTextFromInputMap('topography')
@@ -163,5 +671,9 @@ if __name__ == "__main__":
     # generateLocationMapAndTextFromInputMap('low_wheat', True)
     # generateLocationMapAndTextFromInputMap('low_tubers', True)
 
+    # Or one feature without loading the images into memory, for rasters larger than RAM:
+    # calculate_location_features_streaming(FILE_IMAGE_LOCATIONS_INPUT, FEATURE_FILES['koppen']['input'],
+    #                                       'res/location_koppen.png', 'res/location_koppen.csv')
+
 # 'output_image': 'location_koppen.png',
 # 'output_data': 'province_koppen_colors.txt'
@@ -0,0 +1,156 @@
+"""
+Headless batch mode: apply project files and write the export folder without the GUI.
+
+The location data is parsed from the state regions, the location mappings of
+the needed maps are loaded into the location table, and the net effect of the
+projects' changes (the last value of every map and location, over all
+projects in order) is set on the table columns. The feature CSVs and a
+project_state.e5p holding the joined histories are then written like an
+export from the editor. No location image, layer or widget is built.
+
+Run from the repository root, like the editor:
+
+    python src/cli.py exports/<folder>/project_state.e5p [more projects...] --output build/map_data
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+from constants import FILE_FEATURE_DATA, PATH_EXPORTS, LABELS_SUITABILITY
+from file_parsers import (parse_states, load_feature_data, load_location_mappings, load_province_features,
+                          location_mapping_path, feature_details_path)
+from location_table import LocationTable, NO_VALUE
+from map_utils import generate_numerical_feature_labels
+from project_format import ProjectChanges, NO_KEY, PROJECT_FILE, load_project, write_project
+from settings_manager import SettingsManager
+
+
+def load_feature_labels(feature_type: str, config: dict) -> dict:
+    """Load the labels of a feature type, like the editor does when loading its layer."""
+    if config['isNumerical']:
+        return generate_numerical_feature_labels(LABELS_SUITABILITY)
+    return load_province_features(feature_details_path(feature_type, config))
+
+
+def apply_changes_to_table(locations: LocationTable, changes: ProjectChanges, feature_data: dict) -> int:
+    """
+    Set the net effect of project changes on the feature columns of a location table.
+
+    Args:
+        locations: LocationTable with a column for every map type to apply
+        changes: Changes of the projects; map types without a column are skipped
+        feature_data: Feature configuration, to warn about keys that aren't feature labels
+
+    Returns:
+        Number of locations set, over all map types
+    """
+    rows = locations.rows_of_keys(np.asarray(changes.columns['hex']))
+    skipped = int(np.count_nonzero(rows == NO_VALUE))
+    if skipped:
+        print(f"Warning: Skipping {skipped} changes of HEX colors that aren't in the state regions")
+
+    applied = 0
+    for map_type in changes.counts_by_layer():
+        column = locations.columns.get(map_type)
+        if column is None:
+            print(f"Warning: Skipping the changes of map type '{map_type}', it isn't loaded")
+            continue
+        labels = feature_data[map_type]['labels']
+        keys = list(changes.keys[map_type])
+        for key in keys:
+            if key not in labels:
+                print(f"Warning: Label '{key}' not found in feature data for {map_type}")
+
+        unique_rows, key_codes = changes.net_changes(map_type, rows)
+        # Removed values are written as empty values, like the editor does
+        column.set_codes(unique_rows, np.where(key_codes == NO_KEY, len(keys), key_codes), keys + [''])
+        applied += len(unique_rows)
+    return applied
+
+
+def run(project_paths: list, state_regions_path: str, maps: list = None, output_dir: str = None) -> str:
+    """
+    Apply project files to the location data and write the export folder.
+
+    Args:
+        project_paths: Project files (binary or project_state.json), applied in order
+        state_regions_path: Folder of the state region files
+        maps: Map types to load and export, defaults to the maps of the projects
+        output_dir: Export folder, defaults to a timestamped folder in exports/
+
+    Returns:
+        Path of the export folder
+    """
+    start_time = time.time()
+    feature_data = load_feature_data(FILE_FEATURE_DATA)
+    projects = [load_project(file_path) for file_path in project_paths]
+    changes = ProjectChanges.concatenate([project.changes for project in projects])
+
+    if maps is None:
+        maps = {map_type for project in projects for map_type in project.loaded_maps}
+        maps.update(changes.counts_by_layer())
+    for map_type in maps:
+        if map_type not in feature_data:
+            print(f"Warning: Map type '{map_type}' not found")
+    maps = [feature_type for feature_type in feature_data if feature_type in maps]
+
+    locations = parse_states(state_regions_path)
+    print(f"State parsing found {len(locations)} locations")
+    # Only the selected maps get a column, so no other map is applied or exported
+    for feature_type in list(locations.columns):
+        if feature_type not in maps:
+            locations.drop_column(feature_type)
+    for feature_type in maps:
+        config = feature_data[feature_type]
+        config['labels'] = load_feature_labels(feature_type, config)
+        load_location_mappings(location_mapping_path(feature_type, config), feature_type, locations)
+
+    changes = changes.filter_layers(maps)
+    applied = apply_changes_to_table(locations, changes, feature_data)
+    print(f"Applied {len(changes)} changes from {len(projects)} projects ({applied} locations set)")
+
+    if output_dir is None:
+        output_dir = os.path.join(PATH_EXPORTS, datetime.now().strftime('%Y%m%d_%H%M%S'))
+    os.makedirs(output_dir, exist_ok=True)
+    for column in locations.exported_columns():
+        locations.write_column_csv(column, os.path.join(output_dir, f'{column}.csv'))
+    current_map_type = next((project.current_map_type for project in reversed(projects)
+                             if project.current_map_type in maps), maps[0] if maps else None)
+    write_project(os.path.join(output_dir, PROJECT_FILE), changes, current_map_type, maps)
+    print(f"Exported {', '.join(maps)} to {output_dir} in {time.time() - start_time:.2f} seconds")
+    return output_dir
+
+
+def main(argv: list = None) -> int:
+    """Command-line entry point; returns the exit code."""
+    parser = argparse.ArgumentParser(description="Apply map editor projects and export the location data, "
+                                                 "without opening the editor.")
+    parser.add_argument('projects', nargs='+', help="Project files to apply, in order")
+    parser.add_argument('--states', help="Folder of the state region files, defaults to the editor's settings")
+    parser.add_argument('--maps', nargs='+', help="Map types to load and export, defaults to the projects' maps")
+    parser.add_argument('--output', help="Export folder, defaults to a timestamped folder in exports/")
+    args = parser.parse_args(argv)
+
+    state_regions_path = args.states or SettingsManager().get("state_regions_path", "")
+    if not os.path.isdir(state_regions_path):
+        print(f"Error: State regions folder '{state_regions_path}' not found; pass it with --states", file=sys.stderr)
+        return 1
+    for file_path in args.projects:
+        if not os.path.isfile(file_path):
+            print(f"Error: Project file '{file_path}' not found", file=sys.stderr)
+            return 1
+
+    try:
+        run(args.projects, state_regions_path, args.maps, args.output)
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
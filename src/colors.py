@@ -0,0 +1,18 @@
+"""
+Conversions between HEX color strings and RGB tuples.
+
+Kept free of Qt, so the headless batch mode can use them on a machine
+without a display; auxiliary re-exports them for the editor.
+"""
+
+
+def hex_to_rgb(hex_color) -> tuple:
+    hex_color = hex_color.lstrip('#')
+    return tuple(int(hex_color[i:i + 2], 16) for i in (0, 2, 4))
+
+
+def rgb_to_hex(r, g, b) -> str:
+    if not all(0 <= x <= 255 for x in [r, g, b]):
+        return None  # Invalid input
+
+    return "{:02X}{:02X}{:02X}".format(r, g, b)
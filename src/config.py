@@ -17,4 +17,5 @@ terrain_colors = {
 
 """Update button colors based on active map"""
 active_style = "background-color: #4CAF50; color: white; font-weight: bold;"
-inactive_style = "background-color: #f0f0f0; color: black;"
\ No newline at end of file
+inactive_style = "background-color: #f0f0f0; color: black;"
+unloaded_style = "background-color: #f0f0f0; color: #a0a0a0; border: 1px solid #d0d0d0;"
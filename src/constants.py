@@ -8,6 +8,9 @@ FILE_TXT_TERRAINS = f'{PATH_RES}mappings/province_terrains.txt'
 PATH_LOCATION_MAPPINGS = f'{PATH_RES}mappings/location_'
 PATH_FEATURE_DETAILS = f'{PATH_RES}feature_details/feature_details_'
 FILE_FEATURE_DATA = f'{PATH_RES}mappings/feature_data.json'
+PATH_CACHE = 'cache/'
+PATH_AUTOSAVE = 'autosave/'
+PATH_EXPORTS = 'exports/'
 
 # Suitability labels for numerical features
 LABELS_SUITABILITY = ['Unsuitable', 'Suboptimal', 'Favourable', 'Excellent', 'Exceptional'] 
\ No newline at end of file
@@ -0,0 +1,236 @@
+"""
+Columnar undo/redo journal for the map editor.
+
+Every edit is one row of (layer ID, location ID, old code, new code,
+transaction ID), stored in typed numpy columns instead of one dict per change.
+Rows before the cursor can be undone, rows after it can be redone. Rows that
+share a transaction ID (a brush stroke, an imported project, ...) are undone
+and redone together.
+"""
+import numpy as np
+
+# Rows allocated when the journal is created; the columns double when full
+INITIAL_CAPACITY = 1024
+
+JOURNAL_COLUMNS = {
+    'layer': np.uint8,
+    'location': np.uint32,
+    'old_code': np.int16,
+    'new_code': np.int16,
+    'transaction': np.uint32
+}
+
+
+class EditJournal:
+    """Array-backed undo/redo history of feature layer edits."""
+
+    def __init__(self, layer_names: list):
+        """
+        Initialize an empty journal.
+
+        Args:
+            layer_names: Names of the feature layers, their position is the layer ID
+        """
+        self.layer_names = list(layer_names)
+        self.layer_ids = {name: layer_id for layer_id, name in enumerate(self.layer_names)}
+        self.columns = {name: np.zeros(INITIAL_CAPACITY, dtype=dtype) for name, dtype in JOURNAL_COLUMNS.items()}
+        # Rows [0, cursor) can be undone, rows [cursor, end) can be redone
+        self.cursor = 0
+        self.end = 0
+        self.next_transaction_id = 0
+        self.open_transaction_id = None
+        # Layers changed by append, undo or redo since the last take_touched_layers
+        self.touched_layers = set()
+        # Called as on_change('append', (layer name, location IDs, old codes, new codes, transaction IDs)),
+        # on_change('undo', None) or on_change('redo', None) after the journal changed
+        self.on_change = None
+
+    def __len__(self):
+        """Number of changes that can be undone."""
+        return self.cursor
+
+    @property
+    def redo_count(self) -> int:
+        """Number of changes that can be redone."""
+        return self.end - self.cursor
+
+    @property
+    def nbytes(self) -> int:
+        return sum(column.nbytes for column in self.columns.values())
+
+    def has_layer(self, layer_name: str) -> bool:
+        """Whether any change that can be undone or redone belongs to a layer."""
+        layer_id = self.layer_ids.get(layer_name)
+        return layer_id is not None and bool(np.any(self.columns['layer'][:self.end] == layer_id))
+
+    def take_touched_layers(self) -> set:
+        """Get the names of the layers changed since the last call, and start tracking anew."""
+        touched, self.touched_layers = self.touched_layers, set()
+        return touched
+
+    def _reserve(self, row_count: int):
+        """Grow the columns so that row_count more rows fit after the cursor."""
+        needed = self.cursor + row_count
+        capacity = len(self.columns['layer'])
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name, column in self.columns.items():
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:self.cursor] = column[:self.cursor]
+            self.columns[name] = grown
+
+    def begin_transaction(self) -> int:
+        """
+        Start a transaction; appended changes belong to it until the next one starts.
+
+        Returns:
+            ID of the new transaction
+        """
+        self.open_transaction_id = self.next_transaction_id
+        self.next_transaction_id += 1
+        return self.open_transaction_id
+
+    def append(self, layer_name: str, location_ids, old_codes, new_codes, transaction_ids=None):
+        """
+        Append changes to the journal, dropping everything that could be redone.
+
+        Args:
+            layer_name: Name of the edited feature layer
+            location_ids: Location ID of every change
+            old_codes: Layer code of every location before the change
+            new_codes: Layer code of every location after the change
+            transaction_ids: Group label of every change; consecutive changes with the same
+                label become one new transaction. Defaults to the open transaction.
+        """
+        location_ids = np.atleast_1d(location_ids)
+        row_count = len(location_ids)
+        if not row_count:
+            return
+        if transaction_ids is None:
+            if self.open_transaction_id is None:
+                self.begin_transaction()
+            transactions = np.full(row_count, self.open_transaction_id, dtype=np.uint32)
+        else:
+            # Give every run of equal labels a fresh transaction ID
+            transaction_ids = np.atleast_1d(transaction_ids)
+            starts = np.r_[True, transaction_ids[1:] != transaction_ids[:-1]]
+            transactions = (self.next_transaction_id + np.cumsum(starts) - 1).astype(np.uint32)
+            self.next_transaction_id = int(transactions[-1]) + 1
+            self.end_transaction()
+
+        self._reserve(row_count)
+        rows = slice(self.cursor, self.cursor + row_count)
+        self.columns['layer'][rows] = self.layer_ids[layer_name]
+        self.columns['location'][rows] = location_ids
+        self.columns['old_code'][rows] = old_codes
+        self.columns['new_code'][rows] = new_codes
+        self.columns['transaction'][rows] = transactions
+        self.cursor += row_count
+        self.end = self.cursor
+        self.touched_layers.add(layer_name)
+        if self.on_change:
+            self.on_change('append', (layer_name, location_ids, self.columns['old_code'][rows],
+                                      self.columns['new_code'][rows], transactions))
+
+    def end_transaction(self):
+        """Close the open transaction; later changes won't be merged into it."""
+        self.open_transaction_id = None
+
+    def record(self, layer_name: str, location_ids, old_codes, new_codes):
+        """Append changes as a transaction of their own."""
+        self.begin_transaction()
+        self.append(layer_name, location_ids, old_codes, new_codes)
+        self.end_transaction()
+
+    def _transaction_start(self, row_end: int) -> int:
+        """First row of the transaction that ends at row_end - 1."""
+        transactions = self.columns['transaction'][:row_end]
+        last = transactions[row_end - 1]
+        different = np.flatnonzero(transactions != last)
+        return int(different[-1]) + 1 if len(different) else 0
+
+    def _transaction_end(self, row_start: int) -> int:
+        """Row after the transaction that starts at row_start."""
+        transactions = self.columns['transaction'][row_start:self.end]
+        different = np.flatnonzero(transactions != transactions[0])
+        return row_start + int(different[0]) if len(different) else self.end
+
+    def _rows(self, rows: slice, code_column: str) -> list:
+        """Split rows into (layer name, location IDs, codes) per layer, keeping their order."""
+        layers = self.columns['layer'][rows]
+        locations = self.columns['location'][rows].astype(np.int64)
+        codes = self.columns[code_column][rows]
+        return [(self.layer_names[layer_id], locations[layers == layer_id], codes[layers == layer_id])
+                for layer_id in dict.fromkeys(layers.tolist())]
+
+    def undo(self) -> list:
+        """
+        Step back over the last transaction.
+
+        Returns:
+            List of (layer name, location IDs, old codes) to apply, with the
+            changes in reverse order, or an empty list if there is nothing to undo
+        """
+        if not self.cursor:
+            return []
+        start = self._transaction_start(self.cursor)
+        changes = self._rows(slice(start, self.cursor), 'old_code')
+        changes = [(layer_name, locations[::-1], codes[::-1]) for layer_name, locations, codes in changes]
+        self.cursor = start
+        self.end_transaction()
+        self.touched_layers.update(layer_name for layer_name, _, _ in changes)
+        if self.on_change:
+            self.on_change('undo', None)
+        return changes
+
+    def redo(self) -> list:
+        """
+        Step forward over the next transaction.
+
+        Returns:
+            List of (layer name, location IDs, new codes) to apply, or an empty
+            list if there is nothing to redo
+        """
+        if self.cursor == self.end:
+            return []
+        end = self._transaction_end(self.cursor)
+        changes = self._rows(slice(self.cursor, end), 'new_code')
+        self.cursor = end
+        self.end_transaction()
+        self.touched_layers.update(layer_name for layer_name, _, _ in changes)
+        if self.on_change:
+            self.on_change('redo', None)
+        return changes
+
+    def restore(self, layer_names: list, location_ids, old_codes, new_codes, transaction_ids, cursor: int):
+        """
+        Replace every row of the journal, e.g. with the rows of an autosave snapshot.
+
+        on_change isn't called; the caller applies the codes to the layers.
+
+        Args:
+            layer_names: Layer name of every row
+            location_ids: Location ID of every row
+            old_codes: Layer code of every row's location before its change
+            new_codes: Layer code of every row's location after its change
+            transaction_ids: Transaction of every row; consecutive equal IDs form one transaction
+            cursor: Number of rows that can be undone, the rest can be redone
+        """
+        row_count = len(location_ids)
+        self.cursor = 0
+        self._reserve(row_count)
+        rows = slice(0, row_count)
+        self.columns['layer'][rows] = [self.layer_ids[name] for name in layer_names]
+        self.columns['location'][rows] = location_ids
+        self.columns['old_code'][rows] = old_codes
+        self.columns['new_code'][rows] = new_codes
+        transaction_ids = np.asarray(transaction_ids)
+        starts = np.r_[True, transaction_ids[1:] != transaction_ids[:-1]] if row_count else np.empty(0, bool)
+        self.columns['transaction'][rows] = np.cumsum(starts) - 1
+        self.next_transaction_id = int(np.count_nonzero(starts))
+        self.cursor = cursor
+        self.end = row_count
+        self.end_transaction()
+        self.touched_layers.update(layer_names)
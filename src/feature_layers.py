@@ -0,0 +1,139 @@
+"""
+Palette-indexed feature layers for the map editor.
+
+Each feature layer (climate, topography, ...) is stored as one small code per
+location ID plus a palette of label colors. The displayed map is rendered by a
+single lookup over the location index's label raster, so the memory used stays
+at one raster no matter how many layers are loaded.
+"""
+import numpy as np
+
+from auxiliary import hex_to_rgb
+from location_index import LocationIndex, INDEX_CHUNK_ROWS
+from location_table import LocationTable, CategoricalColumn, NO_VALUE
+
+# Code of a location without a value in the layer
+NO_CODE = -1
+
+# Color used for locations without a (known) value, as 0xAARRGGBB
+NO_VALUE_COLOR = 0xFF000000
+
+
+def rgb_to_argb32(color_RGB: tuple) -> int:
+    """Convert an RGB tuple to an opaque 0xAARRGGBB integer."""
+    return 0xFF000000 | (int(color_RGB[0]) << 16) | (int(color_RGB[1]) << 8) | int(color_RGB[2])
+
+
+class FeatureLayer:
+    """Per-location label codes and the label palette of one feature type."""
+
+    def __init__(self, feature_type: str, labels: dict, location_count: int, needsConversionToRGB=True):
+        """
+        Initialize an empty feature layer.
+
+        Args:
+            feature_type: The type of feature (climate, topography, etc.)
+            labels: Feature labels including colors, keyed by label
+            location_count: Number of location IDs in the location index
+            needsConversionToRGB: Whether label colors are HEX strings
+        """
+        self.feature_type = feature_type
+        self.keys = []
+        self.key_to_code = {}
+        colors = []
+        for key, label in labels.items():
+            color = hex_to_rgb(label['color']) if needsConversionToRGB else label['color']
+            self.key_to_code[key] = len(self.keys)
+            self.keys.append(key)
+            colors.append(rgb_to_argb32(color))
+
+        # The last palette entry is the color of NO_CODE, so palette[codes] needs no special case
+        self.palette = np.array(colors + [NO_VALUE_COLOR], dtype=np.uint32)
+        self.codes = np.full(location_count, NO_CODE, dtype=np.int16)
+
+    def code_for_key(self, key: str) -> int:
+        """
+        Get the code of a label key, registering unknown keys.
+
+        Keys that aren't in the feature labels keep their value but are drawn
+        with the no-value color, like the old pixmap construction did.
+        """
+        code = self.key_to_code.get(key)
+        if code is None:
+            print(f"Warning: Label '{key}' not found in feature data for {self.feature_type}")
+            code = len(self.keys)
+            self.key_to_code[key] = code
+            self.keys.append(key)
+            self.palette = np.insert(self.palette, code, NO_VALUE_COLOR)
+        return code
+
+    def key_for_code(self, code: int):
+        """Get the label key of a code, or None for NO_CODE."""
+        return None if code == NO_CODE else self.keys[code]
+
+    def set_value(self, location_id: int, key: str) -> int:
+        """
+        Set the label of a location.
+
+        Returns:
+            The new code of the location
+        """
+        code = self.code_for_key(key)
+        self.codes[location_id] = code
+        return code
+
+    def color_of(self, location_id: int) -> int:
+        """Display color of a location as 0xAARRGGBB."""
+        return int(self.palette[self.codes[location_id]])
+
+    def location_colors(self) -> np.ndarray:
+        """Display color of every location ID as 0xAARRGGBB."""
+        return self.palette[self.codes]
+
+    def render_into(self, location_index: LocationIndex, out: np.ndarray):
+        """
+        Render the layer over the location index's label raster.
+
+        Args:
+            location_index: LocationIndex of the map
+            out: Preallocated uint32 array with the shape of the label raster
+        """
+        lut = self.location_colors()
+        label_raster = location_index.label_raster
+        # Gather in row chunks to keep the index temporaries small
+        for row in range(0, location_index.height, INDEX_CHUNK_ROWS):
+            np.take(lut, label_raster[row:row + INDEX_CHUNK_ROWS], out=out[row:row + INDEX_CHUNK_ROWS])
+
+
+def build_feature_layer(feature_type: str, locations: LocationTable, location_index: LocationIndex, labels: dict,
+                        needsConversionToRGB=True, column: CategoricalColumn = None) -> FeatureLayer:
+    """
+    Create a feature layer from a column of the location table.
+
+    Args:
+        feature_type: The type of feature being mapped (climate, topography, etc.)
+        locations: LocationTable of the state regions
+        location_index: LocationIndex of the map
+        labels: Feature labels including colors
+        needsConversionToRGB: Whether label colors are HEX strings
+        column: Column of feature values to use instead of the table's feature_type column
+
+    Returns:
+        FeatureLayer with the code of every location on the map
+    """
+    layer = FeatureLayer(feature_type, labels, len(location_index), needsConversionToRGB)
+    if column is None:
+        column = locations.columns[feature_type]
+    location_ids = locations.location_ids(location_index)
+    on_map = location_ids != NO_VALUE
+    table_codes = column.codes[on_map]
+
+    # Translate the column's categories into layer codes once; empty values get no code
+    lut = np.full(len(column.categories) + 1, NO_CODE, dtype=np.int16)
+    for table_code in np.unique(table_codes[table_codes != NO_VALUE]).tolist():
+        key = column.categories[table_code]
+        if key:
+            lut[table_code] = layer.code_for_key(key)
+    # NO_VALUE (-1) picks the last entry of the table
+    layer.codes[location_ids[on_map]] = lut[table_codes]
+    return layer
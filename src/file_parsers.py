@@ -1,74 +1,101 @@
-import re
-from ast import literal_eval
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
 from os import listdir, path
 
-def parse_states(file_path: str) -> dict:
+from constants import PATH_LOCATION_MAPPINGS, PATH_FEATURE_DETAILS
+from location_mappings import load_location_mapping
+from location_table import LocationTable, NO_VALUE
+from paradox_script import parse_script_file
+
+# State files smaller than this in total are parsed in this process; the tokenizer
+# parses a few MB per second, so worker processes only pay off for far larger folders
+PARALLEL_MIN_BYTES = 32 << 20
+
+# Worker processes for larger folders at most
+MAX_PARSE_WORKERS = 4
+
+
+def parse_state_file(file_path: str) -> list:
+    """
+    Parses one state regions file, keeping only the provinces of each state.
+    Args:
+        file_path: The path to the state regions file.
+    Returns:
+        A list of (state key, list of province IDs) tuples.
+    """
+    states = parse_script_file(file_path, fields={'provinces'})
+    return [(state_key, block['provinces']) for state_key, block in states.items()
+            if isinstance(block, dict) and isinstance(block.get('provinces'), list)]
+
+
+def parse_states(file_path: str, max_workers: int = None) -> dict:
     """
-    Parses a file containing state definitions and creates a province-to-state dictionary.
+    Parses the files containing state definitions and creates the table of locations.
+    Folders of PARALLEL_MIN_BYTES or more are parsed on a small process pool. Its workers
+    are spawned, not forked, since this runs on a thread of the editor's startup.
     Args:
-        file_path: The path to the file containing the state definitions.
+        file_path: The path to the folder containing the state definitions.
+        max_workers: Number of worker processes for large folders, defaults to MAX_PARSE_WORKERS.
     Returns:
-        A dictionary where keys are province IDs and values are state names.
+        A LocationTable with one row per province ID and the name of its state.
     """
 
-    provinces_init: dict = {}
-    # Compile regex patterns once
-    state_pattern = re.compile(r'([A-Z_]+)\s*=\s*\{.*?provinces\s*=\s*\{([^}]*)\}.*?\n\}', re.DOTALL)
-    province_pattern = re.compile(r'"(x[0-9A-F]+)"')
+    location_names: dict = {}
 
     # Use list comprehension for file reading
     files: list[str] = [path.join(file_path, f) for f in listdir(file_path)]
 
-    for fileName in files:
-        with open(fileName, 'r', encoding='utf-8') as file:
-            content = file.read()
+    max_workers = min(len(files), max_workers or min(MAX_PARSE_WORKERS, os.cpu_count()))
+    if max_workers > 1 and sum(path.getsize(f) for f in files) >= PARALLEL_MIN_BYTES:
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            parsed_files = list(pool.map(parse_state_file, files))
+    else:
+        parsed_files = [parse_state_file(fileName) for fileName in files]
 
-        # Use pre-compiled patterns
-        state_blocks = state_pattern.findall(content)
-        for state_name, provinces_str in state_blocks:
+    for states in parsed_files:
+        for state_name, provinces in states:
             # Process provinces in bulk
-            province_dict = {
-                province[1:]: {
-                    'name': state_name[6:],
-                    'x': 0, 'y': 0,
-                    'climate': '',
-                    'topography': '',
-                    'vegetation': ''
-                }
-                for province in province_pattern.findall(provinces_str)
-            }
-            provinces_init.update(province_dict)
+            location_names.update((province[1:], state_name[6:]) for province in provinces)
 
-    return provinces_init
+    return LocationTable.from_dict(location_names)
 
 
 def load_province_V3_terrain_types(filepath: str) -> dict:
     """Loads the color-to-terrain mapping from a file."""
     mapping: dict = {}
-    with open(filepath, 'r') as f:
-        lines: list[str] = [line.strip() for line in f if '=' in line]
-        for line in lines:
-            color_hex, terrain = line.split('=')
-            color_hex = color_hex.lstrip('x')
-            terrain = literal_eval(terrain)  # .strip('\"')
-            mapping[color_hex] = terrain
+    for color_hex, terrain in parse_script_file(filepath).items():
+        mapping[color_hex.lstrip('x')] = terrain
     return mapping
 
 
-def load_location_mappings(filepath: str, featureName: str, dict_locations: dict):
-    """Loads mappings from a CSV file and adds them to dict_locations.
+def load_location_mappings(filepath: str, featureName: str, locations: LocationTable):
+    """Loads mappings from a CSV file and adds them to the locations.
+    
+    The file is parsed in one vectorized pass, or taken from the mapping cache if it hasn't changed.
     
     Args:
         filepath: Path to the CSV file with color,feature mappings
-        featureName: The feature type to add to locations dictionary
-        dict_locations: Dictionary to update with feature data
+        featureName: The feature column to fill
+        locations: LocationTable to update; colors that aren't in it are ignored
     """
-    with open(filepath, 'r', encoding='UTF-8-sig') as f:
-        lines: list[str] = [line.strip() for line in f if ',' in line]
-        for line in lines:
-            color_hex, feature = line.split(',')
-            if color_hex in dict_locations:
-                dict_locations[color_hex][featureName] = feature
+    mapping = load_location_mapping(filepath)
+    column = locations.columns.get(featureName)
+    if column is None:
+        column = locations.columns[featureName] = locations.new_column(featureName)
+    rows = locations.rows_of_keys(mapping.keys)
+    known = rows != NO_VALUE
+    column.set_codes(rows[known], mapping.codes[known], mapping.categories)
+
+
+def location_mapping_path(feature_type: str, config: dict) -> str:
+    """Path of the location mapping CSV of a feature type, given its entry in feature_data.json."""
+    return config['file_details'] if 'file_details' in config else f'{PATH_LOCATION_MAPPINGS}{feature_type}.csv'
+
+
+def feature_details_path(feature_type: str, config: dict) -> str:
+    """Path of the feature details CSV of a non-numerical feature type, given its entry in feature_data.json."""
+    return config['file_data'] if 'file_data' in config else f'{PATH_FEATURE_DETAILS}{feature_type}.csv'
 
 
 def load_province_features(filepath: str) -> dict:
@@ -0,0 +1,324 @@
+"""
+Location index for the map editor.
+
+The locations image is converted once, at load time, into a compact label
+raster where every pixel holds the integer ID of the location it belongs to.
+Everything that used to compare RGB triples against the full image works on
+these IDs instead.
+
+The pixels of every location are also stored in CSR layout: a flat array of
+pixel offsets sorted by location ID, plus per-location start/end offsets into
+it, so a location's pixels can be written without touching the rest of the map.
+Each location's bounding box is kept as well, so the display can be updated
+one rectangle at a time.
+
+The index arrays are cached as uncompressed .npy files, so later launches map
+them in instead of decoding the locations image again.
+"""
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+from auxiliary import rgb_to_hex, get_array_from_image
+from constants import PATH_CACHE
+
+# Number of image rows converted per step when building the index
+INDEX_CHUNK_ROWS = 512
+
+# Bump when the layout of the cached arrays changes
+INDEX_CACHE_VERSION = 1
+
+# Arrays of a LocationIndex stored in the cache, in constructor order
+INDEX_CACHE_ARRAYS = ('label_raster', 'colors', 'pixel_order', 'pixel_offsets', 'bounding_boxes')
+
+
+def pack_rgb(arr: np.ndarray) -> np.ndarray:
+    """
+    Pack the RGB channels of an image array into 24-bit integers.
+
+    Args:
+        arr: Array with the RGB channels in its last dimension
+
+    Returns:
+        uint32 array with one packed color per pixel
+    """
+    return ((arr[..., 0].astype(np.uint32) << 16) |
+            (arr[..., 1].astype(np.uint32) << 8) |
+            arr[..., 2].astype(np.uint32))
+
+
+class LocationIndex:
+    """Label raster of location IDs, the ID <-> color tables and per-location pixel spans."""
+
+    def __init__(self, label_raster: np.ndarray, colors: np.ndarray, pixel_order: np.ndarray,
+                 pixel_offsets: np.ndarray, bounding_boxes: np.ndarray):
+        """
+        Initialize the location index.
+
+        Args:
+            label_raster: 2D array holding the location ID of every pixel
+            colors: Packed 24-bit color of every location ID
+            pixel_order: Flat pixel offsets sorted by location ID
+            pixel_offsets: Start of every location's pixels in pixel_order (length = locations + 1)
+            bounding_boxes: (x0, y0, x1, y1) of every location, with exclusive x1/y1
+        """
+        self.label_raster = label_raster
+        self.colors = colors
+        self.pixel_order = pixel_order
+        self.pixel_offsets = pixel_offsets
+        self.bounding_boxes = bounding_boxes
+        self.height, self.width = label_raster.shape
+
+        # ID -> HEX and HEX -> ID tables
+        self.id_to_hex = [rgb_to_hex(int(c) >> 16, (int(c) >> 8) & 0xFF, int(c) & 0xFF) for c in colors]
+        self.hex_to_id = {hex_code: location_id for location_id, hex_code in enumerate(self.id_to_hex)}
+
+    def __len__(self):
+        return len(self.colors)
+
+    @property
+    def shape(self):
+        return self.label_raster.shape
+
+    def contains(self, x: int, y: int) -> bool:
+        """Check whether a pixel coordinate lies inside the map."""
+        return 0 <= y < self.height and 0 <= x < self.width
+
+    def id_at(self, x: int, y: int):
+        """
+        Get the location ID at a pixel coordinate.
+
+        Returns:
+            Location ID, or None if the coordinate is outside the map
+        """
+        if not self.contains(x, y):
+            return None
+        return int(self.label_raster[y, x])
+
+    def id_for_hex(self, hex_code: str):
+        """Get the location ID of a HEX color, or None if it isn't on the map."""
+        return self.hex_to_id.get(hex_code)
+
+    def rgb_for_id(self, location_id: int) -> tuple:
+        """Get the original RGB color of a location ID."""
+        color = int(self.colors[location_id])
+        return color >> 16, (color >> 8) & 0xFF, color & 0xFF
+
+    def pixels(self, location_id: int) -> np.ndarray:
+        """Flat offsets (y * width + x) of the pixels belonging to a location."""
+        return self.pixel_order[self.pixel_offsets[location_id]:self.pixel_offsets[location_id + 1]]
+
+    def pixels_of(self, location_ids: np.ndarray) -> tuple:
+        """
+        Flat offsets of the pixels of several locations, gathered in one step.
+
+        Returns:
+            Tuple of (pixel offsets, pixel count of every location)
+        """
+        location_ids = np.asarray(location_ids, dtype=np.int64)
+        starts = self.pixel_offsets[location_ids]
+        counts = self.pixel_offsets[location_ids + 1] - starts
+        # Index of every pixel in pixel_order: its span start plus its position within the span
+        span_ends = np.cumsum(counts)
+        positions = np.arange(span_ends[-1] if len(span_ends) else 0) + np.repeat(starts - (span_ends - counts), counts)
+        return self.pixel_order[positions], counts
+
+    def pixel_count(self, location_id: int) -> int:
+        """Number of pixels belonging to a location."""
+        return int(self.pixel_offsets[location_id + 1] - self.pixel_offsets[location_id])
+
+    def bounding_rect(self, location_ids) -> tuple:
+        """
+        Get the bounding rectangle of one or more locations.
+
+        Args:
+            location_ids: A location ID or an iterable of location IDs
+
+        Returns:
+            Tuple of (x, y, width, height), or None if there are no pixels
+        """
+        boxes = self.bounding_boxes[np.atleast_1d(np.asarray(location_ids, dtype=np.int64))]
+        if not len(boxes):
+            return None
+        x0, y0 = boxes[:, 0].min(), boxes[:, 1].min()
+        x1, y1 = boxes[:, 2].max(), boxes[:, 3].max()
+        if x1 <= x0 or y1 <= y0:
+            return None
+        return int(x0), int(y0), int(x1 - x0), int(y1 - y0)
+
+
+def build_pixel_spans(label_raster: np.ndarray, location_count: int) -> tuple:
+    """
+    Build the CSR pixel index of a label raster.
+
+    Args:
+        label_raster: 2D array holding the location ID of every pixel
+        location_count: Number of location IDs
+
+    Returns:
+        Tuple of (pixel_order, pixel_offsets)
+    """
+    flat_labels = label_raster.ravel()
+    counts = np.bincount(flat_labels, minlength=location_count)
+    pixel_offsets = np.zeros(location_count + 1, dtype=np.int64)
+    np.cumsum(counts, out=pixel_offsets[1:])
+
+    # A stable sort keeps every location's pixels in scanline order
+    offset_dtype = np.uint32 if flat_labels.size <= np.iinfo(np.uint32).max else np.int64
+    pixel_order = np.argsort(flat_labels, kind='stable').astype(offset_dtype)
+    return pixel_order, pixel_offsets
+
+
+def build_bounding_boxes(pixel_order: np.ndarray, pixel_offsets: np.ndarray, width: int) -> np.ndarray:
+    """
+    Compute the bounding box of every location from its pixel spans.
+
+    Args:
+        pixel_order: Flat pixel offsets sorted by location ID
+        pixel_offsets: Start of every location's pixels in pixel_order
+        width: Width of the map
+
+    Returns:
+        int32 array of (x0, y0, x1, y1) per location, with exclusive x1/y1
+    """
+    location_count = len(pixel_offsets) - 1
+    boxes = np.zeros((location_count, 4), dtype=np.int32)
+    non_empty = pixel_offsets[1:] > pixel_offsets[:-1]
+    starts = pixel_offsets[:-1][non_empty]
+    ends = pixel_offsets[1:][non_empty]
+
+    # Spans are in scanline order, so the first and last pixels give the row range
+    boxes[non_empty, 1] = pixel_order[starts] // width
+    boxes[non_empty, 3] = pixel_order[ends - 1] // width + 1
+
+    columns = pixel_order % pixel_order.dtype.type(width)
+    boxes[non_empty, 0] = np.minimum.reduceat(columns, starts)
+    boxes[non_empty, 2] = np.maximum.reduceat(columns, starts) + 1
+    return boxes
+
+
+def build_location_index(arr_original: np.ndarray) -> LocationIndex:
+    """
+    Build the location index from the original locations array.
+
+    Colors are packed into 24-bit integers and assigned consecutive IDs in
+    ascending color order through a direct lookup table, so the label raster
+    is built in two linear passes over the image without sorting the pixels.
+
+    Args:
+        arr_original: Original map array (height, width, 3)
+
+    Returns:
+        LocationIndex for the image
+    """
+    height, width = arr_original.shape[:2]
+
+    # First pass: find which colors are present
+    present = np.zeros(1 << 24, dtype=bool)
+    for row in range(0, height, INDEX_CHUNK_ROWS):
+        present[pack_rgb(arr_original[row:row + INDEX_CHUNK_ROWS])] = True
+    colors = np.flatnonzero(present).astype(np.uint32)
+    del present
+
+    # Use the smallest label type that fits every location
+    label_dtype = np.uint16 if len(colors) <= np.iinfo(np.uint16).max + 1 else np.uint32
+    color_to_id = np.zeros(1 << 24, dtype=label_dtype)
+    color_to_id[colors] = np.arange(len(colors), dtype=label_dtype)
+
+    # Second pass: write the label raster
+    label_raster = np.empty((height, width), dtype=label_dtype)
+    for row in range(0, height, INDEX_CHUNK_ROWS):
+        label_raster[row:row + INDEX_CHUNK_ROWS] = color_to_id[pack_rgb(arr_original[row:row + INDEX_CHUNK_ROWS])]
+
+    pixel_order, pixel_offsets = build_pixel_spans(label_raster, len(colors))
+    bounding_boxes = build_bounding_boxes(pixel_order, pixel_offsets, width)
+    return LocationIndex(label_raster, colors, pixel_order, pixel_offsets, bounding_boxes)
+
+
+def get_index_cache_dir(locations_file: str, cache_dir: str = PATH_CACHE) -> str:
+    """Get the cache folder of a locations image, keyed on its absolute path."""
+    path_hash = hashlib.sha1(os.path.abspath(locations_file).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache_dir, f'location_index_{path_hash}')
+
+
+def get_index_cache_key(locations_file: str) -> dict:
+    """Get the values that must match for a cached index to be reused."""
+    stat = os.stat(locations_file)
+    return {
+        'path': os.path.abspath(locations_file),
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'version': INDEX_CACHE_VERSION
+    }
+
+
+def save_location_index(location_index: LocationIndex, index_dir: str, cache_key: dict):
+    """
+    Save the arrays of a location index as uncompressed .npy files.
+
+    The files are written to a temporary folder which then replaces the old
+    cache, so an interrupted save never leaves a half-written cache behind.
+    """
+    temp_dir = f'{index_dir}.tmp'
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    os.makedirs(temp_dir)
+    for name in INDEX_CACHE_ARRAYS:
+        np.save(os.path.join(temp_dir, f'{name}.npy'), getattr(location_index, name))
+    # The key is written last, it marks the cache as complete
+    with open(os.path.join(temp_dir, 'key.json'), 'w', encoding='utf-8') as f:
+        json.dump(cache_key, f)
+
+    shutil.rmtree(index_dir, ignore_errors=True)
+    os.replace(temp_dir, index_dir)
+
+
+def load_location_index(index_dir: str, cache_key: dict):
+    """
+    Map a cached location index into memory.
+
+    Returns:
+        LocationIndex backed by read-only memory-mapped arrays, or None if the
+        cache is missing or was built from a different file
+    """
+    try:
+        with open(os.path.join(index_dir, 'key.json'), 'r', encoding='utf-8') as f:
+            if json.load(f) != cache_key:
+                return None
+        arrays = [np.load(os.path.join(index_dir, f'{name}.npy'), mmap_mode='r') for name in INDEX_CACHE_ARRAYS]
+    except (OSError, ValueError) as e:
+        print(f"Could not load cached location index from {index_dir}: {e}")
+        return None
+    return LocationIndex(*arrays)
+
+
+def load_or_build_location_index(locations_file: str, cache_dir: str = PATH_CACHE) -> LocationIndex:
+    """
+    Get the location index of a locations image, using the cache when it is up to date.
+
+    The cache is keyed on the image's path, modification time and size. When
+    it doesn't match, the image is decoded, the index is built and the cache
+    is rewritten.
+
+    Args:
+        locations_file: Path of the locations image
+        cache_dir: Folder holding the cached indices
+
+    Returns:
+        LocationIndex of the image
+    """
+    index_dir = get_index_cache_dir(locations_file, cache_dir)
+    cache_key = get_index_cache_key(locations_file)
+    location_index = load_location_index(index_dir, cache_key)
+    if location_index is not None:
+        print(f"Loaded cached location index from {index_dir}")
+        return location_index
+
+    location_index = build_location_index(get_array_from_image(locations_file))
+    try:
+        save_location_index(location_index, index_dir, cache_key)
+    except OSError as e:
+        print(f"Could not cache location index to {index_dir}: {e}")
+    return location_index
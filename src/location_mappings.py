@@ -0,0 +1,170 @@
+"""
+Bulk loading of location mapping files.
+
+A mapping file holds one `HEX,value` line per location (location_climate.csv,
+...). It is read in one pass: the file is split with bytes operations, the HEX
+colors are packed into 24-bit integers with array arithmetic and the values
+are turned into codes into a list of distinct values.
+
+The parsed arrays are cached as an .npz file in the cache folder, keyed on the
+CSV's modification time and size, so later launches skip the parsing.
+"""
+import codecs
+import hashlib
+import os
+
+import numpy as np
+
+from constants import PATH_CACHE
+
+# Bump when the layout of the cached arrays changes
+MAPPING_CACHE_VERSION = 1
+
+# Packed key of a HEX color that isn't six hexadecimal digits; never matches a location
+INVALID_KEY = np.uint32(0xFFFFFFFF)
+
+# Value of every ASCII character as a hexadecimal digit, -1 for other characters
+HEX_DIGIT_VALUES = np.full(256, -1, dtype=np.int32)
+for digits, first_value in ((b'0123456789', 0), (b'ABCDEF', 10), (b'abcdef', 10)):
+    HEX_DIGIT_VALUES[np.frombuffer(digits, dtype=np.uint8)] = np.arange(first_value, first_value + len(digits))
+
+
+class LocationMapping:
+    """Parsed mapping file: packed HEX keys, value codes and the distinct values."""
+
+    def __init__(self, keys: np.ndarray, codes: np.ndarray, categories: list):
+        """
+        Args:
+            keys: Packed HEX color of every line, as uint32
+            codes: Index into categories of every line's value, as int16
+            categories: Distinct values of the file
+        """
+        self.keys = keys
+        self.codes = codes
+        self.categories = categories
+
+    def __len__(self):
+        return len(self.keys)
+
+
+def pack_hex_colors(hexes) -> np.ndarray:
+    """
+    Pack HEX color strings into 24-bit integers without a per-string loop.
+
+    Args:
+        hexes: Sequence of 'RRGGBB' strings or bytes
+
+    Returns:
+        uint32 array of 0xRRGGBB values; INVALID_KEY for strings that aren't six hex digits
+    """
+    if not len(hexes):
+        return np.empty(0, dtype=np.uint32)
+    encoded = np.array(hexes, dtype='S')
+    if encoded.dtype.itemsize < 6:
+        return np.full(len(encoded), INVALID_KEY, dtype=np.uint32)
+    # One row of ASCII codes per string; shorter strings are padded with zero bytes
+    characters = encoded.view(np.uint8).reshape(len(encoded), encoded.dtype.itemsize)
+    digits = HEX_DIGIT_VALUES[characters[:, :6]]
+    valid = np.all(digits >= 0, axis=1)
+    if encoded.dtype.itemsize > 6:
+        valid &= np.all(characters[:, 6:] == 0, axis=1)
+    keys = np.zeros(len(encoded), dtype=np.uint32)
+    for position in range(6):
+        keys = (keys << 4) | digits[:, position].astype(np.uint32)
+    keys[~valid] = INVALID_KEY
+    return keys
+
+
+def parse_location_mapping(file_path: str) -> LocationMapping:
+    """
+    Parse a mapping file in one pass.
+
+    Lines without a comma are skipped, like the line-by-line loader did.
+
+    Args:
+        file_path: Path of the CSV file with HEX,value lines
+
+    Returns:
+        LocationMapping of the file's lines, in file order
+    """
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    if data.startswith(codecs.BOM_UTF8):
+        data = data[len(codecs.BOM_UTF8):]
+
+    lines = [line for line in data.split(b'\n') if b',' in line]
+    fields = b','.join(lines).split(b',')
+    if len(fields) != 2 * len(lines):
+        raise ValueError(f"{file_path} has lines with more than one comma")
+
+    keys = pack_hex_colors([field.strip() for field in fields[0::2]])
+    values = np.array([field.strip() for field in fields[1::2]], dtype=object)
+    distinct, codes = np.unique(values, return_inverse=True) if len(values) else ([], np.empty(0, np.intp))
+    return LocationMapping(keys, codes.astype(np.int16), [value.decode('utf-8') for value in distinct])
+
+
+def get_mapping_cache_file(file_path: str, cache_dir: str = PATH_CACHE) -> str:
+    """Get the cache file of a mapping file, keyed on its absolute path."""
+    path_hash = hashlib.sha1(os.path.abspath(file_path).encode('utf-8')).hexdigest()[:16]
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    return os.path.join(cache_dir, 'mappings', f'{name}_{path_hash}.npz')
+
+
+def get_mapping_cache_key(file_path: str) -> np.ndarray:
+    """Get the values that must match for a cached mapping to be reused."""
+    stat = os.stat(file_path)
+    return np.array([stat.st_mtime_ns, stat.st_size, MAPPING_CACHE_VERSION], dtype=np.int64)
+
+
+def save_location_mapping(mapping: LocationMapping, cache_file: str, cache_key: np.ndarray):
+    """Save a parsed mapping as an .npz file, replacing the old one only once it is complete."""
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    temp_file = f'{cache_file}.tmp'
+    with open(temp_file, 'wb') as f:
+        np.savez(f, key=cache_key, keys=mapping.keys, codes=mapping.codes,
+                 categories=np.array(mapping.categories, dtype=str))
+    os.replace(temp_file, cache_file)
+
+
+def load_cached_location_mapping(cache_file: str, cache_key: np.ndarray):
+    """
+    Load a cached mapping.
+
+    Returns:
+        LocationMapping, or None if the cache is missing or was built from a different file
+    """
+    try:
+        with np.load(cache_file) as cached:
+            if not np.array_equal(cached['key'], cache_key):
+                return None
+            return LocationMapping(cached['keys'], cached['codes'], cached['categories'].tolist())
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Could not load cached mapping from {cache_file}: {e}")
+        return None
+
+
+def load_location_mapping(file_path: str, cache_dir: str = PATH_CACHE) -> LocationMapping:
+    """
+    Get the parsed lines of a mapping file, using the cache when it is up to date.
+
+    Args:
+        file_path: Path of the CSV file with HEX,value lines
+        cache_dir: Folder holding the cached mappings
+
+    Returns:
+        LocationMapping of the file
+    """
+    cache_file = get_mapping_cache_file(file_path, cache_dir)
+    cache_key = get_mapping_cache_key(file_path)
+    mapping = load_cached_location_mapping(cache_file, cache_key)
+    if mapping is not None:
+        return mapping
+
+    mapping = parse_location_mapping(file_path)
+    try:
+        save_location_mapping(mapping, cache_file, cache_key)
+    except OSError as e:
+        print(f"Could not cache mapping to {cache_file}: {e}")
+    return mapping
@@ -0,0 +1,191 @@
+"""
+Location search for the map editor.
+
+State names are kept in a sorted index, so prefix matches are found by
+bisection; substring and fuzzy (subsequence) matches are ranked after them.
+Locations can also be found by HEX color or by "x, y" pixel coordinates.
+Centroids of every location are computed once from the label raster, the
+first time they are needed.
+"""
+import re
+from bisect import bisect_left
+
+import numpy as np
+
+from location_index import LocationIndex, INDEX_CHUNK_ROWS
+from location_table import LocationTable, NO_VALUE
+
+# Maximum number of results returned by a search
+MAX_SEARCH_RESULTS = 20
+
+# Smallest area, in pixels, the view zooms to when jumping to a location
+MIN_FIT_SIZE = 64
+
+HEX_PATTERN = re.compile(r'^#?([0-9A-Fa-f]{6})$')
+COORDINATES_PATTERN = re.compile(r'^(\d+)\s*[,; ]\s*(\d+)$')
+
+
+def compute_centroids(location_index: LocationIndex) -> np.ndarray:
+    """
+    Compute the centroid of every location in one pass over the label raster.
+
+    Args:
+        location_index: LocationIndex of the map
+
+    Returns:
+        float64 array of (x, y) per location ID; NaN for locations without pixels
+    """
+    location_count = len(location_index)
+    sums_x = np.zeros(location_count)
+    sums_y = np.zeros(location_count)
+    columns = np.arange(location_index.width, dtype=np.float64)
+    for row in range(0, location_index.height, INDEX_CHUNK_ROWS):
+        labels = location_index.label_raster[row:row + INDEX_CHUNK_ROWS]
+        sums_x += np.bincount(labels.ravel(), weights=np.tile(columns, labels.shape[0]), minlength=location_count)
+        rows = np.arange(row, row + labels.shape[0], dtype=np.float64)
+        sums_y += np.bincount(labels.ravel(), weights=np.repeat(rows, labels.shape[1]), minlength=location_count)
+
+    counts = np.diff(location_index.pixel_offsets).astype(np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Pixel centers are at +0.5
+        return np.stack([sums_x / counts + 0.5, sums_y / counts + 0.5], axis=1)
+
+
+def fuzzy_score(query: str, name: str):
+    """
+    Score how well a query matches a name; lower is better.
+
+    Returns:
+        0 for a prefix match, 1 for a match at the start of a word, 2 for a
+        substring match, 3 plus the number of skipped characters when the query's
+        characters appear in order, or None if the name doesn't match
+    """
+    if name.startswith(query):
+        return 0
+    position = name.find(query)
+    if position > 0:
+        return 1 if name[position - 1] in '_ ' else 2
+    # Subsequence match, e.g. "nitl" for "northern_italy"
+    skipped = 0
+    position = 0
+    for character in query:
+        found = name.find(character, position)
+        if found < 0:
+            return None
+        skipped += found - position
+        position = found + 1
+    return 3 + skipped
+
+
+class LocationSearch:
+    """Name, HEX and coordinate search over the locations of the map."""
+
+    def __init__(self, location_index: LocationIndex, locations: LocationTable):
+        """
+        Build the name index.
+
+        Args:
+            location_index: LocationIndex of the map
+            locations: LocationTable of the state regions
+        """
+        self.location_index = location_index
+        self._centroids = None
+
+        # State name -> IDs of its locations on the map, grouped by sorting the name codes
+        location_ids = locations.location_ids(location_index)
+        on_map = location_ids != NO_VALUE
+        name_codes = locations.names.codes[on_map]
+        order = np.argsort(name_codes, kind='stable')
+        name_codes, location_ids = name_codes[order], location_ids[on_map][order]
+        states = {}
+        if len(name_codes):
+            starts = np.flatnonzero(np.r_[True, name_codes[1:] != name_codes[:-1]])
+            for start, ids in zip(starts.tolist(), np.split(location_ids, starts[1:])):
+                states[locations.names.categories[name_codes[start]]] = ids.tolist()
+        self.state_locations = states
+        # Sorted lowercase names for prefix bisection, with the original names alongside
+        self.sorted_names = sorted((name.lower(), name) for name in states)
+        self.sorted_keys = [key for key, _ in self.sorted_names]
+
+    @property
+    def centroids(self) -> np.ndarray:
+        if self._centroids is None:
+            self._centroids = compute_centroids(self.location_index)
+        return self._centroids
+
+    def search(self, text: str, limit: int = MAX_SEARCH_RESULTS) -> list:
+        """
+        Find locations and states matching a query.
+
+        Args:
+            text: State name (or part of it), HEX color or "x, y" coordinates
+            limit: Maximum number of results
+
+        Returns:
+            List of dicts with a 'label' and the 'location_ids' to show, best match first
+        """
+        text = text.strip()
+        if not text:
+            return []
+        results = []
+
+        # Jump by HEX color
+        hex_match = HEX_PATTERN.match(text)
+        if hex_match:
+            location_id = self.location_index.id_for_hex(hex_match.group(1).upper())
+            if location_id is not None:
+                results.append({'label': f"Location {hex_match.group(1).upper()}", 'location_ids': [location_id]})
+
+        # Jump by pixel coordinates
+        coordinates_match = COORDINATES_PATTERN.match(text)
+        if coordinates_match:
+            x, y = int(coordinates_match.group(1)), int(coordinates_match.group(2))
+            location_id = self.location_index.id_at(x, y)
+            if location_id is not None:
+                results.append({'label': f"Location {self.location_index.id_to_hex[location_id]} at {x}, {y}",
+                                'location_ids': [location_id]})
+
+        query = text.lower().replace(' ', '_')
+        # Prefix matches come from a contiguous range of the sorted names
+        start = bisect_left(self.sorted_keys, query)
+        end = start
+        while end < len(self.sorted_keys) and self.sorted_keys[end].startswith(query):
+            end += 1
+        prefix_names = [name for _, name in self.sorted_names[start:end]]
+
+        # Other matches need a scan, ranked by score and then by name
+        scored = []
+        if len(prefix_names) < limit:
+            for key, name in self.sorted_names[:start] + self.sorted_names[end:]:
+                score = fuzzy_score(query, key)
+                if score is not None:
+                    scored.append((score, key, name))
+            scored.sort()
+
+        for name in prefix_names + [name for _, _, name in scored]:
+            if len(results) >= limit:
+                break
+            results.append({'label': f"State {name}", 'location_ids': self.state_locations[name]})
+        return results[:limit]
+
+    def focus_rect(self, location_ids) -> tuple:
+        """
+        Get the rectangle to zoom to for a search result.
+
+        The bounding box of the locations is grown around their centroid to at
+        least MIN_FIT_SIZE pixels, so tiny locations don't fill the whole view.
+
+        Returns:
+            Tuple of (x, y, width, height), or None if the locations have no pixels
+        """
+        rect = self.location_index.bounding_rect(location_ids)
+        if rect is None:
+            return None
+        x, y, width, height = rect
+        if width >= MIN_FIT_SIZE and height >= MIN_FIT_SIZE:
+            return rect
+
+        counts = np.diff(self.location_index.pixel_offsets)[location_ids]
+        center_x, center_y = np.average(self.centroids[location_ids], axis=0, weights=counts)
+        width, height = max(width, MIN_FIT_SIZE), max(height, MIN_FIT_SIZE)
+        return float(center_x - width / 2), float(center_y - height / 2), width, height
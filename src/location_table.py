@@ -0,0 +1,344 @@
+"""
+Columnar table of the locations parsed from the state regions.
+
+Every location is one row: its HEX color, an interned state name and one
+categorical code per feature type, all kept in numpy arrays instead of one
+dict per location. Feature values are stored as codes into a per-column list
+of categories, so a column costs two bytes per location.
+
+The table can still be used like the old dictionary of location dicts
+(`locations[hex][feature] = value`, `.items()`, `in`, ...) through row views,
+while bulk loads, edits and exports go through the vectorized methods.
+"""
+from collections.abc import MutableMapping
+
+import numpy as np
+
+from location_mappings import LocationMapping, pack_hex_colors, INVALID_KEY
+
+# Code of a row without a value in a column
+NO_VALUE = -1
+
+# Feature columns every location starts with, empty until their mappings are loaded
+DEFAULT_FEATURE_COLUMNS = ('climate', 'topography', 'vegetation')
+
+# Columns that aren't feature values and aren't exported
+BASE_COLUMNS = ('name', 'x', 'y')
+
+
+def concatenate_segments(segments: list) -> tuple:
+    """
+    Join byte strings into one blob, remembering where each one is.
+
+    Returns:
+        Tuple of (blob, start of every segment, length of every segment)
+    """
+    lengths = np.fromiter(map(len, segments), dtype=np.int64, count=len(segments))
+    return b''.join(segments), np.cumsum(lengths) - lengths, lengths
+
+
+class CategoricalColumn:
+    """One code per row into a list of distinct values."""
+
+    def __init__(self, row_count: int, dtype=np.int16, fill: str = None):
+        """
+        Initialize a column.
+
+        Args:
+            row_count: Number of rows
+            dtype: Integer type of the codes
+            fill: Value of every row, or None to start without values
+        """
+        self.categories = []
+        self.category_to_code = {}
+        self.codes = np.full(row_count, NO_VALUE, dtype=dtype)
+        if fill is not None:
+            self.codes[:] = self.intern(fill)
+
+    def intern(self, value: str) -> int:
+        """Get the code of a value, adding it to the categories if needed."""
+        code = self.category_to_code.get(value)
+        if code is None:
+            code = self.category_to_code[value] = len(self.categories)
+            self.categories.append(value)
+        return code
+
+    def set_codes(self, rows, codes, categories: list):
+        """
+        Set the values of many rows from codes into another list of categories.
+
+        Args:
+            rows: Row numbers
+            codes: Index into categories of every row's new value
+            categories: Values the codes refer to
+        """
+        lut = np.fromiter((self.intern(value) for value in categories), dtype=self.codes.dtype, count=len(categories))
+        self.codes[np.asarray(rows, dtype=np.int64)] = lut[np.asarray(codes, dtype=np.int64)]
+
+    def get(self, row: int):
+        """Get the value of a row, or None if it has no value."""
+        code = self.codes[row]
+        return None if code == NO_VALUE else self.categories[code]
+
+    def set_values(self, rows, values):
+        """
+        Set the values of many rows.
+
+        Args:
+            rows: Row numbers
+            values: New value of every row; None removes the value
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        self.codes[rows] = np.fromiter((NO_VALUE if value is None else self.intern(value) for value in values),
+                                       dtype=self.codes.dtype, count=len(rows))
+
+    def values(self) -> np.ndarray:
+        """Value of every row as an object array; None where there is no value."""
+        lut = np.array(self.categories + [None], dtype=object)
+        return lut[self.codes]
+
+
+class LocationTable:
+    """Locations of the state regions as rows of typed columns."""
+
+    def __init__(self, hexes: list, names: list, feature_columns=DEFAULT_FEATURE_COLUMNS):
+        """
+        Build the table.
+
+        Args:
+            hexes: HEX color of every location
+            names: State name of every location
+            feature_columns: Feature columns to create, with an empty value for every row
+        """
+        self.hexes = list(hexes)
+        self.hex_to_row = {hex_code: row for row, hex_code in enumerate(self.hexes)}
+        row_count = len(self.hexes)
+        self.names = CategoricalColumn(row_count, np.int32)
+        self.names.set_values(np.arange(row_count), names)
+        self.x = np.zeros(row_count, dtype=np.int32)
+        self.y = np.zeros(row_count, dtype=np.int32)
+        self.columns = {feature_type: CategoricalColumn(row_count, fill='') for feature_type in feature_columns}
+        self._location_ids = None
+        self._sorted_keys = None
+        self._hex_prefixes = None
+
+    @classmethod
+    def from_dict(cls, location_names: dict, feature_columns=DEFAULT_FEATURE_COLUMNS):
+        """Build the table from a dictionary of HEX -> state name."""
+        return cls(location_names.keys(), list(location_names.values()), feature_columns)
+
+    def __len__(self):
+        return len(self.hexes)
+
+    def __contains__(self, hex_code):
+        return hex_code in self.hex_to_row
+
+    def __iter__(self):
+        return iter(self.hexes)
+
+    def __getitem__(self, hex_code):
+        return LocationRow(self, self.hex_to_row[hex_code])
+
+    def get(self, hex_code, default=None):
+        row = self.hex_to_row.get(hex_code)
+        return default if row is None else LocationRow(self, row)
+
+    def keys(self):
+        return self.hex_to_row.keys()
+
+    def values(self):
+        return (LocationRow(self, row) for row in range(len(self.hexes)))
+
+    def items(self):
+        return ((hex_code, LocationRow(self, row)) for row, hex_code in enumerate(self.hexes))
+
+    def rows_of(self, hexes) -> np.ndarray:
+        """Row of every HEX color, NO_VALUE for unknown colors."""
+        return np.fromiter((self.hex_to_row.get(hex_code, NO_VALUE) for hex_code in hexes),
+                           dtype=np.int64, count=len(hexes))
+
+    def rows_of_keys(self, keys: np.ndarray) -> np.ndarray:
+        """Row of every packed HEX color (see pack_hex_colors), NO_VALUE for unknown colors."""
+        if self._sorted_keys is None:
+            row_keys = pack_hex_colors(self.hexes)
+            order = np.argsort(row_keys, kind='stable')
+            self._sorted_keys = (row_keys[order], order)
+        sorted_keys, order = self._sorted_keys
+        if not len(sorted_keys):
+            return np.full(len(keys), NO_VALUE, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+        found = (sorted_keys[positions] == keys) & (keys != INVALID_KEY)
+        return np.where(found, order[positions], NO_VALUE)
+
+    def column_from_mapping(self, feature_type: str, mapping: LocationMapping) -> CategoricalColumn:
+        """
+        Create a feature column from a parsed mapping file, to add with set_column.
+
+        Lines of colors outside the table are ignored; a color listed twice keeps its last value.
+        """
+        rows = self.rows_of_keys(mapping.keys)
+        known = rows != NO_VALUE
+        column = self.new_column(feature_type)
+        column.set_codes(rows[known], mapping.codes[known], mapping.categories)
+        return column
+
+    def location_ids(self, location_index) -> np.ndarray:
+        """
+        Location ID of every row in a location index, NO_VALUE for rows not on the map.
+
+        The result is computed once per location index.
+        """
+        if self._location_ids is None or self._location_ids[0] is not location_index:
+            ids = np.fromiter((NO_VALUE if location_id is None else location_id
+                               for location_id in map(location_index.id_for_hex, self.hexes)),
+                              dtype=np.int64, count=len(self.hexes))
+            self._location_ids = (location_index, ids)
+        return self._location_ids[1]
+
+    def rows_for_location_ids(self, location_index, location_ids) -> np.ndarray:
+        """Row of every location ID of a location index, NO_VALUE for locations outside every state."""
+        row_ids = self.location_ids(location_index)
+        lut = np.full(len(location_index), NO_VALUE, dtype=np.int64)
+        on_map = row_ids != NO_VALUE
+        lut[row_ids[on_map]] = np.flatnonzero(on_map)
+        return lut[np.asarray(location_ids, dtype=np.int64)]
+
+    def new_column(self, feature_type: str = None) -> CategoricalColumn:
+        """
+        Create a feature column for this table, to fill before set_column.
+
+        Default feature columns start with an empty value in every row, like at parsing;
+        other columns start without values.
+        """
+        return CategoricalColumn(len(self.hexes), fill='' if feature_type in DEFAULT_FEATURE_COLUMNS else None)
+
+    def set_column(self, feature_type: str, column: CategoricalColumn):
+        """Add or replace a feature column."""
+        self.columns[feature_type] = column
+
+    def drop_column(self, feature_type: str):
+        """Remove a feature column and free its codes."""
+        self.columns.pop(feature_type, None)
+
+    def set_values(self, feature_type: str, rows, values):
+        """Set the values of many rows of a feature column, creating the column if needed."""
+        column = self.columns.get(feature_type)
+        if column is None:
+            column = self.columns[feature_type] = self.new_column(feature_type)
+        valid = np.asarray(rows) != NO_VALUE
+        column.set_values(np.asarray(rows)[valid], np.asarray(values, dtype=object)[valid])
+
+    def snapshot_column(self, feature_type: str) -> tuple:
+        """
+        Copy the codes and categories of a feature column.
+
+        The copy can be formatted with format_column_csv on another thread while the column is edited.
+
+        Returns:
+            Tuple of (codes, categories)
+        """
+        column = self.columns[feature_type]
+        return column.codes.copy(), list(column.categories)
+
+    def format_column_csv(self, codes: np.ndarray, categories: list) -> bytes:
+        """
+        Format the `HEX,value` lines of the rows with a value, without a per-row Python loop.
+
+        The "HEX," prefixes of all rows and the "value\\n" suffixes of all categories
+        are kept as two UTF-8 blobs; the lines are gathered from them with one index array.
+
+        Args:
+            codes: Code of every row into categories, NO_VALUE for rows without a value
+            categories: Values of the codes
+
+        Returns:
+            UTF-8 content of the CSV file
+        """
+        if self._hex_prefixes is None:
+            self._hex_prefixes = concatenate_segments([f"{hex_code},".encode('utf-8') for hex_code in self.hexes])
+        prefix_blob, prefix_starts, prefix_lengths = self._hex_prefixes
+        value_blob, value_starts, value_lengths = concatenate_segments(
+            [f"{value}\n".encode('utf-8') for value in categories])
+
+        rows = np.flatnonzero(codes != NO_VALUE)
+        row_codes = codes[rows]
+        # Every line is its prefix segment then its value segment, in one blob
+        blob = np.frombuffer(prefix_blob + value_blob, dtype=np.uint8)
+        starts = np.column_stack((prefix_starts[rows], value_starts[row_codes] + len(prefix_blob))).ravel()
+        lengths = np.column_stack((prefix_lengths[rows], value_lengths[row_codes])).ravel()
+        output_starts = np.cumsum(lengths) - lengths
+        indexes = np.arange(int(lengths.sum())) + np.repeat(starts - output_starts, lengths)
+        return blob[indexes].tobytes()
+
+    def write_column_csv(self, feature_type: str, file_path: str) -> int:
+        """
+        Write the `HEX,value` lines of the rows with a value in a feature column.
+
+        Returns:
+            Number of lines written
+        """
+        column = self.columns[feature_type]
+        with open(file_path, 'wb') as f:
+            f.write(self.format_column_csv(column.codes, column.categories))
+        return int(np.count_nonzero(column.codes != NO_VALUE))
+
+    def exported_columns(self) -> list:
+        """Feature columns with at least one value."""
+        return [feature_type for feature_type, column in self.columns.items() if np.any(column.codes != NO_VALUE)]
+
+    @property
+    def nbytes(self) -> int:
+        return (self.names.codes.nbytes + self.x.nbytes + self.y.nbytes
+                + sum(column.codes.nbytes for column in self.columns.values()))
+
+
+class LocationRow(MutableMapping):
+    """Dict-like view of one row, for code written against the old location dicts."""
+
+    __slots__ = ('table', 'row')
+
+    def __init__(self, table: LocationTable, row: int):
+        self.table = table
+        self.row = row
+
+    def __getitem__(self, key):
+        if key == 'name':
+            return self.table.names.get(self.row)
+        if key == 'x':
+            return int(self.table.x[self.row])
+        if key == 'y':
+            return int(self.table.y[self.row])
+        column = self.table.columns.get(key)
+        value = None if column is None else column.get(self.row)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key == 'name':
+            self.table.names.codes[self.row] = self.table.names.intern(value)
+        elif key in ('x', 'y'):
+            getattr(self.table, key)[self.row] = value
+        else:
+            column = self.table.columns.get(key)
+            if column is None:
+                column = self.table.columns[key] = self.table.new_column(key)
+            column.codes[self.row] = column.intern(value)
+
+    def __delitem__(self, key):
+        column = self.table.columns.get(key)
+        if key in BASE_COLUMNS or column is None or column.codes[self.row] == NO_VALUE:
+            raise KeyError(key)
+        column.codes[self.row] = NO_VALUE
+
+    def __iter__(self):
+        yield from BASE_COLUMNS
+        for feature_type, column in self.table.columns.items():
+            if column.codes[self.row] != NO_VALUE:
+                yield feature_type
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return repr(dict(self))
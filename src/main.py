@@ -2,23 +2,20 @@ import sys
 import time
 import os
 
-from PyQt5.QtWidgets import QApplication
+from PyQt5.QtWidgets import QApplication, QMessageBox
 from PyQt5.QtGui import QIcon
 import numpy as np
 
-from constants import (
-    PATH_RES, FILE_TXT_TERRAINS, PATH_LOCATION_MAPPINGS, 
-    PATH_FEATURE_DETAILS, FILE_FEATURE_DATA, LABELS_SUITABILITY
-)
-from file_parsers import (
-    parse_states, load_province_V3_terrain_types, 
-    load_location_mappings, load_province_features, load_feature_data
-)
-from map_utils import construct_map_from_mapping, generate_numerical_feature_labels
+from autosave import find_autosave_files, read_autosave_file, get_autosave_layers, remove_autosave_file
+from constants import PATH_RES, FILE_TXT_TERRAINS, FILE_FEATURE_DATA
+from file_parsers import parse_states, load_province_V3_terrain_types, load_feature_data
 from project_manager import apply_imported_changes
 from settings_manager import SettingsManager
-from ui_utils import show_error_dialog
-from auxiliary import get_array_from_image, resetTimer, convert_key_string_to_qt
+from ui_utils import show_error_dialog, create_progress_dialog
+from auxiliary import convert_key_string_to_qt
+from location_index import load_or_build_location_index
+from LayerLoader import load_layer
+from startup_loader import StartupGraph
 from MapEditor import MapEditor
 from StartupWindow import StartupWindow
 
@@ -78,74 +75,90 @@ def main():
     
         start_time = time.time()
     
-        # Pre-load all required data
-        time_task = resetTimer('Starting state parsing...')
-        dict_locations = parse_states(state_regions_path)
-        print(f"State parsing completed in {time.time() - time_task:.2f} seconds")
-    
-        time_task = resetTimer('Loading V3 province terrains...')
-        location_to_v3TerrainType = load_province_V3_terrain_types(FILE_TXT_TERRAINS)
-        print(f"V3 province terrains loaded in {time.time() - time_task:.2f} seconds")
-    
         # Load feature data from JSON
         feature_data = load_feature_data(FILE_FEATURE_DATA)
+        enabled_maps = [feature_type for feature_type in feature_data if feature_type in enabled_maps]
     
-        time_task = resetTimer('Loading feature details and data...')
-        for feature_type, config in feature_data.items():
-            # Only load feature mappings for enabled maps
-            if feature_type in enabled_maps:
-                isNumerical = config['isNumerical']
-                filePath = config['file_details'] if 'file_details' in config else f'{PATH_LOCATION_MAPPINGS}{feature_type}.csv'
-                load_location_mappings(filePath, feature_type, dict_locations)
-    
-                if not isNumerical:
-                    filePath = config['file_data'] if 'file_data' in config else f'{PATH_FEATURE_DETAILS}{feature_type}.csv'
-                    feature_data[feature_type]['labels'] = load_province_features(filePath)
-                else:
-                    feature_data[feature_type]['labels'] = generate_numerical_feature_labels(LABELS_SUITABILITY)
+        # Offer to recover the edits of a session that didn't exit cleanly, the newest one first;
+        # the files of other crashed sessions are kept and offered at the next startups
+        autosave_files = [] if imported_project else find_autosave_files()
+        recovered_file = autosave_files[0] if autosave_files else None
+        recovered_records = None
+        if recovered_file:
+            message = 'The editor did not close properly last time. Do you want to recover its unsaved edits?'
+            if len(autosave_files) > 1:
+                message += f'\n\n{len(autosave_files) - 1} more crashed sessions will be offered at the next start.'
+            reply = QMessageBox.question(
+                None, 'Recover Edits',
+                message,
+                QMessageBox.Yes | QMessageBox.No,
+                QMessageBox.Yes
+            )
+            if reply == QMessageBox.Yes:
+                recovered_records = read_autosave_file(recovered_file)
+            if recovered_records:
+                # The recovered edits need their maps loaded
+                recovered_maps = get_autosave_layers(recovered_records)
+                enabled_maps = [feature_type for feature_type in feature_data
+                                if feature_type in enabled_maps or feature_type in recovered_maps]
             else:
-                # For disabled maps, initialize empty labels to avoid errors
-                feature_data[feature_type]['labels'] = {}
-                print(f"Skipping feature data loading for {feature_type} (not enabled)")
+                remove_autosave_file(recovered_file)
+
+        # The editor opens once the first map is ready; an imported project needs all its maps to apply its changes
+        if recovered_records:
+            startup_maps = enabled_maps
+        elif imported_project:
+            startup_maps = enabled_maps
+        elif default_map_type in enabled_maps:
+            startup_maps = [default_map_type]
+        else:
+            startup_maps = enabled_maps[:1]
     
-        print(f"Feature details and data loaded in {time.time() - time_task:.2f} seconds")
+        # Independent steps run concurrently; each layer waits for the states and the location index
+        graph = StartupGraph()
+        graph.add('states', 'State parsing', lambda: parse_states(state_regions_path))
+        graph.add('terrains', 'V3 province terrains', lambda: load_province_V3_terrain_types(FILE_TXT_TERRAINS))
+        # Map the cached location index in, or decode the locations image and build it
+        graph.add('location_index', 'Location index', lambda: load_or_build_location_index(locations_file))
+        for feature_type in startup_maps:
+            graph.add(feature_type, f"{feature_data[feature_type]['display_name']} layer",
+                      lambda states, index, f=feature_type: load_layer(f, feature_data[f], states, index),
+                      depends_on=('states', 'location_index'))
     
-        time_task = resetTimer('Getting array from locations image...')
-        arr_original = get_array_from_image(locations_file)
+        progress, progress_message = create_progress_dialog(None, "Loading", "Starting...", modal=False)
+        progress.show()
     
-        # Create feature maps
-        feature_pixmaps = {}
-        for feature_type, config in feature_data.items():
-            # Only load enabled maps
-            if feature_type in enabled_maps:
-                time_task = resetTimer(f'Creating {feature_type} map...')
-                
-                # Create feature labels map
-                feature_labels = None
-                if not config['isNumerical']:
-                    feature_labels = feature_data[feature_type]['labels']
-                
-                # Construct the map with explicit feature_type parameter
-                feature_pixmaps[feature_type] = construct_map_from_mapping(
-                    dict_locations,
-                    arr_original,
-                    feature_labels,
-                    config['isNumerical'],
-                    config['needs_rgb_conversion'],
-                    feature_type  # Pass the feature_type explicitly
-                )
-                print(f"{feature_type} map created in {time.time() - time_task:.2f} seconds")
-            else:
-                print(f"Skipping {feature_type} map (not enabled)")
+        def show_progress(done, total, running):
+            progress_message.setText(f"Loading... ({done}/{total} steps done)\n" + '\n'.join(running))
+            QApplication.processEvents()
+    
+        try:
+            results = graph.run(on_progress=show_progress)
+        finally:
+            progress.accept()
     
-        print(f"Arrays from images retrieved in {time.time() - time_task:.2f} seconds")
+        dict_locations = results['states']
+        location_to_v3TerrainType = results['terrains']
+        location_index = results['location_index']
+        print(f"Location index with {len(location_index)} locations loaded")
+    
+        # Store each layer as one code per location, rendered through its palette
+        feature_layers = {}
+        for feature_type in feature_data:
+            # Maps loaded later start with empty labels
+            feature_data[feature_type]['labels'] = {}
+        for feature_type in startup_maps:
+            layer, labels, column = results[feature_type]
+            dict_locations.set_column(feature_type, column)
+            feature_data[feature_type]['labels'] = labels
+            feature_layers[feature_type] = layer
     
         convert_hotkey_strings_to_qt(feature_data)
     
         # Initialize MapEditor with consolidated data
         map_editor = MapEditor(
-            arr_original,
-            feature_pixmaps,
+            location_index,
+            feature_layers,
             dict_locations,
             location_to_v3TerrainType,
             feature_data
@@ -154,23 +167,23 @@ def main():
         
         # Apply imported project changes if a project was imported
         if imported_project:
-            project_data = imported_project['project_data']
+            project = imported_project['project']
             
             # Set the initial map type from the project
-            initial_map_type = project_data.get('current_map_type', 'climate')
-            if initial_map_type and initial_map_type in feature_pixmaps:
+            initial_map_type = project.current_map_type or 'climate'
+            if initial_map_type and initial_map_type in feature_layers:
                 map_editor.set_map_type(initial_map_type)
                 
-            # Apply all changes from the project
-            changes = project_data.get('undo_stack', [])
-            if changes:
+            # Apply the net effect of the project's changes
+            changes = project.changes
+            if len(changes):
                 try:
-                    apply_imported_changes(map_editor, changes)
-                    print(f"Applied {len(changes)} changes from imported project")
+                    applied = apply_imported_changes(map_editor, changes)
+                    print(f"Applied {len(changes)} changes from imported project ({applied} locations changed)")
                     
                     # Set last_export_stack_size to match current undo stack size
                     # This prevents the "unsaved changes" prompt when quitting without making new changes
-                    map_editor.last_export_stack_size = len(map_editor.undo_stack)
+                    map_editor.last_export_stack_size = len(map_editor.journal)
                 except Exception as e:
                     show_error_dialog(
                         map_editor,
@@ -179,14 +192,28 @@ def main():
                         details=f"Error details: {repr(e)}"
                     )
         
+        # Replay the recovered edits; they are in this session's autosave file afterwards
+        elif recovered_records:
+            initial_map_type = default_map_type if default_map_type in feature_layers else next(iter(feature_layers))
+            map_editor.set_map_type(initial_map_type)
+            change_count = map_editor.autosave.replay(map_editor, recovered_records)
+            map_editor.set_map_type(initial_map_type)
+            print(f"Recovered {change_count} changes from {recovered_file}")
+            # The edits are in this session's autosave file now
+            remove_autosave_file(recovered_file)
+
         # Set the default map type if one was selected and no project was imported
-        elif default_map_type and default_map_type in feature_data and default_map_type in feature_pixmaps:
+        elif default_map_type and default_map_type in feature_data and default_map_type in feature_layers:
             map_editor.set_map_type(default_map_type)
-        elif feature_pixmaps:  # If default map not available, use the first available map
-            map_editor.set_map_type(list(feature_pixmaps.keys())[0])
+        elif feature_layers:  # If default map not available, use the first available map
+            map_editor.set_map_type(list(feature_layers.keys())[0])
             
         map_editor.show()
         print(f"Map editor ready! It took a total of {time.time() - start_time:.2f} seconds")
+    
+        # The other enabled maps finish loading in the background
+        for feature_type in enabled_maps:
+            map_editor.load_feature_layer(feature_type)
         sys.exit(app.exec_())
         
     except Exception as e:
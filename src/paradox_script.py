@@ -0,0 +1,221 @@
+"""
+Streaming tokenizer and parser for Paradox script files.
+
+Paradox script is a tree of `key = value` pairs, where a value is a bare word,
+a quoted string or a `{ ... }` block holding more pairs or a plain list of
+values. Comments run from `#` to the end of the line.
+
+Files are read in chunks and tokenized incrementally, so no file has to fit
+in one string and no regex spans more than one token. The parser can be told
+which fields of the top-level blocks to keep; every other block is skipped by
+counting braces, without building it.
+"""
+import re
+
+# Characters read from a file at a time
+READ_CHUNK_SIZE = 1 << 16
+
+# Token kinds
+STRING = 'string'
+WORD = 'word'
+OPEN = '{'
+CLOSE = '}'
+OPERATOR = 'operator'
+
+# Whitespace and comments. The skip is matched inside a lookahead, which never
+# backtracks once it has matched, and then consumed through the backreference,
+# so it matches one way only: a whitespace run with no token after it fails at
+# once instead of backtracking, and a comment can't be cut short to end in a word.
+SKIP = r'(?=(?P<skip>\s*(?:\#[^\n]*\s*)*))(?P=skip)'
+
+# One token per match, with the whitespace and comments before it
+TOKEN_PATTERN = re.compile(SKIP + r'''
+    (?:
+        "(?P<string>(?:[^"\\]|\\.)*)"
+      | (?P<brace>[{}])
+      | (?P<operator>[<>!?]?=|[<>])
+      | (?P<word>[^\s{}=<>!?"\#]+)
+    )
+''', re.VERBOSE)
+
+# Whitespace and comments after the last token
+TRAILING_PATTERN = re.compile(SKIP)
+
+ESCAPE_PATTERN = re.compile(r'\\(.)')
+
+OPEN_TOKEN = (OPEN, OPEN)
+CLOSE_TOKEN = (CLOSE, CLOSE)
+
+
+class ParadoxScriptError(ValueError):
+    """Raised for malformed Paradox script."""
+
+
+def tokenize(stream, chunk_size: int = READ_CHUNK_SIZE):
+    """
+    Tokenize Paradox script incrementally.
+
+    Args:
+        stream: Text file object to read from
+        chunk_size: Characters read at a time
+
+    Yields:
+        Tuples of (kind, value); kind is STRING, WORD, OPEN, CLOSE or OPERATOR
+    """
+    buffer = ''
+    at_end = False
+    while not at_end:
+        chunk = stream.read(chunk_size)
+        at_end = not chunk
+        buffer += chunk
+        position = 0
+        length = len(buffer)
+        while True:
+            # Stop at text that isn't a token yet, e.g. a string closed in the next chunk,
+            # and at a token touching the end of the buffer, which may continue there.
+            # Matching at the position, unlike searching, never rescans the rest of the buffer.
+            match = TOKEN_PATTERN.match(buffer, position)
+            if match is None or (match.end() == length and not at_end):
+                break
+            position = match.end()
+            kind = match.lastgroup
+            if kind == 'word':
+                yield WORD, match.group('word')
+            elif kind == 'brace':
+                yield OPEN_TOKEN if match.group('brace') == OPEN else CLOSE_TOKEN
+            elif kind == 'string':
+                value = match.group('string')
+                yield STRING, ESCAPE_PATTERN.sub(r'\1', value) if '\\' in value else value
+            else:
+                yield OPERATOR, match.group('operator')
+        buffer = buffer[position:]
+
+    if TRAILING_PATTERN.fullmatch(buffer) is None:
+        raise ParadoxScriptError(f"Unexpected {buffer.lstrip()[:20]!r}")
+
+
+class ParadoxScriptParser:
+    """
+    Recursive descent parser over the tokens of one file.
+
+    Blocks with `key = value` pairs become dicts, where a repeated key keeps its
+    last value; blocks with plain values become lists. A word directly followed
+    by a block, like `rgb { 255 0 0 }`, is parsed as that block.
+    """
+
+    def __init__(self, tokens):
+        self.tokens = iter(tokens)
+        self.pending = None
+
+    def _next(self):
+        if self.pending is not None:
+            token, self.pending = self.pending, None
+            return token
+        return next(self.tokens, None)
+
+    def _peek(self):
+        if self.pending is None:
+            self.pending = next(self.tokens, None)
+        return self.pending
+
+    def parse(self, fields=None) -> dict:
+        """
+        Parse the whole file.
+
+        Args:
+            fields: Names of the fields to keep inside top-level blocks; None keeps everything
+
+        Returns:
+            Dictionary of top-level key -> value
+        """
+        result = {}
+        while self._peek() is not None:
+            key = self._key()
+            if self._peek() == OPEN_TOKEN:
+                # Top-level lists ({ a b }) are rare, they are kept whole
+                self._next()
+                result[key] = self._block(fields)
+            else:
+                result[key] = self._value()
+        return result
+
+    def _key(self):
+        kind, key = self._next()
+        if kind not in (WORD, STRING):
+            raise ParadoxScriptError(f"Expected a key, got {key!r}")
+        token = self._next()
+        if token is None or token[0] != OPERATOR:
+            raise ParadoxScriptError(f"Expected an operator after {key!r}")
+        return key
+
+    def _value(self):
+        """Parse a value: a word, a string or a (tagged) block."""
+        token = self._next()
+        if token is None:
+            raise ParadoxScriptError("Unexpected end of file")
+        kind, value = token
+        if kind == OPEN:
+            return self._block()
+        if kind == WORD and self._peek() == OPEN_TOKEN:
+            self._next()
+            return self._block()
+        if kind not in (WORD, STRING):
+            raise ParadoxScriptError(f"Expected a value, got {value!r}")
+        return value
+
+    def _skip_value(self):
+        """Consume a value without building it."""
+        kind, _ = self._next()
+        if kind == WORD and self._peek() == OPEN_TOKEN:
+            kind, _ = self._next()
+        if kind != OPEN:
+            return
+        depth = 1
+        while depth:
+            token = self._next()
+            if token is None:
+                raise ParadoxScriptError("Unexpected end of file inside a block")
+            if token[0] == OPEN:
+                depth += 1
+            elif token[0] == CLOSE:
+                depth -= 1
+
+    def _block(self, fields=None):
+        """Parse the contents of a block after its opening brace."""
+        pairs = {}
+        values = []
+        while True:
+            token = self._next()
+            if token is None:
+                raise ParadoxScriptError("Unexpected end of file inside a block")
+            kind, value = token
+            if kind == CLOSE:
+                return pairs if pairs or not values else values
+            following = self._peek()
+            if following is not None and following[0] == OPERATOR:
+                self._next()
+                if fields is None or value in fields:
+                    pairs[value] = self._value()
+                else:
+                    self._skip_value()
+            elif kind == OPEN:
+                values.append(self._block())
+            elif kind in (WORD, STRING):
+                values.append(value)
+            else:
+                raise ParadoxScriptError(f"Unexpected {value!r} inside a block")
+
+
+def parse_script_file(file_path: str, fields=None) -> dict:
+    """
+    Parse a Paradox script file.
+
+    Args:
+        file_path: Path of the file
+        fields: Names of the fields to keep inside top-level blocks; None keeps everything
+
+    Returns:
+        Dictionary of top-level key -> value
+    """
+    with open(file_path, 'r', encoding='utf-8-sig') as file:
+        return ParadoxScriptParser(tokenize(file)).parse(fields)
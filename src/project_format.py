@@ -0,0 +1,416 @@
+"""
+Binary project files.
+
+A project file holds the undo history of a saved session, the loaded maps and
+the map on display. The binary format starts with a small JSON header (maps,
+change counts per map, label keys, section offsets), followed by one typed
+array per change column:
+
+    magic (4 bytes) | version (uint32) | header length (uint32) | header JSON | padding | arrays
+
+The startup window only reads the header; the change arrays are memory-mapped
+when the changes are applied. Old project_state.json files are still read,
+and convert_json_project turns them into binary files.
+"""
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+
+from location_mappings import pack_hex_colors, INVALID_KEY
+
+PROJECT_FILE = 'project_state.e5p'
+PROJECT_JSON_FILE = 'project_state.json'
+PROJECT_MAGIC = b'E5MP'
+PROJECT_VERSION = 1
+
+# Code of a change without a label key (an empty value)
+NO_KEY = -1
+
+# Change columns in file order; old and new codes index the key list of the change's layer
+CHANGE_COLUMNS = {
+    'hex': np.uint32,
+    'layer': np.uint8,
+    'old_code': np.int16,
+    'new_code': np.int16,
+    'transaction': np.uint32
+}
+
+# Sections start on multiples of this many bytes, so every array is aligned
+SECTION_ALIGNMENT = 8
+
+PREAMBLE = struct.Struct('<4sII')
+
+# Header fields read besides the sections
+HEADER_FIELDS = ('loaded_maps', 'change_counts', 'layers', 'keys')
+
+
+class ProjectChanges:
+    """Undo history of a project as typed arrays, one row per change."""
+
+    def __init__(self, layer_names: list, keys: dict, columns: dict):
+        """
+        Args:
+            layer_names: Map types of the changes, their position is the layer number
+            keys: Dictionary of map type -> label keys the codes of its changes refer to
+            columns: Dictionary of column name (see CHANGE_COLUMNS) -> array
+        """
+        self.layer_names = list(layer_names)
+        self.keys = keys
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns['hex'])
+
+    def counts_by_layer(self) -> dict:
+        """Number of changes of every map type."""
+        counts = np.bincount(self.columns['layer'], minlength=len(self.layer_names))
+        return {layer_name: int(count) for layer_name, count in zip(self.layer_names, counts) if count}
+
+    def filter_layers(self, layer_names) -> 'ProjectChanges':
+        """Keep only the changes of some map types."""
+        kept = np.isin(self.columns['layer'],
+                       [layer_id for layer_id, name in enumerate(self.layer_names) if name in layer_names])
+        return ProjectChanges(self.layer_names, self.keys, {name: column[kept] for name, column in self.columns.items()})
+
+    def hex_strings(self) -> list:
+        """HEX color of every change."""
+        return [f'{hex_key:06X}' for hex_key in self.columns['hex'].tolist()]
+
+    def key_lookup(self, code_column: str) -> list:
+        """Label key of every change in a code column; '' for changes without a key."""
+        luts = [np.array(list(self.keys[layer_name]) + [''], dtype=object) for layer_name in self.layer_names]
+        layers = self.columns['layer']
+        codes = self.columns[code_column].astype(np.int64)
+        keys = np.empty(len(self), dtype=object)
+        for layer_id, lut in enumerate(luts):
+            in_layer = layers == layer_id
+            # NO_KEY (-1) picks the trailing '' of the lookup table
+            keys[in_layer] = lut[codes[in_layer]]
+        return keys.tolist()
+
+    def net_changes(self, layer_name: str, targets: np.ndarray) -> tuple:
+        """
+        Reduce the changes of one map type to their net effect: the last new code of every target.
+
+        Args:
+            layer_name: Map type of the changes
+            targets: Target (location ID, table row, ...) of every change; negative targets are skipped
+
+        Returns:
+            Tuple of (unique targets, new code of each into keys[layer_name]), with NO_KEY for removed values
+        """
+        if layer_name not in self.layer_names:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int16)
+        kept = (self.columns['layer'] == self.layer_names.index(layer_name)) & (targets >= 0)
+        # np.unique returns the first occurrence, so search the changes from the end
+        reversed_targets = targets[kept][::-1]
+        unique_targets, last = np.unique(reversed_targets, return_index=True)
+        return unique_targets, np.asarray(self.columns['new_code'][kept][::-1][last], dtype=np.int16)
+
+    def to_change_dicts(self) -> list:
+        """Convert to the change dicts of project_state.json."""
+        layer_names = [self.layer_names[layer_id] for layer_id in self.columns['layer'].tolist()]
+        return [{'map_type': map_type, 'location_HEX': location_hex, 'old_feature': old_key,
+                 'new_feature': new_key, 'transaction': transaction}
+                for map_type, location_hex, old_key, new_key, transaction in zip(
+                    layer_names, self.hex_strings(), self.key_lookup('old_code'), self.key_lookup('new_code'),
+                    self.columns['transaction'].tolist())]
+
+    @classmethod
+    def from_change_dicts(cls, changes: list) -> 'ProjectChanges':
+        """
+        Build the arrays from the change dicts of project_state.json.
+
+        Changes whose location_HEX isn't six hex digits are dropped with a warning.
+        """
+        layer_ids = {}
+        keys = {}
+        key_codes = {}
+
+        def code_of(layer_name, key):
+            if not key:
+                return NO_KEY
+            codes = key_codes[layer_name]
+            code = codes.get(key)
+            if code is None:
+                code = codes[key] = len(keys[layer_name])
+                keys[layer_name].append(key)
+            return code
+
+        layers, old_codes, new_codes, transactions = [], [], [], []
+        for index, change in enumerate(changes):
+            layer_name = change['map_type']
+            if layer_name not in layer_ids:
+                layer_ids[layer_name] = len(layer_ids)
+                keys[layer_name] = []
+                key_codes[layer_name] = {}
+            layers.append(layer_ids[layer_name])
+            old_codes.append(code_of(layer_name, change.get('old_feature')))
+            new_codes.append(code_of(layer_name, change.get('new_feature')))
+            # Older projects have no transactions, every change was undone on its own
+            transactions.append(change.get('transaction', index))
+        columns = {
+            'hex': pack_hex_colors([change['location_HEX'] for change in changes]),
+            'layer': np.array(layers, dtype=np.uint8),
+            'old_code': np.array(old_codes, dtype=np.int16),
+            'new_code': np.array(new_codes, dtype=np.int16),
+            'transaction': np.array(transactions, dtype=np.uint32)
+        }
+        # A HEX color that isn't six hex digits can't be stored, nor match a location
+        invalid = columns['hex'] == INVALID_KEY
+        if np.any(invalid):
+            examples = [changes[row]['location_HEX'] for row in np.flatnonzero(invalid)[:5].tolist()]
+            print(f"Warning: Dropping {int(np.count_nonzero(invalid))} changes whose location_HEX isn't "
+                  f"six hex digits, e.g. {', '.join(map(repr, examples))}")
+            columns = {name: column[~invalid] for name, column in columns.items()}
+        return cls(list(layer_ids), keys, columns)
+
+    @classmethod
+    def concatenate(cls, parts: list) -> 'ProjectChanges':
+        """
+        Join the changes of several projects, in order.
+
+        The key lists of each map type are merged and the codes renumbered;
+        the transactions of every part stay apart from the other parts'.
+        """
+        layer_names, keys, key_codes = [], {}, {}
+        columns = {name: [] for name in CHANGE_COLUMNS}
+        next_transaction = 0
+        for part in parts:
+            if not len(part):
+                continue
+            layers = np.asarray(part.columns['layer'])
+            layer_lut = np.zeros(len(part.layer_names), dtype=np.uint8)
+            code_columns = {name: np.array(part.columns[name], dtype=np.int16) for name in ('old_code', 'new_code')}
+            for layer_id, layer_name in enumerate(part.layer_names):
+                if layer_name not in keys:
+                    layer_names.append(layer_name)
+                    keys[layer_name] = []
+                    key_codes[layer_name] = {}
+                layer_lut[layer_id] = layer_names.index(layer_name)
+                codes = key_codes[layer_name]
+                for key in part.keys[layer_name]:
+                    if key not in codes:
+                        codes[key] = len(keys[layer_name])
+                        keys[layer_name].append(key)
+                # NO_KEY (-1) picks the trailing NO_KEY of the lookup table
+                code_lut = np.array([codes[key] for key in part.keys[layer_name]] + [NO_KEY], dtype=np.int16)
+                in_layer = layers == layer_id
+                for name, column in code_columns.items():
+                    column[in_layer] = code_lut[column[in_layer]]
+
+            transactions = np.asarray(part.columns['transaction'], dtype=np.int64)
+            transactions = transactions - transactions.min() + next_transaction
+            next_transaction = int(transactions.max()) + 1
+            columns['hex'].append(np.asarray(part.columns['hex']))
+            columns['layer'].append(layer_lut[layers])
+            columns['old_code'].append(code_columns['old_code'])
+            columns['new_code'].append(code_columns['new_code'])
+            columns['transaction'].append(transactions)
+        return cls(layer_names, keys, {name: np.concatenate(arrays).astype(dtype) if arrays else np.empty(0, dtype=dtype)
+                                       for (name, dtype), arrays in zip(CHANGE_COLUMNS.items(), columns.values())})
+
+    @classmethod
+    def from_journal(cls, journal, feature_layers: dict, location_index) -> 'ProjectChanges':
+        """
+        Take the changes that can be undone from an EditJournal, without a per-change loop.
+
+        The codes stay layer codes; the key lists are the layers' own keys.
+        """
+        rows = slice(0, journal.cursor)
+        hex_keys = pack_hex_colors(location_index.id_to_hex)
+        layer_ids = journal.columns['layer'][rows]
+        used_ids = np.unique(layer_ids)
+        layer_names = [journal.layer_names[layer_id] for layer_id in used_ids.tolist()]
+        columns = {
+            'hex': hex_keys[journal.columns['location'][rows]],
+            'layer': np.searchsorted(used_ids, layer_ids).astype(np.uint8),
+            'old_code': journal.columns['old_code'][rows].copy(),
+            'new_code': journal.columns['new_code'][rows].copy(),
+            'transaction': journal.columns['transaction'][rows].copy()
+        }
+        keys = {layer_name: list(feature_layers[layer_name].keys) for layer_name in layer_names}
+        return cls(layer_names, keys, columns)
+
+
+class Project:
+    """A saved project: its header fields, with the changes read on first use."""
+
+    def __init__(self, file_path: str, current_map_type: str, loaded_maps: list, change_counts: dict,
+                 changes: ProjectChanges = None, header: dict = None):
+        """
+        Args:
+            file_path: Path of the project file
+            current_map_type: Map on display when the project was saved
+            loaded_maps: Maps the project needs loaded
+            change_counts: Dictionary of map type -> number of changes
+            changes: Changes of the project, or None to map them from the file when used
+            header: Header of the binary file, to map the changes with
+        """
+        self.file_path = file_path
+        self.current_map_type = current_map_type
+        self.loaded_maps = list(loaded_maps)
+        self.change_counts = change_counts
+        self._changes = changes
+        self._header = header
+
+    @property
+    def change_count(self) -> int:
+        return sum(self.change_counts.values())
+
+    @property
+    def changes(self) -> ProjectChanges:
+        """Changes of the project, memory-mapped from a binary file."""
+        if self._changes is None:
+            self._changes = map_project_changes(self.file_path, self._header)
+        return self._changes
+
+    def filter_layers(self, layer_names):
+        """Drop the changes and loaded maps that aren't in layer_names."""
+        self._changes = self.changes.filter_layers(layer_names)
+        self.change_counts = self._changes.counts_by_layer()
+        self.loaded_maps = list(layer_names)
+
+
+def _read_header(f) -> dict:
+    """
+    Read and check the header of a binary project file.
+
+    Raises:
+        ValueError: The file is truncated, its header is corrupt or it was written by a newer editor
+    """
+    preamble = f.read(PREAMBLE.size)
+    if len(preamble) < PREAMBLE.size:
+        raise ValueError("Project file is truncated")
+    magic, version, header_length = PREAMBLE.unpack(preamble)
+    if magic != PROJECT_MAGIC:
+        raise ValueError("Not a project file")
+    if version > PROJECT_VERSION:
+        raise ValueError(f"Project file version {version} is newer than this editor supports ({PROJECT_VERSION})")
+    header_bytes = f.read(header_length)
+    if len(header_bytes) < header_length:
+        raise ValueError("Project file is truncated")
+    try:
+        header = json.loads(header_bytes.decode('utf-8'))
+        missing = [field for field in HEADER_FIELDS if field not in header]
+        sections = header['sections']
+        section_ends = [sections[name]['offset'] + sections[name]['count'] * np.dtype(dtype).itemsize
+                        for name, dtype in CHANGE_COLUMNS.items()]
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Project file header is corrupt ({type(e).__name__}: {e})") from e
+    if missing:
+        raise ValueError(f"Project file header is corrupt (missing {', '.join(missing)})")
+    # The change arrays are mapped later; a file cut short must fail now, before it is applied
+    if max(section_ends) > os.fstat(f.fileno()).st_size:
+        raise ValueError("Project file is truncated")
+    return header
+
+
+def is_binary_project(file_path: str) -> bool:
+    """Whether a file starts like a binary project file."""
+    with open(file_path, 'rb') as f:
+        return f.read(len(PROJECT_MAGIC)) == PROJECT_MAGIC
+
+
+def load_project(file_path: str) -> Project:
+    """
+    Open a project file, binary or JSON.
+
+    For a binary file only the header is read; the changes are mapped when they are used.
+    """
+    if is_binary_project(file_path):
+        with open(file_path, 'rb') as f:
+            header = _read_header(f)
+        return Project(file_path, header.get('current_map_type'), header['loaded_maps'], header['change_counts'],
+                       header=header)
+
+    with open(file_path, 'r', encoding='utf-8') as f:
+        project_data = json.load(f)
+    changes = ProjectChanges.from_change_dicts(project_data.get('undo_stack', []))
+    return Project(file_path, project_data.get('current_map_type'), project_data.get('loaded_maps', ['climate']),
+                   changes.counts_by_layer(), changes=changes)
+
+
+def map_project_changes(file_path: str, header: dict) -> ProjectChanges:
+    """Memory-map the change arrays of a binary project file, given its header."""
+    columns = {}
+    for name, dtype in CHANGE_COLUMNS.items():
+        section = header['sections'][name]
+        if section['count']:
+            columns[name] = np.memmap(file_path, dtype=dtype, mode='r', offset=section['offset'],
+                                      shape=(section['count'],))
+        else:
+            columns[name] = np.empty(0, dtype=dtype)
+    return ProjectChanges(header['layers'], header['keys'], columns)
+
+
+def write_project(file_path: str, changes: ProjectChanges, current_map_type: str, loaded_maps: list):
+    """
+    Write a binary project file.
+
+    Args:
+        file_path: Path of the file
+        changes: Changes of the project
+        current_map_type: Map on display when the project was saved
+        loaded_maps: Maps the project needs loaded
+    """
+    header = {
+        'version': PROJECT_VERSION,
+        'current_map_type': current_map_type,
+        'loaded_maps': list(loaded_maps),
+        'change_counts': changes.counts_by_layer(),
+        'layers': changes.layer_names,
+        'keys': changes.keys,
+        'sections': {}
+    }
+    # The offsets depend on the header length, which depends on the offsets; fixed-width offsets settle it
+    arrays = [np.ascontiguousarray(changes.columns[name], dtype=dtype) for name, dtype in CHANGE_COLUMNS.items()]
+    for name, array in zip(CHANGE_COLUMNS, arrays):
+        header['sections'][name] = {'offset': 10 ** 12, 'count': len(array)}
+    header_length = len(json.dumps(header, separators=(',', ':')).encode('utf-8'))
+    offset = _align(PREAMBLE.size + header_length)
+    for name, array in zip(CHANGE_COLUMNS, arrays):
+        header['sections'][name]['offset'] = offset
+        offset = _align(offset + array.nbytes)
+    # Pad the header to the length the offsets were computed for
+    header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8').ljust(header_length)
+
+    temp_path = f'{file_path}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(PREAMBLE.pack(PROJECT_MAGIC, PROJECT_VERSION, header_length))
+        f.write(header_bytes)
+        for name, array in zip(CHANGE_COLUMNS, arrays):
+            f.write(b'\0' * (header['sections'][name]['offset'] - f.tell()))
+            f.write(array.tobytes())
+    os.replace(temp_path, file_path)
+
+
+def _align(offset: int) -> int:
+    return -(-offset // SECTION_ALIGNMENT) * SECTION_ALIGNMENT
+
+
+def convert_json_project(json_path: str, binary_path: str = None) -> str:
+    """
+    Convert a project_state.json file to a binary project file.
+
+    Args:
+        json_path: Path of the JSON project
+        binary_path: Path of the binary project, defaults to project_state.e5p next to the JSON file
+
+    Returns:
+        Path of the binary project
+    """
+    project = load_project(json_path)
+    if binary_path is None:
+        binary_path = os.path.join(os.path.dirname(json_path), PROJECT_FILE)
+    write_project(binary_path, project.changes, project.current_map_type, project.loaded_maps)
+    return binary_path
+
+
+if __name__ == '__main__':
+    # python project_format.py exports/<folder>/project_state.json [...]
+    for path in sys.argv[1:]:
+        print(f"Converted {path} to {convert_json_project(path)}")
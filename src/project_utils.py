@@ -1,110 +1,98 @@
-from PyQt5.QtWidgets import QDialog, QVBoxLayout, QLabel, QApplication
-from PyQt5.QtCore import Qt
-from auxiliary import hex_to_rgb
+"""
+Applying imported projects to the map editor.
+
+An imported undo history is replayed by its net effect: every (layer,
+location) pair takes the last value the history gives it, found in one
+vectorized pass per layer. The layer codes and the location data are set in
+bulk, the undo journal gets one row per changed location, and the layer on
+display is rendered once at the end.
+"""
+import numpy as np
+
+from feature_layers import NO_CODE
+from project_format import ProjectChanges
+from location_table import NO_VALUE
 
 
 def apply_imported_changes(map_editor, changes):
     """Apply a series of changes from the imported undo stack efficiently
-    
+
+    Args:
+        map_editor: MapEditor instance to apply changes to
+        changes: ProjectChanges, or list of change dictionaries from imported project
+    """
+    if not isinstance(changes, ProjectChanges):
+        changes = ProjectChanges.from_change_dicts(changes)
+    return apply_project_changes(map_editor, changes)
+
+
+def apply_project_changes(map_editor, changes: ProjectChanges) -> int:
+    """
+    Apply the net effect of a project's changes as one undo transaction.
+
+    Changes of map types that aren't loaded and of HEX colors that aren't on
+    the map are skipped.
+
     Args:
         map_editor: MapEditor instance to apply changes to
-        changes: List of change dictionaries from imported project
+        changes: Changes of the imported project
+
+    Returns:
+        Number of locations whose value changed
     """
-    if not changes:
-        return
-    
-    # Create progress dialog
-    progress = QDialog(map_editor)
-    progress.setWindowTitle("Importing Project")
-    progress.setWindowModality(Qt.WindowModal)
-    progress.setMinimumWidth(400)
-    
-    progress_layout = QVBoxLayout()
-    progress_message = QLabel("Applying changes...")
-    progress_layout.addWidget(progress_message)
-    progress.setLayout(progress_layout)
-    
-    progress.show()
-    QApplication.processEvents()
-    
-    try:
-        # Group changes by map type and target color to optimize processing
-        change_groups = {}
-        for i, change in enumerate(changes):
-            map_type = change['map_type']
-            location_HEX = change['location_HEX']
-            new_feature = change['new_feature']
-            
-            # Store only the final state for each location+map_type
-            key = (map_type, location_HEX)
-            change_groups[key] = (i, new_feature)
-            
-            # Update progress message periodically
-            if i % 50 == 0:
-                progress_message.setText(f"Processing changes... ({i}/{len(changes)})")
-                QApplication.processEvents()
-        
-        # Process the grouped changes by map type
-        map_changes = {}
-        for (map_type, location_HEX), (i, new_feature) in change_groups.items():
-            if map_type not in map_changes:
-                map_changes[map_type] = []
-            
-            # Append the change details
-            map_changes[map_type].append({
-                'location_HEX': location_HEX,
-                'new_feature': new_feature,
-                'original_index': i
-            })
-        
-        # Process each map type
-        completed = 0
-        for map_type, changes_list in map_changes.items():
-            # Switch to the current map type once
-            map_editor.set_map_type(map_type)
-            progress_message.setText(f"Applying changes for {map_type}... ({completed}/{len(changes)})")
-            QApplication.processEvents()
-            
-            # Apply all changes for this map type
-            for change_info in changes_list:
-                location_HEX = change_info['location_HEX']
-                new_feature = change_info['new_feature']
-                
-                # Get the original feature
-                original_feature = map_editor.locations[location_HEX][map_type]
-                
-                # Update the location data
-                map_editor.locations[location_HEX][map_type] = new_feature
-                
-                # Add to the undo stack
-                map_editor.undo_stack.append({
-                    'map_type': map_type,
-                    'location_HEX': location_HEX,
-                    'old_feature': original_feature,
-                    'new_feature': new_feature
-                })
-                
-                # Get colors for visual update
-                target_color_RGB = hex_to_rgb(location_HEX)
-                new_color_RGB = hex_to_rgb(map_editor.feature_data[map_type]['labels'][new_feature]['color'])
-                
-                # Apply the visual change but without the expensive map_type switching
-                map_editor._batch_apply_feature_change(map_type, target_color_RGB, new_color_RGB)
-                
-                completed += 1
-                if completed % 50 == 0:
-                    progress_message.setText(f"Applying changes... ({completed}/{len(changes)})")
-                    QApplication.processEvents()
-            
-            # Final visual update for this map type
-            map_editor._finalize_feature_changes(map_type)
-        
-        # Update the counter
-        map_editor.update_undo_counter()
-        
-        # Update the display with the current map type
-        map_editor.set_map_type(map_editor.current_map_type)
-        
-    finally:
-        # Close progress dialog
-        progress.accept() 
\ No newline at end of file
+    if not len(changes):
+        return 0
+
+    # Location ID of every change, NO_VALUE for colors outside the states or the map
+    rows = map_editor.locations.rows_of_keys(np.asarray(changes.columns['hex']))
+    row_ids = map_editor.locations.location_ids(map_editor.location_index)
+    location_ids = np.where(rows != NO_VALUE, row_ids[rows], NO_VALUE)
+
+    applied = 0
+    changed_layers = []
+    map_editor.journal.begin_transaction()
+    for map_type in changes.layer_names:
+        layer = map_editor.feature_layers.get(map_type)
+        if layer is None:
+            print(f"Warning: Skipping the changes of map type '{map_type}', it isn't loaded")
+            continue
+        unique_ids, key_codes = changes.net_changes(map_type, location_ids)
+
+        # Key codes of the project -> codes of the layer; NO_KEY picks the trailing NO_CODE
+        lut = np.array([layer.code_for_key(key) for key in changes.keys[map_type]] + [NO_CODE], dtype=np.int16)
+        new_codes = lut[key_codes]
+        changed = layer.codes[unique_ids] != new_codes
+        unique_ids, new_codes = unique_ids[changed], new_codes[changed]
+        if not len(unique_ids):
+            continue
+        old_codes = layer.codes[unique_ids].copy()
+        layer.codes[unique_ids] = new_codes
+        map_editor.journal.append(map_type, unique_ids, old_codes, new_codes)
+        _sync_location_table(map_editor, map_type, layer, unique_ids, new_codes)
+        applied += len(unique_ids)
+        changed_layers.append(map_type)
+    map_editor.journal.end_transaction()
+
+    if changed_layers:
+        map_editor._reset_hover_info()
+        # Render the layer on display with a single gather over the location raster
+        current_layer = map_editor.feature_layers.get(map_editor.current_map_type)
+        if map_editor.current_map_type in changed_layers and current_layer is not None:
+            current_layer.render_into(map_editor.location_index, map_editor.display_array)
+            map_editor._refresh_display()
+    map_editor.update_undo_counter()
+    return applied
+
+
+def _sync_location_table(map_editor, map_type, layer, location_ids, codes):
+    """Set the location data of changed locations to their new layer keys, in bulk."""
+    locations = map_editor.locations
+    rows = locations.rows_for_location_ids(map_editor.location_index, location_ids)
+    on_table = rows != NO_VALUE
+    column = locations.columns.get(map_type)
+    if column is None:
+        column = locations.new_column(map_type)
+        locations.set_column(map_type, column)
+    # Locations without a value get an empty value, like single edits do
+    categories = list(layer.keys) + ['']
+    column.set_codes(rows[on_table], np.where(codes == NO_CODE, len(layer.keys), codes)[on_table], categories)
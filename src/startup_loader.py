@@ -0,0 +1,82 @@
+"""
+Dependency-aware startup loading.
+
+Startup steps (state parsing, terrain mappings, the location index, feature
+layers, ...) are added to a StartupGraph with the names of the steps they
+need. Steps run on a thread pool as soon as their dependencies are done, so
+independent file reading and image decoding overlap, and the caller gets a
+progress callback while waiting.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Seconds between progress callbacks while steps are running
+PROGRESS_INTERVAL = 0.05
+
+
+class StartupGraph:
+    """Small dependency graph of load steps, run on a thread pool."""
+
+    def __init__(self):
+        self.steps = {}
+
+    def add(self, name: str, label: str, function, depends_on=()):
+        """
+        Add a step to the graph.
+
+        Args:
+            name: Unique name of the step, used by other steps to depend on it
+            label: Text shown in the progress while the step runs
+            function: Called with the results of depends_on, in that order
+            depends_on: Names of the steps that must finish first
+        """
+        if name in self.steps:
+            raise ValueError(f"Startup step '{name}' added twice")
+        for dependency in depends_on:
+            if dependency not in self.steps:
+                raise ValueError(f"Startup step '{name}' depends on unknown step '{dependency}'")
+        self.steps[name] = {'label': label, 'function': function, 'depends_on': tuple(depends_on)}
+
+    def run(self, on_progress=None, max_workers=None) -> dict:
+        """
+        Run every step, each one as soon as its dependencies are done.
+
+        Args:
+            on_progress: Called as on_progress(done, total, running labels) whenever
+                a step finishes and every PROGRESS_INTERVAL seconds meanwhile
+            max_workers: Size of the thread pool, defaults to ThreadPoolExecutor's (CPUs + 4, up to 32)
+
+        Returns:
+            Dictionary of step name -> result
+
+        Raises:
+            The first exception raised by a step; steps that haven't started are cancelled
+        """
+        results = {}
+        remaining = dict(self.steps)
+        running = {}
+        start_times = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            try:
+                while remaining or running:
+                    # Steps are added after their dependencies, so one pass in order submits every ready step
+                    for name, step in list(remaining.items()):
+                        if all(dependency in results for dependency in step['depends_on']):
+                            args = [results[dependency] for dependency in step['depends_on']]
+                            start_times[name] = time.time()
+                            running[executor.submit(step['function'], *args)] = name
+                            del remaining[name]
+
+                    done, _ = wait(running, timeout=PROGRESS_INTERVAL, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        name = running.pop(future)
+                        results[name] = future.result()
+                        print(f"{self.steps[name]['label']} completed in {time.time() - start_times[name]:.2f} seconds")
+
+                    if on_progress:
+                        on_progress(len(results), len(self.steps), [self.steps[name]['label'] for name in running.values()])
+            except BaseException:
+                for future in running:
+                    future.cancel()
+                raise
+        return results
@@ -0,0 +1,214 @@
+"""
+Tests for the autosave journal: writing, replaying and compacting session files, and the session lock.
+
+Run from the repository root with `python -m unittest discover tests`.
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+from unittest import mock
+
+import numpy as np
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC)
+
+import autosave
+from autosave import (AutosaveJournal, find_autosave_files, get_autosave_layers, is_session_running,
+                      read_autosave_file, remove_autosave_file)
+from edit_journal import EditJournal
+from feature_layers import FeatureLayer
+from location_index import build_location_index
+
+LABELS = {
+    'climate': {'Af': {'color': 'FF0000'}, 'BWh': {'color': '00FF00'}, 'ET': {'color': '0000FF'}},
+    'vegetation': {'Woods': {'color': '008000'}, 'Desert': {'color': 'C0C000'}}
+}
+
+
+def locations_image() -> np.ndarray:
+    """A 4x4 image of eight locations, two pixels each."""
+    colors = np.array([[(10 * i, 20, 30) for i in range(8)]], dtype=np.uint8)
+    return np.repeat(colors, 2, axis=1).reshape(4, 4, 3)
+
+
+class Editor:
+    """The parts of the map editor that the autosave journal reads and replays through."""
+
+    def __init__(self, autosave_dir: str):
+        self.location_index = build_location_index(locations_image())
+        self.hexes = self.location_index.id_to_hex
+        self.feature_layers = {name: FeatureLayer(name, labels, len(self.hexes)) for name, labels in LABELS.items()}
+        self.journal = EditJournal(list(self.feature_layers))
+        self.autosave = AutosaveJournal(self.journal, self.feature_layers, self.location_index, autosave_dir)
+
+    def paint(self, map_type: str, location_ids: list, key: str):
+        layer = self.feature_layers[map_type]
+        location_ids = np.array(location_ids)
+        old_codes = layer.codes[location_ids].copy()
+        new_codes = np.full(len(location_ids), layer.code_for_key(key), dtype=np.int16)
+        self.journal.record(map_type, location_ids, old_codes, new_codes)
+        self._apply_codes(map_type, location_ids, new_codes)
+
+    def _apply_codes(self, map_type: str, location_ids, codes):
+        self.feature_layers[map_type].codes[location_ids] = codes
+
+    def undo_last_fill(self):
+        for map_type, location_ids, codes in self.journal.undo():
+            self._apply_codes(map_type, location_ids, codes)
+
+    def redo_last_fill(self):
+        for map_type, location_ids, codes in self.journal.redo():
+            self._apply_codes(map_type, location_ids, codes)
+
+    def update_undo_counter(self):
+        pass
+
+    def state(self) -> tuple:
+        codes = {name: layer.codes.tolist() for name, layer in self.feature_layers.items()}
+        return codes, len(self.journal), self.journal.redo_count
+
+
+class AutosaveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.autosave_dir = self.directory.name
+
+    def editor(self) -> Editor:
+        editor = Editor(self.autosave_dir)
+        self.addCleanup(editor.autosave.close)
+        return editor
+
+    def edit(self, editor: Editor):
+        editor.paint('climate', [0, 1, 2], 'Af')
+        editor.paint('vegetation', [2, 3], 'Desert')
+        editor.paint('climate', [1], 'ET')
+        editor.undo_last_fill()
+        editor.undo_last_fill()
+        editor.redo_last_fill()
+        editor.paint('climate', [7], 'Unknown')
+
+    def assertReplayEqual(self, editor: Editor):
+        """Replay the editor's file into a new session and step both back to the start."""
+        editor.autosave.sync()
+        records = read_autosave_file(editor.autosave.file_path)
+        replayed = self.editor()
+        self.assertEqual(replayed.autosave.replay(replayed, records), len(editor.journal))
+        self.assertEqual(replayed.state(), editor.state())
+        while len(editor.journal):
+            editor.undo_last_fill()
+            replayed.undo_last_fill()
+            self.assertEqual(replayed.state(), editor.state())
+        return records
+
+    def test_write_and_replay(self):
+        editor = self.editor()
+        self.edit(editor)
+        records = self.assertReplayEqual(editor)
+        self.assertEqual([record['op'] for record in records],
+                         ['append', 'append', 'append', 'undo', 'undo', 'redo', 'append'])
+        self.assertEqual(records[0]['hex'], editor.hexes[:3])
+        self.assertEqual(get_autosave_layers(records), ['climate', 'vegetation'])
+
+    def test_torn_last_line_is_dropped(self):
+        editor = self.editor()
+        self.edit(editor)
+        editor.autosave.sync()
+        records = read_autosave_file(editor.autosave.file_path)
+        with open(editor.autosave.file_path, 'a', encoding='utf-8') as f:
+            f.write('{"op":"app')
+        self.assertEqual(read_autosave_file(editor.autosave.file_path), records)
+
+    def test_compact(self):
+        editor = self.editor()
+        with mock.patch.object(autosave, 'COMPACT_RECORD_COUNT', 3):
+            self.edit(editor)
+        records = read_autosave_file(editor.autosave.file_path)
+        self.assertEqual(records[0]['op'], 'snapshot')
+        self.assertLess(len(records), 7)
+        self.assertReplayEqual(editor)
+
+    def test_replay_compacts_into_the_new_session(self):
+        editor = self.editor()
+        self.edit(editor)
+        editor.autosave.sync()
+        replayed = self.editor()
+        replayed.autosave.replay(replayed, read_autosave_file(editor.autosave.file_path))
+        records = read_autosave_file(replayed.autosave.file_path)
+        self.assertEqual([record['op'] for record in records], ['snapshot'])
+        self.assertEqual(records[0]['cursor'], len(editor.journal))
+
+    def test_close(self):
+        editor = self.editor()
+        self.assertEqual(os.listdir(self.autosave_dir), [])  # Nothing is written before the first edit
+        editor.paint('climate', [0], 'Af')
+        self.assertEqual(len(os.listdir(self.autosave_dir)), 2)  # The file and its lock
+        # A kept file is offered for recovery, its lock is gone
+        editor.autosave.close(delete=False)
+        kept_file = editor.autosave.file_path
+        self.assertEqual(os.listdir(self.autosave_dir), [os.path.basename(kept_file)])
+        self.assertEqual(find_autosave_files(self.autosave_dir), [kept_file])
+
+        # A clean exit removes the session's files
+        editor = self.editor()
+        editor.paint('climate', [0], 'Af')
+        editor.autosave.close()
+        self.assertEqual(find_autosave_files(self.autosave_dir), [kept_file])
+        self.assertEqual(os.listdir(self.autosave_dir), [os.path.basename(kept_file)])
+
+    def test_sessions_in_one_process_get_their_own_files(self):
+        first, second = self.editor(), self.editor()
+        first.paint('climate', [0], 'Af')
+        second.paint('climate', [1], 'ET')
+        self.assertNotEqual(first.autosave.file_path, second.autosave.file_path)
+
+
+# Starts a session that writes one edit, then waits until it is killed
+SESSION_SCRIPT = textwrap.dedent('''
+    import sys
+    sys.path.insert(0, sys.argv[1])
+    sys.path.insert(0, sys.argv[2])
+    from test_autosave import Editor
+    editor = Editor(sys.argv[3])
+    editor.paint('climate', [0, 1], 'Af')
+    editor.autosave.sync()
+    print(editor.autosave.file_path, flush=True)
+    sys.stdin.read()
+''')
+
+
+class SessionLockTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_running_and_crashed_sessions(self):
+        with subprocess.Popen([sys.executable, '-c', SESSION_SCRIPT, SRC, os.path.dirname(os.path.abspath(__file__)),
+                               self.directory.name], stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True) as session:
+            try:
+                file_path = session.stdout.readline().strip()
+                self.assertTrue(file_path, "the session didn't start")
+
+                # A running session's file is left alone
+                self.assertTrue(is_session_running(file_path))
+                self.assertEqual(find_autosave_files(self.directory.name), [])
+            finally:
+                # The OS releases the lock of a killed process
+                session.kill()
+
+        # so its file is offered for recovery
+        self.assertFalse(is_session_running(file_path))
+        self.assertEqual(find_autosave_files(self.directory.name), [file_path])
+        self.assertEqual([record['op'] for record in read_autosave_file(file_path)], ['append'])
+
+        remove_autosave_file(file_path)
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+if __name__ == '__main__':
+    unittest.main()
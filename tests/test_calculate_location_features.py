@@ -0,0 +1,179 @@
+"""
+Tests for the location feature extraction.
+
+Run from the repository root with `python -m unittest discover tests`.
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from calculateLocationFeatures import (accumulate_region_histogram, accumulate_strips, convert_image_to_npy,
+                                       find_dominant_features, get_checkpoint_inputs, read_png_strips,
+                                       save_checkpoint)
+
+PALETTE = [(0, 0, 0), (255, 0, 0), (0, 128, 0), (0, 0, 255), (200, 200, 40), (17, 34, 51)]
+
+
+def palette_image(width: int, height: int) -> Image.Image:
+    indexes = (np.arange(width * height) * 7 // 5 % len(PALETTE)).astype(np.uint8).reshape(height, width)
+    image = Image.fromarray(indexes, 'P')
+    image.putpalette([channel for color in PALETTE for channel in color])
+    return image
+
+
+class ConvertImageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory.name, name)
+
+    def convert(self, image_path: str) -> np.ndarray:
+        shape = convert_image_to_npy(image_path, self.path('out.npy'))
+        arr = np.load(self.path('out.npy'))
+        self.assertEqual(arr.shape, shape)
+        return arr
+
+    def test_8_bit_strips(self):
+        image = palette_image(37, 300).convert('RGB')
+        image.save(self.path('rgb.png'))
+        expected = np.asarray(image)
+        self.assertTrue(np.array_equal(self.convert(self.path('rgb.png')), expected))
+        strips = list(read_png_strips(self.path('rgb.png'), strip_rows=7))
+        self.assertTrue(all(len(strip) == 7 for strip in strips[:-1]))
+        self.assertTrue(np.array_equal(np.concatenate(strips), expected))
+
+    def test_4_bit_palette_is_decoded_whole(self):
+        image = palette_image(33, 21)
+        image.save(self.path('koppen_16.png'), bits=4)
+        with open(self.path('koppen_16.png'), 'rb') as f:
+            self.assertEqual(f.read(25)[24], 4)  # Bit depth in the IHDR chunk
+        self.assertTrue(np.array_equal(self.convert(self.path('koppen_16.png')), np.asarray(image.convert('RGB'))))
+        with self.assertRaises(ValueError):
+            next(read_png_strips(self.path('koppen_16.png')))
+
+    def test_1_bit_and_interlaced_are_decoded_whole(self):
+        mask = Image.fromarray((np.arange(40 * 9).reshape(9, 40) % 3 == 0).astype(np.uint8) * 255, 'L').convert('1')
+        mask.save(self.path('mask.png'))
+        self.assertTrue(np.array_equal(self.convert(self.path('mask.png')), np.asarray(mask.convert('RGB'))))
+
+        image = palette_image(20, 20).convert('RGB')
+        image.save(self.path('interlaced.png'), interlace=1)
+        self.assertTrue(np.array_equal(self.convert(self.path('interlaced.png')), np.asarray(image)))
+
+    def test_not_a_png(self):
+        with open(self.path('image.bmp'), 'wb') as f:
+            f.write(b'BM' + bytes(64))
+        with self.assertRaises(ValueError):
+            convert_image_to_npy(self.path('image.bmp'), self.path('out.npy'))
+
+
+def baseline_dominant_feature(region_features: np.ndarray, skip_int: int) -> int:
+    """The per-region pick of the original loop, including its tie-breaks."""
+    feature_ints = (region_features[:, 0].astype(np.int32) * 256 * 256 +
+                    region_features[:, 1].astype(np.int32) * 256 + region_features[:, 2])
+    unique_features, counts = np.unique(feature_ints, return_counts=True)
+    if not skip_int:
+        return int(unique_features[np.argmax(counts)])
+    if len(counts) == 1:
+        return int(unique_features[0])
+    for index in np.argsort(counts)[::-1]:
+        if unique_features[index] != skip_int:
+            return int(unique_features[index])
+
+
+class DominantFeatureTest(unittest.TestCase):
+
+    def check(self, arr_locations: np.ndarray, arr_features: np.ndarray, color_to_skip: tuple = None):
+        skip_int = color_to_skip[0] * 256 * 256 + color_to_skip[1] * 256 + color_to_skip[2] if color_to_skip else 0
+        regions, result_colors, _ = find_dominant_features(
+            accumulate_region_histogram(arr_locations, arr_features), color_to_skip=color_to_skip)
+        packed_locations = (arr_locations[..., 0].astype(np.int64) << 16 | arr_locations[..., 1].astype(np.int64) << 8
+                            | arr_locations[..., 2]).ravel()
+        dominant = result_colors[:, 0] * 256 * 256 + result_colors[:, 1] * 256 + result_colors[:, 2]
+        for region, feature in zip(regions.tolist(), dominant.tolist()):
+            expected = baseline_dominant_feature(arr_features.reshape(-1, 3)[packed_locations == region], skip_int)
+            self.assertEqual(feature, expected, f"region {region:06X}")
+
+    def test_ties(self):
+        # Every region has two or three colors with the same count, one of them the skipped color
+        red, green, blue = (200, 0, 0), (0, 200, 0), (0, 0, 200)
+        arr_features = np.array([[red, green, red, green],
+                                 [blue, green, blue, green],
+                                 [red, green, blue, blue],
+                                 [blue, blue, blue, blue]], dtype=np.uint8)
+        arr_locations = np.zeros_like(arr_features)
+        arr_locations[:, :, 0] = [[1], [2], [3], [4]]
+        for color_to_skip in (None, blue, green):
+            self.check(arr_locations, arr_features, color_to_skip)
+
+    def test_random_regions(self):
+        rng = np.random.default_rng(7)
+        arr_locations = rng.integers(0, 40, (60, 60, 1), dtype=np.uint8).repeat(3, axis=2)
+        arr_features = (rng.integers(1, 5, (60, 60, 1), dtype=np.uint8) * 50).repeat(3, axis=2)
+        for color_to_skip in (None, (100, 100, 100)):
+            self.check(arr_locations, arr_features, color_to_skip)
+
+
+class CheckpointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        rng = np.random.default_rng(5)
+        self.arr_locations = rng.integers(0, 4, (40, 30, 3), dtype=np.uint8) * 60
+        self.arr_features = rng.integers(0, 3, (40, 30, 3), dtype=np.uint8) * 100
+        self.input_files = []
+        for name, arr in (('locations.png', self.arr_locations), ('features.png', self.arr_features)):
+            self.input_files.append(os.path.join(self.directory.name, name))
+            Image.fromarray(arr).save(self.input_files[-1])
+        self.checkpoint_file = os.path.join(self.directory.name, 'features.checkpoint.npz')
+
+    def plant_checkpoint(self) -> tuple:
+        """Save a finished checkpoint of another image, for the current input files."""
+        histogram = accumulate_region_histogram(self.arr_locations[:1], self.arr_features[:1])
+        save_checkpoint(self.checkpoint_file, histogram, len(self.arr_locations), self.arr_locations.shape, 8,
+                        False, get_checkpoint_inputs(self.input_files))
+        return histogram
+
+    def accumulate(self) -> tuple:
+        return accumulate_strips(self.arr_locations, self.arr_features, strip_rows=8,
+                                 checkpoint_file=self.checkpoint_file, input_files=self.input_files)
+
+    def assertHistogramEqual(self, first: tuple, second: tuple):
+        self.assertEqual(len(first), len(second))
+        for a, b in zip(first, second):
+            self.assertTrue(np.array_equal(a, b))
+
+    def test_resume_with_unchanged_inputs(self):
+        planted = self.plant_checkpoint()
+        self.assertHistogramEqual(self.accumulate(), planted)
+        self.assertFalse(os.path.exists(self.checkpoint_file))
+
+    def test_edited_input_of_the_same_size_discards_the_checkpoint(self):
+        expected = accumulate_region_histogram(self.arr_locations, self.arr_features)
+        self.plant_checkpoint()
+        stat = os.stat(self.input_files[1])
+        os.utime(self.input_files[1], ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        self.assertEqual(os.stat(self.input_files[1]).st_size, stat.st_size)
+        self.assertHistogramEqual(self.accumulate(), expected)
+
+    def test_other_input_path_discards_the_checkpoint(self):
+        expected = accumulate_region_histogram(self.arr_locations, self.arr_features)
+        self.plant_checkpoint()
+        moved = os.path.join(self.directory.name, 'moved.png')
+        os.rename(self.input_files[1], moved)
+        self.input_files[1] = moved
+        self.assertHistogramEqual(self.accumulate(), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+"""
+Tests for the headless batch mode.
+
+Run from the repository root with `python -m unittest discover tests`.
+"""
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC)
+
+import cli
+from project_format import PROJECT_FILE, ProjectChanges, load_project, write_project
+
+FEATURE_DATA = {
+    'climate': {'display_name': 'Climate', 'key': 'climate', 'needs_rgb_conversion': True, 'isNumerical': False},
+    'low_wheat': {'display_name': 'Wheat (Low)', 'needs_rgb_conversion': True, 'isNumerical': True}
+}
+
+# Relative to the working directory, like the editor's res/ folder
+DATA_FILES = {
+    'res/mappings/feature_data.json': json.dumps(FEATURE_DATA),
+    'res/mappings/location_climate.csv': '\ufeff00004B,Am\n000090,Dfa\n0000C0,ET\n0000FF,Af\n',
+    'res/mappings/location_low_wheat.csv': '00004B,2\n',
+    'res/feature_details/feature_details_climate.csv': ''.join(
+        f'{key};{color};{key} climate;\n' for key, color in (('Af', '0000FF'), ('Am', '0078FF'), ('Dfa', '00FFFF'),
+                                                            ('ET', '666666'))),
+    'states/00_states.txt': ('STATE_A = {\n    provinces = { "x00004B" "x000090" }\n}\n'
+                             'STATE_B = {\n    provinces = { "x0000C0" }  # the coast\n}\n'),
+}
+
+
+def change(map_type: str, location_hex: str, new_feature: str, transaction: int = 0) -> dict:
+    return {'map_type': map_type, 'location_HEX': location_hex, 'old_feature': '', 'new_feature': new_feature,
+            'transaction': transaction}
+
+
+class HeadlessImportTest(unittest.TestCase):
+
+    def test_cli_does_not_import_qt(self):
+        # A fresh interpreter, since other tests may have loaded Qt in this one
+        code = ("import sys; import cli; "
+                "print(','.join(name for name in sys.modules if name.startswith('PyQt5')))")
+        result = subprocess.run([sys.executable, '-c', code], cwd=SRC, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), '')
+
+
+class RunTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(directory.name)
+        for file_path, content in DATA_FILES.items():
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, 'w', encoding='utf-8') as f:
+                f.write(content)
+
+        self.projects = []
+        for name, changes, loaded_maps in (
+                ('first', [change('climate', '00004B', 'Af'), change('low_wheat', '000090', '3', 1)],
+                 ['climate', 'low_wheat']),
+                # The later project's value wins; a removed value is exported empty
+                ('second', [change('climate', '00004B', 'ET'), change('climate', '0000C0', ''),
+                            change('climate', 'ABCDEF', 'Af', 1)], ['climate'])):
+            os.makedirs(name)
+            self.projects.append(os.path.join(name, PROJECT_FILE))
+            write_project(self.projects[-1], ProjectChanges.from_change_dicts(changes), 'climate', loaded_maps)
+
+    def read_csv(self, file_path: str) -> dict:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return dict(line.rstrip('\n').split(',') for line in f)
+
+    def run_cli(self, *args) -> tuple:
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+            result = cli.main(list(args))
+        return result, output.getvalue()
+
+    def test_run(self):
+        result, output = self.run_cli(*self.projects, '--states', 'states', '--output', 'build')
+        self.assertEqual(result, 0, output)
+        self.assertIn("Skipping 1 changes of HEX colors that aren't in the state regions", output)
+        self.assertEqual(sorted(os.listdir('build')), ['climate.csv', 'low_wheat.csv', PROJECT_FILE])
+        self.assertEqual(self.read_csv('build/climate.csv'), {'00004B': 'ET', '000090': 'Dfa', '0000C0': ''})
+        self.assertEqual(self.read_csv('build/low_wheat.csv'), {'00004B': '2', '000090': '3'})
+
+        # The exported project holds the histories of both projects, in order
+        project = load_project(os.path.join('build', PROJECT_FILE))
+        self.assertEqual(project.loaded_maps, ['climate', 'low_wheat'])
+        self.assertEqual(project.current_map_type, 'climate')
+        self.assertEqual([(c['map_type'], c['location_HEX'], c['new_feature']) for c in project.changes.to_change_dicts()],
+                         [('climate', '00004B', 'Af'), ('low_wheat', '000090', '3'), ('climate', '00004B', 'ET'),
+                          ('climate', '0000C0', ''), ('climate', 'ABCDEF', 'Af')])
+
+        # Applying the exported project alone gives the same columns
+        result, output = self.run_cli(os.path.join('build', PROJECT_FILE), '--states', 'states', '--output', 'again')
+        self.assertEqual(result, 0, output)
+        for name in ('climate.csv', 'low_wheat.csv'):
+            self.assertEqual(self.read_csv(os.path.join('again', name)), self.read_csv(os.path.join('build', name)))
+
+    def test_selected_maps(self):
+        result, output = self.run_cli(*self.projects, '--states', 'states', '--maps', 'low_wheat', '--output', 'build')
+        self.assertEqual(result, 0, output)
+        self.assertEqual(sorted(os.listdir('build')), ['low_wheat.csv', PROJECT_FILE])
+        self.assertEqual(load_project(os.path.join('build', PROJECT_FILE)).change_counts, {'low_wheat': 1})
+
+    def test_errors(self):
+        result, output = self.run_cli(*self.projects, '--states', 'missing')
+        self.assertEqual(result, 1)
+        self.assertIn("State regions folder 'missing' not found", output)
+
+        result, output = self.run_cli('missing.e5p', '--states', 'states')
+        self.assertEqual(result, 1)
+        self.assertIn("Project file 'missing.e5p' not found", output)
+
+        with open('broken.e5p', 'wb') as f:
+            f.write(b'E5MP\x01')
+        result, output = self.run_cli('broken.e5p', '--states', 'states', '--output', 'build')
+        self.assertEqual(result, 1)
+        self.assertIn("Error: Project file is truncated", output)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+"""
+Tests for the columnar undo/redo journal.
+
+Run from the repository root with `python -m unittest discover tests`.
+"""
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from edit_journal import EditJournal, INITIAL_CAPACITY
+
+LAYERS = ['climate', 'vegetation']
+LOCATIONS = 10
+
+
+class Editor:
+    """Per-location codes of every layer, edited through a journal like the map editor does."""
+
+    def __init__(self):
+        self.journal = EditJournal(LAYERS)
+        self.codes = {name: np.zeros(LOCATIONS, dtype=np.int16) for name in LAYERS}
+
+    def paint(self, layer_name: str, location_ids: list, code: int):
+        """Paint locations as one transaction."""
+        location_ids = np.array(location_ids)
+        old_codes = self.codes[layer_name][location_ids].copy()
+        self.codes[layer_name][location_ids] = code
+        self.journal.record(layer_name, location_ids, old_codes, np.full(len(location_ids), code))
+
+    def apply(self, changes: list):
+        for layer_name, location_ids, codes in changes:
+            self.codes[layer_name][location_ids] = codes
+
+    def undo(self):
+        self.apply(self.journal.undo())
+
+    def redo(self):
+        self.apply(self.journal.redo())
+
+    def state(self) -> dict:
+        return {name: codes.tolist() for name, codes in self.codes.items()}
+
+
+class EditJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.editor = Editor()
+        self.journal = self.editor.journal
+
+    def test_undo_and_redo_transactions(self):
+        states = [self.editor.state()]
+        self.editor.paint('climate', [1, 2], 3)
+        states.append(self.editor.state())
+        self.editor.paint('vegetation', [2, 5, 6], 1)
+        states.append(self.editor.state())
+        self.assertEqual(len(self.journal), 5)
+
+        self.editor.undo()
+        self.assertEqual(self.editor.state(), states[1])
+        self.assertEqual((len(self.journal), self.journal.redo_count), (2, 3))
+        self.editor.undo()
+        self.assertEqual(self.editor.state(), states[0])
+        self.assertEqual(self.journal.undo(), [])
+
+        self.editor.redo()
+        self.editor.redo()
+        self.assertEqual(self.editor.state(), states[2])
+        self.assertEqual(self.journal.redo(), [])
+
+    def test_transaction_across_layers_with_repeated_locations(self):
+        # A stroke that paints a location twice and touches two layers is undone as one step
+        self.editor.paint('climate', [4], 7)
+        before = self.editor.state()
+        self.journal.begin_transaction()
+        for layer_name, location, code in (('climate', 4, 1), ('vegetation', 4, 2), ('climate', 4, 9)):
+            old_code = self.editor.codes[layer_name][location]
+            self.editor.codes[layer_name][location] = code
+            self.journal.append(layer_name, [location], [old_code], [code])
+        self.journal.end_transaction()
+        after = self.editor.state()
+
+        self.editor.undo()
+        self.assertEqual(self.editor.state(), before)
+        self.editor.redo()
+        self.assertEqual(self.editor.state(), after)
+
+    def test_append_drops_redo(self):
+        self.editor.paint('climate', [1], 3)
+        self.editor.paint('climate', [2], 4)
+        self.editor.undo()
+        self.assertEqual(self.journal.redo_count, 1)
+        self.editor.paint('vegetation', [3], 5)
+        self.assertEqual(self.journal.redo_count, 0)
+        self.assertFalse(self.journal.redo())
+
+    def test_transaction_labels(self):
+        # Runs of equal labels become one transaction each
+        self.journal.append('climate', [1, 2, 3, 4], [0, 0, 0, 0], [1, 1, 2, 2], transaction_ids=[5, 5, 8, 8])
+        self.assertEqual(self.journal.undo()[0][1].tolist(), [4, 3])
+        self.assertEqual(self.journal.undo()[0][1].tolist(), [2, 1])
+        self.assertEqual(self.journal.undo(), [])
+
+    def test_growth(self):
+        location_ids = np.arange(INITIAL_CAPACITY * 3) % LOCATIONS
+        self.journal.record('climate', location_ids, np.zeros(len(location_ids)), np.ones(len(location_ids)))
+        self.editor.paint('climate', [0], 2)
+        self.assertEqual(len(self.journal), INITIAL_CAPACITY * 3 + 1)
+        self.editor.undo()
+        changes = self.journal.undo()
+        self.assertEqual(len(changes[0][1]), INITIAL_CAPACITY * 3)
+        self.assertTrue(np.array_equal(changes[0][1], location_ids[::-1]))
+
+    def test_on_change_and_touched_layers(self):
+        calls = []
+        self.journal.on_change = lambda op, payload: calls.append(op)
+        self.editor.paint('climate', [1], 3)
+        self.editor.undo()
+        self.editor.redo()
+        self.assertEqual(calls, ['append', 'undo', 'redo'])
+        self.assertEqual(self.journal.take_touched_layers(), {'climate'})
+        self.assertEqual(self.journal.take_touched_layers(), set())
+        self.assertTrue(self.journal.has_layer('climate'))
+        self.assertFalse(self.journal.has_layer('vegetation'))
+
+    def test_restore(self):
+        self.editor.paint('climate', [1, 2], 3)
+        self.editor.paint('vegetation', [2], 1)
+        self.editor.paint('climate', [1], 5)
+        self.editor.undo()
+        rows = slice(0, self.journal.end)
+        columns = {name: column[rows].copy() for name, column in self.journal.columns.items()}
+        cursor = self.journal.cursor
+
+        restored = Editor()
+        restored.codes = {name: codes.copy() for name, codes in self.editor.codes.items()}
+        restored.journal.restore([LAYERS[layer_id] for layer_id in columns['layer'].tolist()], columns['location'],
+                                 columns['old_code'], columns['new_code'], columns['transaction'] + 40, cursor)
+        self.assertEqual((len(restored.journal), restored.journal.redo_count), (3, 1))
+        self.assertEqual(restored.journal.next_transaction_id, 3)
+
+        for editor in (self.editor, restored):
+            editor.redo()
+        self.assertEqual(restored.state(), self.editor.state())
+        for _ in range(3):
+            for editor in (self.editor, restored):
+                editor.undo()
+            self.assertEqual(restored.state(), self.editor.state())
+        self.assertEqual(restored.state(), Editor().state())
+
+
+if __name__ == '__main__':
+    unittest.main()
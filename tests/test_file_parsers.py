@@ -0,0 +1,56 @@
+"""
+Tests for parsing the state region files.
+
+Run from the repository root with `python -m unittest discover tests`.
+"""
+import os
+import sys
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import file_parsers
+from file_parsers import parse_states
+
+
+def state_file(index: int) -> str:
+    provinces = ' '.join(f'"x{index:02X}{row:04X}"' for row in range(3))
+    return (f'STATE_REGION_{index} = {{\n'
+            f'    # provinces of region {index}\n'
+            f'    provinces = {{ {provinces} }}\n'
+            f'    arable_land = 12\n'
+            f'}}\n')
+
+
+class ParseStatesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        for index in range(6):
+            with open(os.path.join(self.directory.name, f'{index:02}_states.txt'), 'w', encoding='utf-8') as f:
+                f.write(state_file(index))
+
+    def assertStates(self, locations):
+        self.assertEqual(len(locations), 18)
+        self.assertEqual(locations['050002']['name'], 'REGION_5')
+        self.assertEqual(sorted(locations.keys())[:2], ['000000', '000001'])
+
+    def test_small_folder_is_parsed_in_process(self):
+        with mock.patch.object(file_parsers, 'ProcessPoolExecutor') as pool:
+            self.assertStates(parse_states(self.directory.name))
+        pool.assert_not_called()
+
+    def test_large_folder_is_parsed_on_spawned_workers(self):
+        with mock.patch.object(file_parsers, 'PARALLEL_MIN_BYTES', 0), \
+                mock.patch.object(file_parsers, 'ProcessPoolExecutor', wraps=ProcessPoolExecutor) as pool:
+            self.assertStates(parse_states(self.directory.name, max_workers=2))
+        self.assertEqual(pool.call_args.kwargs['max_workers'], 2)
+        self.assertEqual(pool.call_args.kwargs['mp_context'].get_start_method(), 'spawn')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+"""
+Regression tests for the Paradox script tokenizer.
+
+Run from the repository root with `python -m unittest discover tests`.
+"""
+import io
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from paradox_script import ParadoxScriptParser, ParadoxScriptError, tokenize
+
+# Parsing any of the inputs below takes milliseconds; backtracking took seconds
+TIME_LIMIT = 1.0
+
+SAMPLE = ('STATE_A = {\n'
+          '    # provinces of the state = { x000000 }\n'
+          '    provinces = { "x00004B" "x000090" }\n'
+          '        \n\n'
+          '    name = "with \\" quote { brace" # trailing comment\n'
+          '    color = rgb { 255 0 0 }\n'
+          '}\n'
+          'x123456 = plains\n')
+
+EXPECTED = {
+    'STATE_A': {'provinces': ['x00004B', 'x000090'], 'name': 'with " quote { brace', 'color': ['255', '0', '0']},
+    'x123456': 'plains'
+}
+
+
+def parse(text: str, chunk_size: int = 1 << 16) -> dict:
+    return ParadoxScriptParser(tokenize(io.StringIO(text), chunk_size)).parse()
+
+
+class TokenizerTest(unittest.TestCase):
+
+    def assertFast(self, text: str):
+        start = time.perf_counter()
+        result = parse(text)
+        self.assertLess(time.perf_counter() - start, TIME_LIMIT)
+        return result
+
+    def test_sample(self):
+        self.assertEqual(parse(SAMPLE), EXPECTED)
+
+    def test_trailing_whitespace(self):
+        self.assertEqual(self.assertFast('a = b' + ' ' * 64), {'a': 'b'})
+        self.assertEqual(self.assertFast(SAMPLE + '\n' * 64), EXPECTED)
+        self.assertEqual(self.assertFast(SAMPLE + '\t \n' * 5000), EXPECTED)
+
+    def test_trailing_comments(self):
+        self.assertEqual(self.assertFast('a = b # c d = e' + ' ' * 64), {'a': 'b'})
+        self.assertEqual(self.assertFast(SAMPLE + '# one\n  # two = { \n' * 32 + ' ' * 64), EXPECTED)
+
+    def test_comment_is_not_a_word(self):
+        with self.assertRaises(ParadoxScriptError):
+            parse('a = # b\n')
+
+    def test_chunk_boundaries(self):
+        # Every split point: inside words, strings, comments and indentation runs
+        text = SAMPLE.replace('    ', ' ' * 40)
+        for chunk_size in range(1, 64):
+            self.assertEqual(parse(text, chunk_size), EXPECTED, f"chunk size {chunk_size}")
+
+    def test_long_whitespace_across_chunks(self):
+        text = 'a = b' + ' ' * 200000 + 'c = d' + '\n' * 200000
+        self.assertEqual(self.assertFast(text), {'a': 'b', 'c': 'd'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+"""
+Tests for the binary project format and the JSON projects it replaces.
+
+Run from the repository root with `python -m unittest discover tests`.
+"""
+import contextlib
+import io
+import json
+import os
+import struct
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from project_format import (NO_KEY, PREAMBLE, PROJECT_FILE, PROJECT_MAGIC, PROJECT_VERSION, ProjectChanges,
+                            convert_json_project, load_project, write_project)
+
+CHANGES = [
+    {'map_type': 'climate', 'location_HEX': '00004B', 'old_feature': 'Af', 'new_feature': 'ET', 'transaction': 0},
+    {'map_type': 'climate', 'location_HEX': 'a0c0ff', 'old_feature': '', 'new_feature': 'ET', 'transaction': 0},
+    {'map_type': 'vegetation', 'location_HEX': '00004B', 'old_feature': 'Woods', 'new_feature': '',
+     'transaction': 1},
+    {'map_type': 'climate', 'location_HEX': '00004B', 'old_feature': 'ET', 'new_feature': 'BWh', 'transaction': 2}
+]
+
+
+def normalized(changes: list) -> list:
+    """Change dicts as to_change_dicts writes them: upper case HEX colors."""
+    return [dict(change, location_HEX=change['location_HEX'].upper()) for change in changes]
+
+
+class ProjectFormatTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory.name, name)
+
+    def write(self, changes: list = CHANGES) -> str:
+        write_project(self.path(PROJECT_FILE), ProjectChanges.from_change_dicts(changes), 'vegetation',
+                      ['climate', 'vegetation'])
+        return self.path(PROJECT_FILE)
+
+    def test_round_trip(self):
+        project = load_project(self.write())
+        self.assertEqual(project.current_map_type, 'vegetation')
+        self.assertEqual(project.loaded_maps, ['climate', 'vegetation'])
+        self.assertEqual(project.change_counts, {'climate': 3, 'vegetation': 1})
+        self.assertEqual(project.change_count, 4)
+        self.assertIsNone(project._changes)  # Only the header is read when opening
+        self.assertIsInstance(project.changes.columns['hex'], np.memmap)
+        self.assertEqual(project.changes.to_change_dicts(), normalized(CHANGES))
+        self.assertEqual(os.path.getsize(self.path(PROJECT_FILE)) % 8, 0)
+
+    def test_empty_project(self):
+        project = load_project(self.write([]))
+        self.assertEqual(project.change_counts, {})
+        self.assertEqual(len(project.changes), 0)
+        self.assertEqual(project.changes.to_change_dicts(), [])
+
+    def test_filter_layers(self):
+        project = load_project(self.write())
+        project.filter_layers(['vegetation'])
+        self.assertEqual(project.change_counts, {'vegetation': 1})
+        self.assertEqual(project.loaded_maps, ['vegetation'])
+        self.assertEqual([change['map_type'] for change in project.changes.to_change_dicts()], ['vegetation'])
+
+    def test_json_project_and_conversion(self):
+        with open(self.path('project_state.json'), 'w', encoding='utf-8') as f:
+            json.dump({'current_map_type': 'climate', 'loaded_maps': ['climate', 'vegetation'], 'undo_stack': CHANGES},
+                      f)
+        project = load_project(self.path('project_state.json'))
+        self.assertEqual(project.change_counts, {'climate': 3, 'vegetation': 1})
+        self.assertEqual(project.changes.to_change_dicts(), normalized(CHANGES))
+
+        binary_path = convert_json_project(self.path('project_state.json'))
+        self.assertEqual(binary_path, self.path(PROJECT_FILE))
+        converted = load_project(binary_path)
+        self.assertEqual(converted.current_map_type, 'climate')
+        self.assertEqual(converted.changes.to_change_dicts(), normalized(CHANGES))
+
+    def test_json_changes_without_transactions(self):
+        changes = [{key: value for key, value in change.items() if key != 'transaction'} for change in CHANGES]
+        self.assertEqual(ProjectChanges.from_change_dicts(changes).columns['transaction'].tolist(), [0, 1, 2, 3])
+
+    def test_malformed_hex_is_dropped(self):
+        changes = CHANGES[:2] + [dict(CHANGES[0], location_HEX='GG004B'), dict(CHANGES[0], location_HEX='4B'),
+                                 dict(CHANGES[0], location_HEX='#00004B')] + CHANGES[2:]
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            project_changes = ProjectChanges.from_change_dicts(changes)
+        self.assertIn("Dropping 3 changes", output.getvalue())
+        self.assertIn("'GG004B'", output.getvalue())
+        self.assertEqual(project_changes.to_change_dicts(), normalized(CHANGES))
+        self.assertEqual(project_changes.counts_by_layer(), {'climate': 3, 'vegetation': 1})
+
+    def test_truncated_file(self):
+        with open(self.write(), 'rb') as f:
+            data = f.read()
+        header_end = PREAMBLE.size + PREAMBLE.unpack(data[:PREAMBLE.size])[2]
+        for length in (0, 3, PREAMBLE.size - 1, PREAMBLE.size + 5, header_end - 1, header_end + 3, len(data) - 1):
+            with open(self.path('truncated.e5p'), 'wb') as f:
+                f.write(data[:length])
+            with self.assertRaises(ValueError, msg=f"cut at {length} bytes"):
+                load_project(self.path('truncated.e5p')).changes
+
+    def test_corrupt_header(self):
+        with open(self.write(), 'rb') as f:
+            data = f.read()
+        _, _, header_length = PREAMBLE.unpack(data[:PREAMBLE.size])
+        header = data[PREAMBLE.size:PREAMBLE.size + header_length]
+        arrays = data[PREAMBLE.size + header_length:]
+
+        def replaced(new_header: bytes, version: int = PROJECT_VERSION) -> bytes:
+            return PREAMBLE.pack(PROJECT_MAGIC, version, len(new_header)) + new_header + arrays
+
+        parsed = json.loads(header)
+        without_keys = json.dumps({key: value for key, value in parsed.items() if key != 'keys'}).encode()
+        sections_past_end = json.dumps(dict(parsed, sections=dict(parsed['sections'], hex={
+            'offset': len(data), 'count': 4}))).encode()
+        cases = {
+            'garbled JSON': replaced(header.replace(b'"', b"'", 3)),
+            'bad UTF-8': replaced(b'\xff' + header[1:]),
+            'not an object': replaced(b'[1, 2, 3]'.ljust(header_length)),
+            'missing field': replaced(without_keys),
+            'section past the end': replaced(sections_past_end),
+            'newer version': replaced(header, PROJECT_VERSION + 1),
+            'wrong magic': b'E5MX' + data[4:],
+        }
+        for name, corrupt in cases.items():
+            with open(self.path('corrupt.e5p'), 'wb') as f:
+                f.write(corrupt)
+            with self.assertRaises(ValueError, msg=name):
+                load_project(self.path('corrupt.e5p'))
+
+    def test_net_changes(self):
+        changes = ProjectChanges.from_change_dicts(CHANGES)
+        # Location 10 (00004B) is changed twice in climate; its last new key wins
+        targets = np.array([10, 20, 10, 10])
+        unique_targets, key_codes = changes.net_changes('climate', targets)
+        self.assertEqual(unique_targets.tolist(), [10, 20])
+        self.assertEqual([changes.keys['climate'][code] for code in key_codes.tolist()], ['BWh', 'ET'])
+
+        # A removed value keeps NO_KEY; negative targets and other map types are skipped
+        unique_targets, key_codes = changes.net_changes('vegetation', targets)
+        self.assertEqual((unique_targets.tolist(), key_codes.tolist()), ([10], [NO_KEY]))
+        unique_targets, _ = changes.net_changes('climate', np.array([10, -1, 10, -1]))
+        self.assertEqual(unique_targets.tolist(), [10])
+        self.assertEqual(len(changes.net_changes('topography', targets)[0]), 0)
+
+    def test_concatenate(self):
+        first = ProjectChanges.from_change_dicts(CHANGES[:2])
+        second = ProjectChanges.from_change_dicts(CHANGES[2:])
+        joined = ProjectChanges.concatenate([first, ProjectChanges.from_change_dicts([]), second])
+        self.assertEqual([{key: value for key, value in change.items() if key != 'transaction'}
+                          for change in joined.to_change_dicts()],
+                         [{key: value for key, value in change.items() if key != 'transaction'}
+                          for change in normalized(CHANGES)])
+        # The parts' transactions stay apart
+        self.assertEqual(joined.columns['transaction'].tolist(), [0, 0, 1, 2])
+
+    def test_preamble_layout(self):
+        with open(self.write(), 'rb') as f:
+            magic, version, header_length = struct.unpack('<4sII', f.read(12))
+        self.assertEqual((magic, version), (PROJECT_MAGIC, PROJECT_VERSION))
+        self.assertGreater(header_length, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
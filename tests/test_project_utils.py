@@ -0,0 +1,150 @@
+"""
+Tests for applying imported projects to the map editor.
+
+Run from the repository root with `python -m unittest discover tests`.
+"""
+import contextlib
+import io
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from edit_journal import EditJournal
+from feature_layers import FeatureLayer, NO_CODE
+from location_index import build_location_index
+from location_table import LocationTable
+from project_format import ProjectChanges
+from project_utils import apply_imported_changes, apply_project_changes
+
+LABELS = {
+    'climate': {'Af': {'color': 'FF0000'}, 'BWh': {'color': '00FF00'}, 'ET': {'color': '0000FF'}},
+    'vegetation': {'Woods': {'color': '008000'}, 'Desert': {'color': 'C0C000'}}
+}
+
+
+def locations_image() -> np.ndarray:
+    """A 4x4 image of eight locations, two pixels each."""
+    colors = np.array([[(10 * i, 20, 30) for i in range(8)]], dtype=np.uint8)
+    return np.repeat(colors, 2, axis=1).reshape(4, 4, 3)
+
+
+class Editor:
+    """The parts of the map editor that applying a project reads and updates."""
+
+    def __init__(self):
+        self.location_index = build_location_index(locations_image())
+        self.hexes = self.location_index.id_to_hex
+        # The last location on the map isn't in any state; the table has a state location that isn't on the map
+        self.locations = LocationTable.from_dict({hex_code: 'REGION' for hex_code in self.hexes[:7] + ['ABCDEF']})
+        self.feature_layers = {name: FeatureLayer(name, labels, len(self.hexes)) for name, labels in LABELS.items()}
+        self.feature_layers['climate'].codes[:] = self.feature_layers['climate'].code_for_key('Af')
+        self.journal = EditJournal(list(self.feature_layers))
+        self.current_map_type = 'climate'
+        self.display_array = np.zeros(self.location_index.label_raster.shape, dtype=np.uint32)
+        self.refresh_count = 0
+
+    def _reset_hover_info(self):
+        pass
+
+    def _refresh_display(self):
+        self.refresh_count += 1
+
+    def update_undo_counter(self):
+        pass
+
+    def undo_last_fill(self):
+        for map_type, location_ids, codes in self.journal.undo():
+            self.feature_layers[map_type].codes[location_ids] = codes
+
+    def redo_last_fill(self):
+        for map_type, location_ids, codes in self.journal.redo():
+            self.feature_layers[map_type].codes[location_ids] = codes
+
+    def keys(self, map_type: str) -> list:
+        layer = self.feature_layers[map_type]
+        return [layer.key_for_code(code) for code in layer.codes.tolist()]
+
+
+class ApplyProjectChangesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.editor = Editor()
+        hexes = self.editor.hexes
+        self.changes = [
+            {'map_type': 'climate', 'location_HEX': hexes[0], 'old_feature': 'Af', 'new_feature': 'ET'},
+            {'map_type': 'vegetation', 'location_HEX': hexes[2], 'old_feature': '', 'new_feature': 'Desert'},
+            {'map_type': 'climate', 'location_HEX': hexes[1], 'old_feature': 'Af', 'new_feature': 'ET'},
+            {'map_type': 'climate', 'location_HEX': hexes[0], 'old_feature': 'ET', 'new_feature': 'BWh'},
+            {'map_type': 'climate', 'location_HEX': hexes[3], 'old_feature': 'Af', 'new_feature': ''},
+            # Unchanged in the end, not on the map, not in a state, and a map that isn't loaded
+            {'map_type': 'climate', 'location_HEX': hexes[4], 'old_feature': 'Af', 'new_feature': 'Af'},
+            {'map_type': 'climate', 'location_HEX': 'ABCDEF', 'old_feature': 'Af', 'new_feature': 'ET'},
+            {'map_type': 'climate', 'location_HEX': hexes[7], 'old_feature': 'Af', 'new_feature': 'ET'},
+            {'map_type': 'topography', 'location_HEX': hexes[5], 'old_feature': '', 'new_feature': 'hills'},
+        ]
+
+    def apply(self, changes: list) -> tuple:
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            applied = apply_project_changes(self.editor, ProjectChanges.from_change_dicts(changes))
+        return applied, output.getvalue()
+
+    def test_net_effect(self):
+        locations = self.editor.locations
+        untouched = {hex_code: locations[hex_code]['climate'] for hex_code in (self.editor.hexes[2], 'ABCDEF')}
+        applied, output = self.apply(self.changes)
+        self.assertEqual(applied, 4)
+        self.assertIn("map type 'topography'", output)
+        self.assertEqual(self.editor.keys('climate'), ['BWh', 'ET', 'Af', None, 'Af', 'Af', 'Af', 'Af'])
+        self.assertEqual(self.editor.keys('vegetation'), [None, None, 'Desert', None, None, None, None, None])
+
+        # The location data follows the layers; a removed value is an empty value
+        self.assertEqual([locations[self.editor.hexes[location_id]]['climate'] for location_id in (0, 1, 3)],
+                         ['BWh', 'ET', ''])
+        self.assertEqual(locations[self.editor.hexes[2]]['vegetation'], 'Desert')
+        self.assertEqual({hex_code: locations[hex_code]['climate'] for hex_code in untouched}, untouched)
+
+    def test_one_transaction(self):
+        before = {name: layer.codes.copy() for name, layer in self.editor.feature_layers.items()}
+        self.apply(self.changes)
+        after = {name: layer.codes.copy() for name, layer in self.editor.feature_layers.items()}
+        self.assertEqual(len(self.editor.journal), 4)
+
+        self.editor.undo_last_fill()
+        self.assertEqual(len(self.editor.journal), 0)
+        for name, codes in before.items():
+            self.assertTrue(np.array_equal(self.editor.feature_layers[name].codes, codes), name)
+        self.editor.redo_last_fill()
+        for name, codes in after.items():
+            self.assertTrue(np.array_equal(self.editor.feature_layers[name].codes, codes), name)
+
+    def test_display_is_rendered_once(self):
+        self.apply(self.changes)
+        self.assertEqual(self.editor.refresh_count, 1)
+        layer = self.editor.feature_layers['climate']
+        expected = layer.palette[layer.codes][self.editor.location_index.label_raster]
+        self.assertTrue(np.array_equal(self.editor.display_array, expected))
+
+        # Changes of a layer that isn't on display don't render it
+        self.apply([{'map_type': 'vegetation', 'location_HEX': self.editor.hexes[0], 'new_feature': 'Woods'}])
+        self.assertEqual(self.editor.refresh_count, 1)
+
+    def test_changes_that_change_nothing(self):
+        self.apply(self.changes)
+        applied, _ = self.apply(self.changes)
+        self.assertEqual(applied, 0)
+        self.assertEqual(len(self.editor.journal), 4)
+        self.assertEqual(self.apply([])[0], 0)
+
+    def test_change_dicts(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(apply_imported_changes(self.editor, self.changes), 4)
+        self.assertEqual(self.editor.feature_layers['climate'].codes[3], NO_CODE)
+
+
+if __name__ == '__main__':
+    unittest.main()